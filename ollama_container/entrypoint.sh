@@ -1,5 +1,24 @@
 #!/bin/bash
+MODEL=${OLLAMA_MODEL:-Benthiq:3b}
+READY_FILE=${READY_FILE:-/tmp/ollama-ready}
+rm -f "$READY_FILE"
+
 ollama serve &
-sleep 5 
+SERVER_PID=$!
+
+# poll until the api answers instead of sleeping a fixed time
+until ollama list > /dev/null 2>&1; do
+    sleep 1
+done
 # ollama create BenthiQ:3b -f ./Modelfile
-wait
\ No newline at end of file
+
+# load the model now and never unload it, so no request pays for loading it;
+# the cli parses keepalive as a Go duration, which needs a unit, and any
+# negative duration keeps the model loaded
+if ollama run "$MODEL" "" --keepalive -1m < /dev/null > /dev/null; then
+    touch "$READY_FILE"
+    echo "$MODEL loaded, ollama is ready"
+else
+    echo "could not load $MODEL"
+fi
+wait $SERVER_PID
\ No newline at end of file
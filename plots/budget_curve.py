@@ -0,0 +1,35 @@
+"""
+budget_curve.py
+
+Plots median latency against F1 for every vision-token budget in the
+results of budget_sweep.py, labelling each point with its budget.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import sys
+
+import pandas as pd
+import matplotlib.pyplot as plt
+
+RESULTS = sys.argv[1] if len(sys.argv) > 1 else "../data/budget_sweep/budget_sweep.csv"
+
+df = pd.read_csv(RESULTS).sort_values("vision_tokens")
+df['budget'] = df['image_tokens'].map(lambda t: "full" if pd.isna(t) else str(int(t)))
+
+plt.figure(figsize=(8, 6))
+plt.plot(df["latency_p50_s"], df["f1"], marker="o", color="steelblue")
+for _, row in df.iterrows():
+    label = row['budget'] if pd.isna(row['vision_tokens']) else f"{row['budget']} ({row['vision_tokens']:.0f} tok)"
+    plt.annotate(label, (row['latency_p50_s'], row['f1']),
+                 fontsize=7, xytext=(4, 4), textcoords="offset points")
+
+plt.xlabel("Median latency (s)", fontsize=12, fontweight="bold")
+plt.ylabel("F1 Score", fontsize=12, fontweight="bold")
+plt.title("Latency against F1\nper vision-token budget", fontsize=15, fontweight="bold")
+
+plt.tight_layout()
+plt.savefig("budget_curve.png", dpi=300)
+
+print(df[['budget', 'vision_tokens', 'prompt_eval_count', 'latency_p50_s', 'f1']].to_string(index=False))
@@ -7,16 +7,23 @@ Author: Aidan Murray
 Date: 2025-09-26
 """
 
+import sys
+from pathlib import Path
 import pandas as pd
 import ast
 import matplotlib.pyplot as plt
 from collections import Counter
 
+sys.path.append(str(Path(__file__).resolve().parents[1] / "prompt_test_container" / "app"))
+from label_store import LabelStore
+
+TEST_PATH = "../../data/ecoregions/test.csv"
+
 # --- Validation labels ---
-df = pd.read_csv("../../data/ecoregions/test.csv")
+df = pd.read_csv(TEST_PATH, usecols=["point.media.id"])
 df = df.sample(n=1000, random_state=42)
-df["parsed"] = df["label.name"].apply(ast.literal_eval)
-val_values = [val for tup in df["parsed"] for val in tup]
+test_labels = LabelStore.load(TEST_PATH)
+val_values = [val for media_id in df["point.media.id"] for val in test_labels.labels(media_id)]
 val_counts = Counter(val_values)
 val_counts = dict(sorted(val_counts.items(), key=lambda x: x[1], reverse=True))
 
@@ -8,11 +8,14 @@ Author: Aidan Murray
 Date: 2025-09-26
 """
 
+import sys
 from pathlib import Path
 import pandas as pd
 from ast import literal_eval
-from sklearn.preprocessing import MultiLabelBinarizer
-from sklearn.metrics import classification_report, precision_recall_fscore_support
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "prompt_test_container" / "app"))
+from label_store import LabelStore
+from metrics import label_vocabulary, binarize, per_class, summary
 
 DATA_FOLDER = Path("../../data")
 TEST_PATH = DATA_FOLDER / "ecoregions" / "test.csv"
@@ -25,38 +28,29 @@ with open(PRED_PATH) as f:
 df = pd.read_csv(EVALS).set_index("ID")
 df['y_pred'] = y_pred
 
-df_test = pd.read_csv(TEST_PATH).sample(n=1200, random_state=42).set_index("point.media.id")
-df = df.join(df_test[['label.name']], how="inner")
-df['y_true'] = df['label.name'].apply(literal_eval)
-df = df.drop(columns=['label.name'])
-
-mlb = MultiLabelBinarizer()
-mlb.fit(df["y_true"].tolist() + df["y_pred"].tolist())
+df_test = pd.read_csv(TEST_PATH, usecols=["point.media.id"]).sample(n=1200, random_state=42)
+df = df[df.index.isin(df_test["point.media.id"])]
+test_labels = LabelStore.load(TEST_PATH)
+df['y_true'] = [list(test_labels.labels(media_id)) for media_id in df.index]
 
-y_true_bin = mlb.transform(df["y_true"])
-y_pred_bin = mlb.transform(df["y_pred"])
+classes = label_vocabulary(df["y_true"], df["y_pred"])
+y_true_bin = binarize(df["y_true"].tolist(), classes)
+y_pred_bin = binarize(df["y_pred"].tolist(), classes)
 
-print(classification_report(
-    y_true_bin,
-    y_pred_bin,
-    target_names=mlb.classes_,
-    zero_division=0
-))
-
-precision, recall, f1, support = precision_recall_fscore_support(
-    y_true_bin,
-    y_pred_bin,
-    average=None
-)
+precision, recall, f1, support = per_class(y_true_bin, y_pred_bin)
 
 per_class_df = pd.DataFrame({
-    "Label": mlb.classes_,
+    "Label": classes,
     "Precision": precision,
     "Recall": recall,
     "F1-Score": f1,
     "Support": support
 })
 
+print(per_class_df.to_string(index=False, float_format="%.2f"))
+for name, value in summary(y_true_bin, y_pred_bin).items():
+    print(f"{name}: {value:.3f}")
+
 print(per_class_df.sort_values("Support", ascending=False).head())
 
 per_class_df.to_csv("per_class_f1.csv")
\ No newline at end of file
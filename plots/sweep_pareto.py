@@ -0,0 +1,39 @@
+"""
+sweep_pareto.py
+
+Plots F1 against images per second for every ollama configuration in
+the results of sweep.py, highlighting the Pareto front.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import sys
+
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+RESULTS = sys.argv[1] if len(sys.argv) > 1 else "../data/sweep/sweep_results.csv"
+
+df = pd.read_csv(RESULTS)
+df['config'] = df['model'].str.split(":").str[-1] + "-par" + df['parallel'].astype(str)
+front = df[df['pareto']].sort_values("images_per_s")
+
+plt.figure(figsize=(8, 6))
+sns.scatterplot(data=df, x="images_per_s", y="f1", hue="base", style="parallel", s=80)
+plt.plot(front["images_per_s"], front["f1"], color="grey", linestyle="--", label="Pareto front")
+for _, row in front.iterrows():
+    plt.annotate(row['config'], (row['images_per_s'], row['f1']), fontsize=7,
+                 xytext=(4, 4), textcoords="offset points")
+
+plt.xlabel("Images per second", fontsize=12, fontweight="bold")
+plt.ylabel("F1 Score", fontsize=12, fontweight="bold")
+plt.title("Throughput against F1\nper ollama configuration", fontsize=15, fontweight="bold")
+plt.legend(loc="lower left", fontsize=8)
+
+plt.tight_layout()
+plt.savefig("sweep_pareto.png", dpi=300)
+
+front.to_csv("sweep_pareto.csv", index=False)
+print(front[['config', 'base', 'images_per_s', 'f1', 'peak_rss_gb']].to_string(index=False))
@@ -3,28 +3,324 @@ csv_combine.py
 
 Combines all csv files from squidle+ to one dataset.
 
+The exports are combined into a partitioned Parquet dataset, one
+partition per export (export=annotations_<id>/part-0.parquet), that
+pandas reads directly with pd.read_parquet("../combined", columns=[...]).
+Each export is read in chunks of --chunksize rows, twice: once to infer
+its column types and once to write them, so memory stays bounded by the
+chunk size whatever the number or size of the exports.
+
+The columns of all exports are unified into one schema, which every
+partition is written with (columns an export lacks are null):
+
+- integer columns, and float columns holding only whole numbers (ids
+  with missing values), get the smallest integer type covering their range,
+- other floats keep float64, so coordinates keep their precision,
+- repeated strings such as label.name and campaign names are
+  dictionary-encoded (read back as pandas categoricals).
+
+_manifest.json records the sha256 of every export processed and the
+unified column types, so a rerun only processes new or changed exports
+and drops the partitions of exports that are gone. When an export widens
+the schema (a new column, a larger range), the partitions already
+written are cast to it batch by batch, without re-reading their csv.
+
+Usage: python csv_combine.py --input ../datasets --output ../combined [--csv ../combined.csv]
+
 Author: Aidan Murray
 Date: 2025-09-26
 """
 
+import argparse
+import hashlib
+import json
 import os
+import shutil
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+INPUT_PATH = Path("../datasets")
+OUTPUT_PATH = Path("../combined")
+CHUNKSIZE = 100_000
+# strings are dictionary-encoded while at most this many distinct values
+# make up at most half of an export's rows
+MAX_DICTIONARY = 2 ** 15
+INT_TYPES = (pa.int8(), pa.int16(), pa.int32(), pa.int64())
+
+
+def file_sha256(path, block_size=1024 ** 2):
+    "Hashes a file block by block"
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def column_kind(series):
+    "Returns the kind of a chunk's column, and its min and max for integers; None if it is all missing"
+
+    values = series.dropna()
+    if values.empty:
+        return None, None, None
+    if pd.api.types.is_bool_dtype(values):
+        return "bool", None, None
+    if pd.api.types.is_integer_dtype(values):
+        return "int", int(values.min()), int(values.max())
+    if pd.api.types.is_float_dtype(values):
+        if np.isfinite(values).all() and (values == np.floor(values)).all() \
+                and values.abs().max() < 2 ** 63:
+            return "int", int(values.min()), int(values.max())
+        return "float", None, None
+    # True/False columns with missing values are read as objects
+    if values.map(lambda v: isinstance(v, (bool, np.bool_))).all():
+        return "bool", None, None
+    return "string", None, None
+
+
+def merge_kind(a, b):
+    "The narrowest kind holding values of both kinds"
+
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    if {a, b} == {"int", "float"}:
+        return "float"
+    return "string"
+
+
+def merge_column(column, kind, low=None, high=None, dictionary=None):
+    "Widens a column's entry in the schema by what an export holds"
+
+    column['kind'] = merge_kind(column.get('kind'), kind)
+    if low is not None:
+        column['min'] = low if column.get('min') is None else min(column['min'], low)
+        column['max'] = high if column.get('max') is None else max(column['max'], high)
+    if dictionary is not None:
+        column['dictionary'] = column.get('dictionary', True) and dictionary
+    return column
+
+
+def infer_columns(path, chunksize=CHUNKSIZE):
+    "Reads an export chunk by chunk and returns its column types, as in the manifest"
+
+    columns = {}
+    uniques = {}
+    rows = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, low_memory=False):
+        rows += len(chunk)
+        for name in chunk.columns:
+            kind, low, high = column_kind(chunk[name])
+            merge_column(columns.setdefault(name, {'kind': None}), kind, low, high)
+            if kind == "string" and len(uniques.setdefault(name, set())) <= MAX_DICTIONARY:
+                uniques[name].update(chunk[name].dropna().astype(str).unique())
+    for name, column in columns.items():
+        if column['kind'] == "string":
+            n = len(uniques.get(name, ()))
+            column['dictionary'] = n <= MAX_DICTIONARY and n <= rows / 2
+        elif column['kind'] != "int":
+            column.pop('min', None)
+            column.pop('max', None)
+    return columns, rows
+
+
+def arrow_type(column):
+    kind = column['kind']
+    if kind == "bool":
+        return pa.bool_()
+    if kind == "int":
+        for int_type in INT_TYPES:
+            info = np.iinfo(int_type.to_pandas_dtype())
+            if info.min <= column['min'] and column['max'] <= info.max:
+                return int_type
+    if kind in ("int", "float"):
+        return pa.float64()
+    if column.get('dictionary'):
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+
+def arrow_schema(columns):
+    return pa.schema([pa.field(name, arrow_type(column)) for name, column in columns.items()])
+
+
+def to_table(chunk, schema, columns):
+    "Converts a chunk of an export to a table of the unified schema"
+
+    data = {}
+    for field in schema:
+        name = field.name
+        if name not in chunk:
+            data[name] = pa.nulls(len(chunk), field.type)
+            continue
+        series = chunk[name]
+        if columns[name]['kind'] in ("string", None):
+            series = series.where(series.isna(), series.astype(str)).astype(object)
+        elif columns[name]['kind'] == "bool":
+            series = series.astype(object)
+        data[name] = pa.array(series, type=field.type, from_pandas=True)
+    return pa.table(data, schema=schema)
+
+
+def write_atomic(path, write):
+    "Writes a file through a temporary name, so an interrupted run never leaves a partial file"
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # hidden, so a partial file left by a crash is never read as part of the dataset
+    tmp = path.with_name(f".{path.name}.tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def write_partition(csv_path, path, schema, columns, chunksize=CHUNKSIZE):
+    "Streams an export into one partition, a row group per chunk"
+
+    # string columns are read as text, so a column is parsed the same way in every chunk
+    dtype = {name: str for name, column in columns.items() if column['kind'] in ("string", None)}
+
+    def write(tmp):
+        with pq.ParquetWriter(tmp, schema) as writer:
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=dtype, low_memory=False):
+                writer.write_table(to_table(chunk, schema, columns))
+
+    write_atomic(path, write)
+
+
+def cast_array(array, to_type):
+    """
+    Casts a column written in a narrower schema to its wider type. Arrow
+    cannot cast to a dictionary directly, so those are cast to strings and
+    encoded; booleans become the 'True' / 'False' pandas reads from the csv.
+    """
+
+    value_type = to_type.value_type if pa.types.is_dictionary(to_type) else to_type
+    if pa.types.is_boolean(array.type) and pa.types.is_string(value_type):
+        array = pc.if_else(array, "True", "False")
+    elif pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    array = array.cast(value_type)
+    if pa.types.is_dictionary(to_type):
+        array = array.dictionary_encode().cast(to_type)
+    return array
+
+
+def cast_partition(path, schema):
+    "Rewrites a partition in a wider schema, one row group at a time"
+
+    source = pq.ParquetFile(path)
+    if source.schema_arrow.equals(schema):
+        return False
+
+    def write(tmp):
+        with pq.ParquetWriter(tmp, schema) as writer:
+            for batch in source.iter_batches():
+                arrays = [cast_array(batch.column(field.name), field.type) if field.name in batch.schema.names
+                          else pa.nulls(batch.num_rows, field.type) for field in schema]
+                writer.write_table(pa.table(arrays, schema=schema))
+
+    write_atomic(path, write)
+    return True
+
+
+def partition_path(output, name):
+    return Path(output) / f"export={Path(name).stem}" / "part-0.parquet"
+
+
+def load_manifest(output):
+    path = Path(output) / "_manifest.json"
+    return json.loads(path.read_text()) if path.exists() else {"files": {}, "columns": {}}
+
+
+def save_manifest(manifest, output):
+    path = Path(output) / "_manifest.json"
+    write_atomic(path, lambda tmp: tmp.write_text(json.dumps(manifest, indent=1)))
+
+
+def combine(input_path=INPUT_PATH, output=OUTPUT_PATH, chunksize=CHUNKSIZE):
+    """
+    Brings the dataset in `output` up to date with the csv exports in
+    `input_path`. Returns the names of the exports (re)processed.
+    """
+
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(output)
+    csv_files = sorted(file for file in os.listdir(input_path) if file.endswith('.csv'))
+
+    for name in set(manifest['files']) - set(csv_files):
+        print(f"{name} is gone, dropping its partition")
+        shutil.rmtree(partition_path(output, name).parent, ignore_errors=True)
+        del manifest['files'][name]
+
+    hashes = {name: file_sha256(Path(input_path) / name) for name in csv_files}
+    todo = [name for name in csv_files
+            if manifest['files'].get(name, {}).get('sha256') != hashes[name]
+            or not partition_path(output, name).exists()]
+    print(f"{len(csv_files) - len(todo)} exports unchanged, {len(todo)} to process")
+    if not todo:
+        return []
+
+    # the schema only widens, so the partitions already written stay readable with it
+    columns = manifest['columns']
+    rows = {}
+    for n, name in enumerate(todo, 1):
+        file_columns, rows[name] = infer_columns(Path(input_path) / name, chunksize)
+        for column_name, column in file_columns.items():
+            merge_column(columns.setdefault(column_name, {'kind': None}), column['kind'],
+                         column.get('min'), column.get('max'), column.get('dictionary'))
+        print(f"Inferred the columns of {name} ({n} of {len(todo)})")
+    schema = arrow_schema(columns)
+
+    recast = [name for name in manifest['files'] if name not in todo
+              and cast_partition(partition_path(output, name), schema)]
+    if recast:
+        print(f"the schema widened, cast {len(recast)} partitions already written")
+
+    for n, name in enumerate(todo, 1):
+        write_partition(Path(input_path) / name, partition_path(output, name), schema, columns, chunksize)
+        manifest['files'][name] = {"sha256": hashes[name], "rows": rows[name]}
+        # saved after every export, so an interrupted run resumes where it stopped
+        save_manifest(manifest, output)
+        print(f"Combined {name}, {rows[name]} rows ({n} of {len(todo)})")
+    pq.write_metadata(schema, output / "_common_metadata")
+    return todo
+
+
+def write_csv(output, csv_path):
+    "Writes the dataset back to one csv, batch by batch, for readers not using Parquet yet"
 
-folder_path = '../datasets'
+    dataset = ds.dataset(output, format="parquet", partitioning="hive")
+    header = True
+    with open(csv_path, "w", newline="") as f:
+        for batch in dataset.to_batches(columns=[name for name in dataset.schema.names if name != "export"]):
+            batch.to_pandas().to_csv(f, index=False, header=header)
+            header = False
 
-csv_files = [
-    file for file in os.listdir(folder_path) if file.endswith('.csv')
-    ]
 
-dataframes = []
+def main():
+    parser = argparse.ArgumentParser(description="Combines the squidle+ csv exports into a Parquet dataset.")
+    parser.add_argument("--input", default=str(INPUT_PATH), help="folder of annotations_<id>.csv exports")
+    parser.add_argument("--output", default=str(OUTPUT_PATH), help="folder of the Parquet dataset")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="rows read at a time")
+    parser.add_argument("--csv", help="also write the combined dataset to this csv, e.g. ../combined.csv")
+    args = parser.parse_args()
 
-# Loop through the list of CSV files and read each one
-for file in csv_files:
-    file_path = os.path.join(folder_path, file)
-    df = pd.read_csv(file_path)
-    dataframes.append(df)
+    combine(args.input, args.output, args.chunksize)
+    manifest = load_manifest(args.output)
+    print(f"✅ {args.output}: {len(manifest['files'])} exports, "
+          f"{sum(f['rows'] for f in manifest['files'].values())} rows, {len(manifest['columns'])} columns")
+    if args.csv:
+        write_csv(args.output, args.csv)
+        print(f"✅ wrote {args.csv}")
 
-# Concatenate all DataFrames into one
-combined_df = pd.concat(dataframes, ignore_index=True)
 
-combined_df.to_csv('../combined.csv', index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
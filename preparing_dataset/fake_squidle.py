@@ -0,0 +1,135 @@
+"""
+fake_squidle.py
+
+Local stand-in for the squidle+ export API, so squidle_retrieval.py can
+be tested without an account or network access. Serves a paged
+/api/annotation_set listing, /api/annotation_set/<id>/export, whose
+export becomes available after --ready-after seconds, its status url
+and its csv result (sent in chunks, with a Content-Length). Sets listed
+in --refuse answer their status with a 404, sets in --fail report a
+failed export, and --error-rate answers that share of requests with a
+503. --edit changes the listing of sets, as if they were edited, so a
+rerun exports them again. --gzip sends the csv results gzip-encoded, the
+Content-Length being that of the compressed body.
+
+Usage: python fake_squidle.py --port 8766 --sets 40 --ready-after 2
+       python squidle_retrieval.py --base-url http://localhost:8766 --output /tmp/datasets
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import argparse
+import gzip
+import random
+import time
+
+from aiohttp import web
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fake squidle+ export API for testing squidle_retrieval.py.")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--sets", type=int, default=40, help="number of annotation sets")
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=2000, help="rows of each exported csv")
+    parser.add_argument("--ready-after", type=float, default=2.0, help="seconds an export takes")
+    parser.add_argument("--refuse", type=int, nargs="*", default=[], help="set ids whose status answers 404")
+    parser.add_argument("--fail", type=int, nargs="*", default=[], help="set ids whose export fails")
+    parser.add_argument("--edit", type=int, nargs="*", default=[], help="set ids listed as edited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--gzip", action="store_true", help="send the csv results with Content-Encoding: gzip")
+    return parser.parse_args(argv)
+
+
+class FakeSquidle:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(0)
+        self.tasks = {}
+        self.requests = 0
+        self.max_rate = 0
+        self.recent = []
+
+    def annotation_set(self, aset_id):
+        return {"id": aset_id, "name": f"Annotation set {aset_id}", "label_scheme_id": 21,
+                "version": 2 if aset_id in self.config.edit else 1}
+
+    def csv(self, aset_id):
+        header = "label.name,point.media.id,point.x,point.y\n"
+        rows = (f"Label {(aset_id + n) % 7},{aset_id * 10000 + n // 25},{n % 5 / 5},{n % 3 / 3}\n"
+                for n in range(self.config.rows))
+        return (header + "".join(rows)).encode("utf-8")
+
+    @web.middleware
+    async def count(self, request, handler):
+        # requests started in the last second, the rate limit of the client is checked against it
+        now = time.monotonic()
+        self.recent = [t for t in self.recent if now - t < 1] + [now]
+        self.max_rate = max(self.max_rate, len(self.recent))
+        self.requests += 1
+        if self.random.random() < self.config.error_rate:
+            return web.json_response({"error": "injected failure"}, status=503)
+        return await handler(request)
+
+    async def annotation_sets(self, request):
+        page = int(request.query.get("page", 1))
+        per_page = self.config.per_page
+        ids = range(1 + (page - 1) * per_page, min(self.config.sets, page * per_page) + 1)
+        return web.json_response({"objects": [self.annotation_set(i) for i in ids],
+                                  "page": page,
+                                  "total_pages": -(-self.config.sets // per_page)})
+
+    async def export(self, request):
+        aset_id = int(request.match_info['id'])
+        task = f"{aset_id}-{len(self.tasks)}"
+        self.tasks[task] = (aset_id, time.monotonic())
+        return web.json_response({"status_url": f"/api/task/{task}", "result_url": f"/api/task/{task}/result"})
+
+    async def status(self, request):
+        aset_id, started = self.tasks[request.match_info['task']]
+        if aset_id in self.config.refuse:
+            return web.json_response({"message": "not found"}, status=404)
+        if aset_id in self.config.fail:
+            return web.json_response({"status": "failed", "result_available": False})
+        ready = time.monotonic() - started >= self.config.ready_after
+        return web.json_response({"status": "done" if ready else "running", "result_available": ready})
+
+    async def result(self, request):
+        aset_id, _ = self.tasks[request.match_info['task']]
+        body = self.csv(aset_id)
+        headers = {"Content-Type": "text/csv"}
+        if self.config.gzip:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        response = web.StreamResponse(headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+        for start in range(0, len(body), 64 * 1024):
+            await response.write(body[start:start + 64 * 1024])
+        await response.write_eof()
+        return response
+
+    async def stats(self, request):
+        return web.json_response({"requests": self.requests, "exports": len(self.tasks),
+                                  "max_requests_per_s": self.max_rate})
+
+
+def create_app(config):
+    fake = FakeSquidle(config)
+    app = web.Application(middlewares=[fake.count])
+    app.router.add_get("/api/annotation_set", fake.annotation_sets)
+    app.router.add_get("/api/annotation_set/{id}/export", fake.export)
+    app.router.add_get("/api/task/{task}", fake.status)
+    app.router.add_get("/api/task/{task}/result", fake.result)
+    app.router.add_get("/stats", fake.stats)
+    return app
+
+
+def main():
+    config = parse_args()
+    web.run_app(create_app(config), port=config.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,51 +3,40 @@ squidle_retrieval.py
 
 Gathers all available datasets on squidle+ API and downloads to csv.
 
+The annotation sets are listed page by page, then exported concurrently:
+up to --concurrency exports are in flight, every request to the API goes
+through a shared rate limit (--rate requests per second), the status of
+each export is polled with exponential backoff, and finished exports are
+streamed to disk in chunks. Completed sets are recorded in a manifest
+with a fingerprint of their listing and the length of their csv, so a
+rerun (or a run after a crash) only exports sets that are new or changed.
+
+--base-url points the script at any server with the same API, e.g.
+fake_squidle.py for testing.
+
+Usage: python squidle_retrieval.py --concurrency 8 --rate 5
+
 Author: Aidan Murray
 Date: 2025-09-26
 """
 
-import requests
+import argparse
+import asyncio
+import hashlib
 import json
+import os
 import time
+from pathlib import Path
 
+import aiohttp
 
-API_KEY = ""
-BASE_URL = "https://squidle.org"
-
-annotation_url = f"{BASE_URL}/api/annotation_set"
-query = json.dumps({
-    "filters": [
-        {"name": "label_scheme_id", "op": "in", "val": [21, 24, 8]},
-        {"name": "current_user_can_view", "op": "==", "val": True}
-    ]
-})
-headers = {
-    "Authorization": f"ApiKey {API_KEY}"
-}
-page = 1
-annotation_sets = []
-
-while True:
-    params = {
-        "q": query,
-        "page": page
-    }
-    r = requests.get(annotation_url, headers=headers, params=params)
-    print(f"Fetching page {page}: {r.url}")
-    r.raise_for_status()
-    annotation_data = r.json()
-    annotation_objects = annotation_data.get("objects", [])
-    if not annotation_objects:
-        break
-    annotation_sets.extend(annotation_objects)
-    if page >= annotation_data.get("total_pages", 1):
-        break
-    page += 1
-print(
-    f"Retrieved {len(annotation_sets)} annotation sets across {page} page(s)."
-    )
 
+API_KEY = os.getenv('SQUIDLE_API_KEY', "")
+BASE_URL = os.getenv('SQUIDLE_URL', "https://squidle.org")
+LABEL_SCHEMES = [21, 24, 8]
+OUTPUT_PATH = Path("../datasets")
+CHUNK_SIZE = 1024 ** 2
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 operations = {
     "operations": [{
@@ -55,51 +44,257 @@ operations = {
         "method": "json_normalize"
     }]
 }
-params = {
+export_params = {
     "template": "dataframe.csv",
-    "f": json.dumps(operations) 
+    "f": json.dumps(operations)
 }
-skipped = []
-for i, aset in enumerate(annotation_sets):
-    aset_id = aset['id']
-    aset_name = aset['name']
-
-    print(
-        f"Exporting to csv, Iteration \
-          {i}, ID: {aset_id}, Annotation Set: {aset_name}"
-        )
-    
-    export_url = f"{annotation_url}/{aset_id}/export"
-    r = requests.get(export_url, headers=headers, params=params)
-    export_data = r.json()
-
-    status_url = BASE_URL + export_data['status_url']
-    result_url = BASE_URL + export_data['result_url']
-    print("Waiting for response to complete")
-    while True:
-        r = requests.get(status_url, headers=headers)
-        if r.status_code != 200:
-            break
-        status_data = r.json()
-        if status_data['result_available']:
-            print("Export ready!")
-            break
-        elif status_data['status'] == 'failed':
-            raise RuntimeError("Export failed.")
-        else:
-            print("Still processing...")
-            time.sleep(2)
-    if r.status_code != 200:
-        skipped.append([aset_id, aset_name])
-        with open("../datasets/error_log.txt", "a") as error_file:
-            error_file.write(f"{r}\n{r.json()}")
-            error_file.write("-" * 40 + "\n")
-        continue
-
-    r = requests.get(result_url, headers=headers)
-    r.raise_for_status()
-    print("Downloading file ...")
-    with open(f"../datasets/annotations_{aset_id}.csv", "wb") as f:
-        f.write(r.content)
-    print(f"Export complete. Saved as 'annotations_{aset_id}.csv'.")
-print(f"All {i} exports finished.")
\ No newline at end of file
+
+
+class RateLimiter:
+    "Spaces out requests so that at most `rate` start per second"
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = 0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def fingerprint(aset):
+    "Hash of an annotation set as listed by the API, which changes when the set is edited"
+
+    return hashlib.sha256(json.dumps(aset, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_manifest(path):
+    "Returns {set id: {'name', 'fingerprint', 'bytes', 'file'}} of the sets exported so far"
+
+    path = Path(path)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_manifest(manifest, path):
+    # written through a temporary file, so a crash never leaves a truncated manifest
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp, path)
+
+
+def is_done(aset, manifest, folder):
+    "True if the set was exported with the same listing and its csv is still complete on disk"
+
+    entry = manifest.get(str(aset['id']))
+    if not entry or entry['fingerprint'] != fingerprint(aset):
+        return False
+    path = Path(folder) / entry['file']
+    return path.exists() and path.stat().st_size == entry['bytes']
+
+
+class Squidle:
+    "Client of the squidle+ API sharing one session and one rate limit"
+
+    def __init__(self, session, base_url=BASE_URL, api_key=API_KEY, rate=5, retries=5, backoff=1.0):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"ApiKey {api_key}"}
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+
+    async def get(self, url, params=None):
+        """
+        Sends a rate-limited GET, retrying connection errors and 429/5xx
+        responses with exponential backoff. Returns the response, which
+        the caller must release.
+        """
+
+        url = url if url.startswith("http") else self.base_url + url
+        for attempt in range(self.retries + 1):
+            await self.limiter.wait()
+            try:
+                response = await self.session.get(url, headers=self.headers, params=params)
+            except aiohttp.ClientError as e:
+                if attempt == self.retries:
+                    raise
+                print(f"⚠ Request to {url} failed: {e}, retrying")
+            else:
+                if response.status not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                response.release()
+                print(f"⚠ {url} answered {response.status}, retrying")
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get_json(self, url, params=None):
+        async with await self.get(url, params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def annotation_sets(self, label_schemes=LABEL_SCHEMES):
+        "Returns every annotation set of the label schemes the user can view"
+
+        query = json.dumps({
+            "filters": [
+                {"name": "label_scheme_id", "op": "in", "val": list(label_schemes)},
+                {"name": "current_user_can_view", "op": "==", "val": True}
+            ]
+        })
+        page = 1
+        annotation_sets = []
+        while True:
+            print(f"Fetching page {page}")
+            annotation_data = await self.get_json("/api/annotation_set", {"q": query, "page": page})
+            annotation_objects = annotation_data.get("objects", [])
+            if not annotation_objects:
+                break
+            annotation_sets.extend(annotation_objects)
+            if page >= annotation_data.get("total_pages", 1):
+                break
+            page += 1
+        print(f"Retrieved {len(annotation_sets)} annotation sets across {page} page(s).")
+        return annotation_sets
+
+    async def wait_for(self, status_url, initial=1.0, maximum=30.0, timeout=3600):
+        """
+        Polls an export's status with exponential backoff until its result
+        is available. Returns None when it is, else the failing response
+        text; raises RuntimeError if the export failed or TimeoutError
+        after `timeout` seconds.
+        """
+
+        deadline = time.monotonic() + timeout
+        delay = initial
+        while True:
+            async with await self.get(status_url) as response:
+                if response.status != 200:
+                    return f"{response.status} {await response.text()}"
+                status_data = await response.json(content_type=None)
+            if status_data.get('result_available'):
+                return None
+            if status_data.get('status') == 'failed':
+                raise RuntimeError("Export failed.")
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"Export not ready after {timeout} seconds.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, maximum)
+
+    async def download(self, url, path):
+        "Streams a result to `path` in chunks, returning its length in bytes"
+
+        path = Path(path)
+        tmp = path.with_name(path.name + ".part")
+        async with await self.get(url) as response:
+            response.raise_for_status()
+            size = 0
+            with open(tmp, "wb") as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            # aiohttp decompresses gzip / deflate, while Content-Length is the size of the encoded body
+            encoded = response.headers.get("Content-Encoding", "identity").lower() != "identity"
+            if response.content_length is not None and not encoded and size != response.content_length:
+                raise IOError(f"Downloaded {size} of {response.content_length} bytes.")
+        os.replace(tmp, path)
+        return size
+
+    async def export(self, aset, folder, poll=(1.0, 30.0, 3600)):
+        """
+        Exports one annotation set to folder/annotations_<id>.csv,
+        returning its length in bytes, or None if the status request was
+        refused (logged to folder/error_log.txt)
+        """
+
+        aset_id = aset['id']
+        export_data = await self.get_json(f"/api/annotation_set/{aset_id}/export", export_params)
+        error = await self.wait_for(export_data['status_url'], *poll)
+        if error is not None:
+            with open(Path(folder) / "error_log.txt", "a") as error_file:
+                error_file.write(f"{aset_id} {aset['name']}\n{error}\n")
+                error_file.write("-" * 40 + "\n")
+            return None
+        return await self.download(export_data['result_url'], Path(folder) / f"annotations_{aset_id}.csv")
+
+
+async def retrieve(base_url=BASE_URL, api_key=API_KEY, folder=OUTPUT_PATH, manifest_path=None, concurrency=4,
+                   rate=5, label_schemes=LABEL_SCHEMES, poll=(1.0, 30.0, 3600)):
+    """
+    Exports every new or changed annotation set into `folder`, recording
+    each in the manifest as it completes. Returns (exported, unchanged,
+    skipped), skipped mapping each set id that failed to its error.
+    """
+
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(manifest_path or folder / "squidle_manifest.json")
+    manifest = load_manifest(manifest_path)
+    semaphore = asyncio.Semaphore(concurrency)
+    skipped = {}
+    exported = 0
+
+    # no total timeout, a large export may take longer to stream than aiohttp's default 5 minutes
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)) as session:
+        squidle = Squidle(session, base_url, api_key, rate)
+        annotation_sets = await squidle.annotation_sets(label_schemes)
+        todo = [aset for aset in annotation_sets if not is_done(aset, manifest, folder)]
+        unchanged = len(annotation_sets) - len(todo)
+        if unchanged:
+            print(f"{unchanged} annotation sets already exported and unchanged, skipping them")
+
+        async def export(aset):
+            nonlocal exported
+            async with semaphore:
+                print(f"Exporting to csv, ID: {aset['id']}, Annotation Set: {aset['name']}")
+                try:
+                    size = await squidle.export(aset, folder, poll)
+                except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, IOError) as e:
+                    print(f"⚠ Export of {aset['id']} failed: {e}")
+                    skipped[aset['id']] = str(e)
+                    return
+            if size is None:
+                print(f"⚠ Export of {aset['id']} was refused, see error_log.txt")
+                skipped[aset['id']] = "status request refused"
+                return
+            manifest[str(aset['id'])] = {"name": aset['name'], "fingerprint": fingerprint(aset),
+                                         "bytes": size, "file": f"annotations_{aset['id']}.csv"}
+            save_manifest(manifest, manifest_path)
+            exported += 1
+            print(f"Export complete. Saved as 'annotations_{aset['id']}.csv' ({exported} of {len(todo)}).")
+
+        await asyncio.gather(*(export(aset) for aset in todo))
+    return exported, unchanged, skipped
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Exports the annotation sets of squidle+ to csv.")
+    parser.add_argument("--base-url", default=BASE_URL, help="squidle+ server, or a fake one for testing")
+    parser.add_argument("--api-key", default=API_KEY)
+    parser.add_argument("--output", default=str(OUTPUT_PATH), help="folder the csv files are written to")
+    parser.add_argument("--manifest", default=None, help="json of the exported sets (default <output>/squidle_manifest.json)")
+    parser.add_argument("--label-schemes", type=int, nargs="+", default=LABEL_SCHEMES)
+    parser.add_argument("--concurrency", type=int, default=4, help="exports in flight")
+    parser.add_argument("--rate", type=float, default=5, help="requests per second to the API")
+    parser.add_argument("--poll-initial", type=float, default=1.0, help="first wait between status polls in seconds")
+    parser.add_argument("--poll-max", type=float, default=30.0, help="longest wait between status polls in seconds")
+    parser.add_argument("--poll-timeout", type=float, default=3600, help="seconds an export may take")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    exported, unchanged, skipped = asyncio.run(retrieve(
+        args.base_url, args.api_key, args.output, args.manifest, args.concurrency, args.rate,
+        args.label_schemes, (args.poll_initial, args.poll_max, args.poll_timeout)))
+    if skipped:
+        print(f"⚠ {len(skipped)} annotation sets failed, rerun to retry them: {sorted(skipped)}")
+    print(f"All exports finished. {exported} exported, {unchanged} unchanged.")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,11 +18,7 @@ from sklearn.preprocessing import MultiLabelBinarizer
 TEST_SIZE = 0.2
 PATH = Path("../../data")
 
-df = pd.read_csv(PATH / "combined.csv")
-df = df.dropna(subset=['label.name'])
-df = df.sample(frac=1, ignore_index=True, random_state=42)
-
-media = df[[
+MEDIA_COLUMNS = [
     'point.media.id',
     'point.media.path_best',
     'point.media.deployment.campaign.name',
@@ -30,7 +26,24 @@ media = df[[
     'point.pose.lat',
     'point.pose.dep',
     'point.pose.lon',
-    ]].drop_duplicates()
+    ]
+
+# the Parquet dataset of csv_combine.py, only the columns used are read
+if (PATH / "combined").exists():
+    df = pd.read_parquet(PATH / "combined", columns=MEDIA_COLUMNS + ['label.name'])
+    # dictionary-encoded columns come back as categoricals
+    df = df.astype({c: object for c in df.select_dtypes("category").columns})
+else:
+    df = pd.read_csv(PATH / "combined.csv", usecols=MEDIA_COLUMNS + ['label.name'])
+# whole-number coordinates are stored as integers in the Parquet dataset
+df = df.astype({'point.pose.lat': float, 'point.pose.dep': float, 'point.pose.lon': float})
+df = df.dropna(subset=['label.name'])
+# sorted first, so the seeded shuffle (and the split) does not depend on
+# the order the exports were combined or read in
+df = df.sort_values(MEDIA_COLUMNS + ['label.name'], kind="stable", ignore_index=True)
+df = df.sample(frac=1, ignore_index=True, random_state=42)
+
+media = df[MEDIA_COLUMNS].drop_duplicates()
 
 labels_per_media = df.groupby('point.media.id')['label.name']\
     .unique().reset_index()
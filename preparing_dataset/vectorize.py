@@ -1,24 +1,21 @@
 """
 vectorize.py
 
-Creates a copy of the dataset with labels in vector format.
+Creates multi-hot label vectors for each dataset, bit-packed in
+<dataset>.vectors.npy with the media ids and label names they line up
+with in <dataset>.vectors.index.npz (see label_store.load_vectors).
 
 Author: Aidan Murray
 Date: 2025-09-26
 """
 
 import ast
+import sys
 from pathlib import Path
 import pandas as pd
 
-def vectorize(series):
-    labels = series.to_list()
-    vectors = []
-    for item in labels:
-        item = ast.literal_eval(item)
-        vector = [1 if label in item else 0 for label in allowed_labels]
-        vectors.append(vector)
-    return vectors
+sys.path.append(str(Path(__file__).resolve().parents[1] / "prompt_test_container" / "app"))
+from label_store import LabelStore, save_vectors
 
 BASE_PATH = Path("../../data")
 LABEL_PATH = BASE_PATH / "prompt/allowed_labels.txt"
@@ -30,8 +27,11 @@ allowed_labels = ast.literal_eval(allowed_labels)
 
 for dataset in DATASETS:
     path = BASE_PATH / dataset
-    df = pd.read_csv(path)
-    labels = df["label.name"]
-    vectors = vectorize(labels)
-    df["label.vector"] = vectors
-    df.to_csv(path)
\ No newline at end of file
+
+    # earlier versions stored the vectors in the csv as stringified lists
+    if "label.vector" in pd.read_csv(path, nrows=0).columns:
+        pd.read_csv(path).drop(columns=["label.vector"]).to_csv(path, index=False)
+
+    store = LabelStore.load(path)
+    vectors = store.multi_hot(allowed_labels)
+    save_vectors(path, store.media_ids, vectors, allowed_labels)
@@ -0,0 +1,318 @@
+"""
+benchmark.py
+
+Throughput benchmark of the client side of the evaluation: starts
+mock_ollama.py in a separate process, then drives call_ollama_api and
+the evaluation engine (run_serial / run_async) at several concurrency
+levels. Reports requests/s, client CPU time per request, peak memory
+and the p50 / p95 / p99 latency of each run, and saves them as JSON so
+results of different versions can be compared with --compare.
+
+--prefix compares the server-side prompt-eval time of few-shot and
+zero-shot requests, sent interleaved (as prompts.py used to) or grouped
+by prompt so consecutive few-shot requests can reuse the cached
+demonstration prefix. Pass --url to run it against a real ollama server.
+
+Usage: python benchmark.py --requests 200 --concurrency 1 2 4 8 --output bench.json
+       python benchmark.py --prefix --url http://localhost:11434/api/chat
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import argparse
+import json
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import requests
+from PIL import Image
+
+import evaluation
+from ollama_client import call_ollama_api
+
+MODEL = "Benthiq:3b"
+N_DEMOS = 2
+# about as long as the task text and AllowedLabels of the real prompts
+TASK = ("### Task ###\nDecide which of the label names in AllowedLabels are visible.\nAllowedLabels:\n"
+        + str([f"Benthic label {i}" for i in range(150)]))
+# (metric, True when higher is better) compared by --compare
+COMPARED = (("req_per_s", True), ("cpu_ms_per_request", False), ("latency_p95_ms", False))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the ollama client against a mock server.")
+    parser.add_argument("--requests", type=int, default=200, help="requests per run")
+    parser.add_argument("--images", type=int, default=32, help="distinct synthetic images to cycle through")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(1024, 768), metavar=("W", "H"))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=(1, 2, 4, 8, 16))
+    parser.add_argument("--stream", action="store_true", help="also benchmark streaming requests")
+    parser.add_argument("--latency-ms", type=float, default=50, help="median latency of the mock server")
+    parser.add_argument("--tokens-per-s", type=float, default=2000, help="generation rate of the mock server")
+    parser.add_argument("--prompt-tokens-per-s", type=float, default=2000,
+                        help="prompt evaluation rate of the mock server")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--prefix", action="store_true",
+                        help="benchmark few-shot prefix reuse instead of client throughput")
+    parser.add_argument("--url", help="benchmark this /api/chat url instead of starting the mock server")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report the peak of Python allocations (slows the client down)")
+    parser.add_argument("--port", type=int, default=0, help="port of the mock server, a free one by default")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results to compare against")
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(args, port, parallel=None):
+    "Starts the mock server in its own process so its CPU time is not counted as the client's"
+
+    command = [sys.executable, str(Path(__file__).with_name("mock_ollama.py")),
+               "--port", str(port), "--model", args.model,
+               "--latency-ms", str(args.latency_ms),
+               "--tokens-per-s", str(args.tokens_per_s),
+               "--prompt-tokens-per-s", str(args.prompt_tokens_per_s), "--prefix-cache",
+               "--parallel", str(parallel or max(args.concurrency)),
+               "--error-rate", str(args.error_rate)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(url + "/api/tags", timeout=1).raise_for_status()
+            return process, url + "/api/chat"
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("mock server did not start")
+
+
+def make_images(directory, n, size):
+    "Writes n noise JPEGs, which compress about as badly as seafloor photos"
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(n):
+        pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        path = Path(directory) / f"{i}.jpg"
+        Image.fromarray(pixels).save(path, quality=90)
+        paths.append(str(path))
+    return paths
+
+
+def make_jobs(paths, n):
+    return [{'index': i,
+             'messages': [{"role": "user", "content": "Which labels are in this image?",
+                           "images": [paths[i % len(paths)]]}]}
+            for i in range(n)]
+
+
+class Run:
+    "Measures wall time, client CPU time and memory around one benchmark run"
+
+    def __init__(self, name, trace_memory):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.latencies = []
+        self.errors = 0
+
+    def on_result(self, job, response, execution_time):
+        self.latencies.append(execution_time)
+        self.errors += response['error'] is not None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+        self.python_peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+        tracemalloc.stop()
+
+    def result(self, concurrency):
+        n = len(self.latencies)
+        p50, p95, p99 = (float(p) * 1000 for p in np.percentile(self.latencies, [50, 95, 99]))
+        result = {"run": self.name,
+                  "concurrency": concurrency,
+                  "requests": n,
+                  "errors": self.errors,
+                  "wall_s": round(self.wall, 3),
+                  "req_per_s": round(n / self.wall, 2),
+                  "cpu_ms_per_request": round(self.cpu / n * 1000, 3),
+                  "latency_p50_ms": round(p50, 1),
+                  "latency_p95_ms": round(p95, 1),
+                  "latency_p99_ms": round(p99, 1),
+                  # high-water mark of the whole process, so it never goes down between runs
+                  "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+        if self.python_peak is not None:
+            result["python_peak_mb"] = round(self.python_peak / 1024 ** 2, 1)
+        return result
+
+
+def bench_client(jobs, url, model, stream, trace_memory):
+    "Calls call_ollama_api in a plain loop, without the evaluation engine around it"
+
+    with Run("client_stream" if stream else "client", trace_memory) as run:
+        for job in jobs:
+            start_time = time.perf_counter()
+            response = call_ollama_api(job['messages'], model=model, timeout=60, delay=0, url=url, stream=stream)
+            run.on_result(job, response, time.perf_counter() - start_time)
+    return run.result(1)
+
+
+def bench_engine(jobs, url, model, concurrency, stream, trace_memory):
+    name = "engine_stream" if stream else "engine"
+    client_kwargs = {"url": url, "delay": 0, "stream": stream}
+    with Run(name, trace_memory) as run:
+        if concurrency == 1:
+            evaluation.run_serial(jobs, run.on_result, model, 60, client_kwargs=client_kwargs)
+        else:
+            evaluation.run_async(jobs, run.on_result, model, 60, concurrency=concurrency,
+                                 client_kwargs=client_kwargs)
+    return run.result(concurrency)
+
+
+def prefix_jobs(paths, n, grouped):
+    """
+    Returns n zero-shot and n few-shot jobs, the few-shot ones sharing the
+    same N_DEMOS demonstrations, either alternating or grouped by kind
+    """
+
+    demos = [{"role": "user", "content": TASK, "images": [paths[0]]},
+             {"role": "assistant", "content": "['Benthic label 1']"}]
+    for k in range(1, N_DEMOS):
+        demos += [{"role": "user", "images": [paths[k]]},
+                  {"role": "assistant", "content": "['Benthic label 2']"}]
+    targets = [paths[N_DEMOS + i % (len(paths) - N_DEMOS)] for i in range(n)]
+    zero_shot = [{'prompt': "zero_shot", 'affinity': "zero_shot",
+                  'messages': [{"role": "user", "content": TASK, "images": [t]}]} for t in targets]
+    few_shot = [{'prompt': "few_shot", 'affinity': "few_shot",
+                 'messages': demos + [{"role": "user", "images": [t]}]} for t in targets]
+    if grouped:
+        return zero_shot + few_shot
+    return [job for pair in zip(zero_shot, few_shot) for job in pair]
+
+
+def bench_prefix(paths, url, model, n, concurrency, grouped, trace_memory):
+    "Runs zero-shot and few-shot jobs and reports ollama's prompt-eval time and tokens of each kind"
+
+    timings = {"zero_shot": [], "few_shot": []}
+
+    def on_result(job, response, execution_time):
+        run.on_result(job, response, execution_time)
+        if response.get('timings'):
+            timings[job['prompt']].append(response['timings'])
+
+    client_kwargs = {"url": url, "delay": 0, "keep_alive": -1}
+    with Run("prefix_grouped" if grouped else "prefix_interleaved", trace_memory) as run:
+        jobs = prefix_jobs(paths, n, grouped)
+        if concurrency == 1:
+            evaluation.run_serial(jobs, on_result, model, 600, client_kwargs=client_kwargs)
+        else:
+            evaluation.run_async(jobs, on_result, model, 600, concurrency=concurrency, client_kwargs=client_kwargs)
+
+    result = run.result(concurrency)
+    for kind, rows in timings.items():
+        result[f"{kind}_prompt_eval_ms"] = round(float(np.mean([r['prompt_eval_duration'] or 0 for r in rows])) / 1e6, 1)
+        result[f"{kind}_prompt_eval_tokens"] = round(float(np.mean([r['prompt_eval_count'] or 0 for r in rows])), 1)
+    result["few_shot_over_zero_shot"] = round(result["few_shot_prompt_eval_ms"]
+                                              / max(result["zero_shot_prompt_eval_ms"], 1e-9), 2)
+    return result
+
+
+def compare(results, path):
+    "Prints the relative change of each compared metric against an earlier results file"
+
+    with open(path) as f:
+        previous = {(r['run'], r['concurrency']): r for r in json.load(f)['results']}
+    print(f"\nCompared with {path}:")
+    for r in results:
+        old = previous.get((r['run'], r['concurrency']))
+        if old is None:
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED:
+            if metric not in r:
+                continue
+            change = (r[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            worse = change < 0 if higher_is_better else change > 0
+            changes.append(f"{metric} {change:+.1f}%{' (worse)' if worse and abs(change) > 5 else ''}")
+        print(f"  {r['run']:<14} c={r['concurrency']:<3} " + ", ".join(changes))
+
+
+def main():
+    args = parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_images(directory, args.images, args.image_size)
+        if args.prefix:
+            # a mock with one slot per request in flight, like OLLAMA_NUM_PARALLEL = concurrency
+            for concurrency in sorted({min(args.concurrency), max(args.concurrency)}):
+                process, url = (None, args.url) if args.url else start_mock(args, args.port or free_port(),
+                                                                            concurrency)
+                try:
+                    for grouped in (False, True):
+                        results.append(bench_prefix(paths, url, args.model, args.requests // 2, concurrency,
+                                                    grouped, args.trace_memory))
+                        print(results[-1])
+                finally:
+                    if process:
+                        process.terminate()
+                        process.wait()
+        else:
+            process, url = (None, args.url) if args.url else start_mock(args, args.port or free_port())
+            try:
+                # one untimed pass, so every run sees the images in the page and payload caches
+                bench_client(make_jobs(paths, len(paths)), url, args.model, False, False)
+                for stream in (False, True) if args.stream else (False,):
+                    results.append(bench_client(make_jobs(paths, args.requests), url, args.model, stream,
+                                                args.trace_memory))
+                    print(results[-1])
+                    for concurrency in args.concurrency:
+                        results.append(bench_engine(make_jobs(paths, args.requests), url, args.model,
+                                                    concurrency, stream, args.trace_memory))
+                        print(results[-1])
+            finally:
+                if process:
+                    process.terminate()
+                    process.wait()
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        revision = None
+    output = {"date": datetime.now().isoformat(timespec="seconds"),
+              "revision": revision,
+              "python": platform.python_version(),
+              "machine": platform.machine(),
+              "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+budget_sweep.py
+
+Sweeps the vision-token budget images are downsized to before they are
+sent (prompts.py --image-tokens) and reports how each budget trades
+latency against F1. The same seeded subset of the validation images is
+run through prompts.py once per budget (and once at full size), and the
+latency, images/s, mean vision and prompt tokens and F1 of every run
+are collected in budget_sweep.csv, with the Pareto-optimal budgets
+marked. The cheapest budget whose F1 is within --tolerance of the best
+run is printed as the recommendation. plots/budget_curve.py plots the
+curve.
+
+Usage: python budget_sweep.py --budgets 64 128 256 512 1024 --limit 50 --prompts 0
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from sweep import clear_outputs, pareto_front, run_metrics
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweeps the vision-token budget of the images against latency and F1.")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[64, 128, 256, 512, 1024],
+                        help="vision-token budgets to try, a full-size run is added unless --no-full")
+    parser.add_argument("--no-full", action="store_true", help="skip the run at full resolution")
+    parser.add_argument("--model", default=None, help="model to run, prompts.py's default if not given")
+    parser.add_argument("--limit", type=int, default=50, help="number of validation images per run")
+    parser.add_argument("--prompts", type=int, nargs="+", default=[0], help="prompts to run")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="F1 a budget may lose against the best run and still be recommended")
+    parser.add_argument("--workdir", default=".", help="directory holding data/ and images/ for prompts.py")
+    parser.add_argument("--output-dir", default="./data/budget_sweep")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for budget in sorted(args.budgets) + ([] if args.no_full else [None]):
+        out = output_dir / (f"tokens_{budget}" if budget else "full")
+        print(f"--- {f'{budget} vision tokens' if budget else 'full resolution'} ---")
+        command = [sys.executable, str(Path(__file__).with_name("prompts.py")),
+                   "--limit", str(args.limit), "--prompts", *map(str, args.prompts),
+                   "--concurrency", str(args.concurrency), "--warmup", "1", "--output-dir", str(out.resolve())]
+        if args.model:
+            command += ["--model", args.model]
+        if budget:
+            command += ["--image-tokens", str(budget)]
+        clear_outputs(out)
+        process = subprocess.run(command, cwd=args.workdir)
+
+        if process.returncode != 0 or not (out / "prompt_run_stats.txt").exists():
+            print(f"run with budget {budget} failed")
+            continue
+        df = pd.read_csv(out / "prompt_requests.csv")
+        results.append({"image_tokens": budget,
+                        "vision_tokens": float(df['vision_tokens'].mean()),
+                        "image_width": float(df['image_width'].mean()),
+                        "image_height": float(df['image_height'].mean()),
+                        "prompt_eval_count": float(df['prompt_eval_count'].mean()),
+                        **run_metrics(out)})
+        print(results[-1])
+
+        # written after every run, so an interrupted sweep keeps what it measured
+        df = pd.DataFrame(results)
+        df['pareto'] = pareto_front(df)
+        df.sort_values("vision_tokens").to_csv(output_dir / "budget_sweep.csv", index=False)
+
+    if not results:
+        return
+    print(df.sort_values("vision_tokens")[["image_tokens", "vision_tokens", "prompt_eval_count", "latency_p50_s",
+                                           "images_per_s", "f1", "pareto"]].to_string(index=False))
+    # the full-resolution run measures no vision tokens and sorts last, as the most expensive
+    good = df[df['f1'] >= df['f1'].max() - args.tolerance].sort_values("vision_tokens")
+    best = good.iloc[0]
+    budget = f"{int(best['image_tokens'])} ({best['vision_tokens']:.0f} vision tokens," \
+        if pd.notna(best['image_tokens']) else "full resolution ("
+    print(f"✅ cheapest budget within {args.tolerance} F1 of the best run: "
+          f"{budget} p50 {best['latency_p50_s']:.2f}s, F1 {best['f1']:.3f})")
+
+
+if __name__ == "__main__":
+    main()
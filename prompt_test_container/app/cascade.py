@@ -0,0 +1,64 @@
+"""
+cascade.py
+
+Decides which answers of the small model are escalated to the large one
+in a cascade run of prompts.py (--cascade). Every image is answered by
+the small model first; its answer is escalated when it
+
+- failed to parse or timed out,
+- is empty or "Unscorable",
+- or, with an agreement threshold, overlaps too little (Jaccard) with a
+  second answer sampled from the small model at a higher temperature.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from shards import read_run_stats
+
+REASONS = ("failed_parse", "timeout", "empty", "unscorable", "disagreement")
+
+
+def agreement(a, b):
+    "Jaccard similarity of two label lists, 1 when both are empty"
+
+    a, b = set(map(str, a)), set(map(str, b))
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def escalation_reason(record, sample=None, min_agreement=None):
+    """
+    Returns why the small model's answer in `record` should be escalated,
+    None if it is kept. `sample` is the journal record of the second
+    sample, a missing sample counting as agreement.
+    """
+
+    if record['status'] in ("failed_parse", "timeout"):
+        return record['status']
+    labels = [label for label in record['y_pred'] if str(label).strip()]
+    if not labels:
+        return "empty"
+    if any(str(label).strip().lower() == "unscorable" for label in labels):
+        return "unscorable"
+    if min_agreement is not None and sample is not None:
+        sampled = sample['y_pred'] if sample['status'] in ("ok", "recovered") else []
+        if agreement(labels, sampled) < min_agreement:
+            return "disagreement"
+    return None
+
+
+def read_baseline(directory):
+    "Returns the model, images/s and mean F1 per prompt of a single-model run of prompts.py"
+
+    stats = read_run_stats(directory)
+    f1 = pd.read_csv(Path(directory) / "prompt_requests.csv").groupby('prompt')['f1'].mean()
+    return {"run": str(directory),
+            "model": stats.get('model'),
+            "images_per_s": float(stats['images_per_s']),
+            **{f"f1_prompt_{k}": v for k, v in f1.items()},
+            "f1": float(f1.mean()) if len(f1) else np.nan}
@@ -0,0 +1,208 @@
+"""
+derivative_store.py
+
+Keeps each downloaded image once, content-addressed by its sha256, and
+the resized derivatives the experiments use next to it:
+
+    <store>/originals/ab/abcdef...
+    <store>/derivatives/640x480/ab/abcdef....jpg
+    <store>/index.json    media id -> sha256, url, original size, derivatives made
+
+Every missing size of an image is generated from a single decode of the
+original. For JPEGs the decode uses PIL's draft mode, which lets the
+decoder downscale by 1/2, 1/4 or 1/8 in the DCT domain, never below the
+largest size requested. Switching an experiment to another resolution is
+then an export of that size into an images folder (hard links where
+possible), generating only the derivatives not made yet.
+
+Usage: python derivative_store.py --store ./data/image_store --size 128x128 --folder ./images_128
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+STORE_PATH = Path("./data/image_store")
+
+
+def parse_size(value):
+    "Parses '640x480' into (640, 480)"
+
+    width, _, height = str(value).lower().partition("x")
+    return int(width), int(height)
+
+
+def size_key(size):
+    return f"{size[0]}x{size[1]}"
+
+
+def _write_atomic(path, write):
+    """
+    Writes a file through a temporary name, so readers never see a partial
+    file; the name is unique, as download threads may write the same original
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    os.close(fd)
+    try:
+        write(Path(tmp))
+        # mkstemp makes the file readable by its owner only
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def render(original, targets):
+    """
+    Decodes an original once and saves it at every size of targets
+    ({(width, height): path}), largest first; runs in a process pool
+    """
+
+    with Image.open(original) as img:
+        largest = max(targets, key=lambda size: size[0] * size[1])
+        # JPEGs are decoded at the smallest DCT scale still covering the largest target
+        img.draft("RGB", largest)
+        img = img.convert("RGB")
+        for size in sorted(targets, key=lambda size: size[0] * size[1], reverse=True):
+            _write_atomic(targets[size], lambda tmp: img.resize(size).save(tmp, format="JPEG"))
+    return list(targets)
+
+
+class DerivativeStore:
+    def __init__(self, root=STORE_PATH):
+        self.root = Path(root)
+        self.index_path = self.root / "index.json"
+        self.index = json.loads(self.index_path.read_text()) if self.index_path.exists() else {}
+        # originals are added from the download threads
+        self.lock = threading.Lock()
+
+    def __contains__(self, media_id):
+        return str(media_id) in self.index
+
+    def original_path(self, sha256):
+        # the bytes as downloaded, whatever their format
+        return self.root / "originals" / sha256[:2] / sha256
+
+    def derivative_path(self, sha256, size):
+        return self.root / "derivatives" / size_key(size) / sha256[:2] / f"{sha256}.jpg"
+
+    def add(self, media_id, content, url=None):
+        "Stores the original bytes of an image, once per content, and returns its sha256"
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self.original_path(sha256)
+        if not path.exists():
+            _write_atomic(path, lambda tmp: tmp.write_bytes(content))
+        with Image.open(path) as img:
+            width, height = img.size
+        with self.lock:
+            entry = self.index.setdefault(str(media_id), {"derivatives": []})
+            entry.update(sha256=sha256, url=url, size=[width, height])
+        return sha256
+
+    def missing(self, media_id, sizes):
+        "Returns {size: path} of the derivatives of an image that still have to be made"
+
+        sha256 = self.index[str(media_id)]['sha256']
+        return {tuple(size): self.derivative_path(sha256, size) for size in sizes
+                if not self.derivative_path(sha256, size).exists()}
+
+    def made(self, media_id, sizes):
+        "Records derivatives made for an image"
+
+        with self.lock:
+            entry = self.index[str(media_id)]
+            entry['derivatives'] = sorted(set(entry['derivatives']) | {size_key(size) for size in sizes})
+
+    def path(self, media_id, size):
+        "Returns the path of a derivative, making it first if needed"
+
+        targets = self.missing(media_id, [size])
+        if targets:
+            render(self.original_path(self.index[str(media_id)]['sha256']), targets)
+            self.made(media_id, targets)
+        return self.derivative_path(self.index[str(media_id)]['sha256'], size)
+
+    def generate(self, sizes, media_ids=None, processes=None):
+        "Makes the missing derivatives of the given images (all by default), one decode per image"
+
+        media_ids = [str(k) for k in (media_ids if media_ids is not None else self.index)]
+        jobs = {k: self.missing(k, sizes) for k in media_ids if k in self.index}
+        jobs = {k: targets for k, targets in jobs.items() if targets}
+        if not jobs:
+            return 0
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {k: pool.submit(render, self.original_path(self.index[k]['sha256']), targets)
+                       for k, targets in jobs.items()}
+            for k, future in futures.items():
+                self.made(k, future.result())
+        self.save()
+        return len(jobs)
+
+    def export(self, size, folder, media_ids=None):
+        "Fills folder/<id>.jpg with one size of the given images (all by default), as hard links where possible"
+
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        media_ids = [str(k) for k in (media_ids if media_ids is not None else self.index)]
+        for k in media_ids:
+            source = self.derivative_path(self.index[k]['sha256'], size)
+            target = folder / f"{k}.jpg"
+            target.unlink(missing_ok=True)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+        return len(media_ids)
+
+    def save(self):
+        with self.lock:
+            text = json.dumps(self.index)
+        _write_atomic(self.index_path, lambda tmp: tmp.write_text(text))
+
+    def stats(self):
+        sizes = {}
+        for entry in self.index.values():
+            for key in entry['derivatives']:
+                sizes[key] = sizes.get(key, 0) + 1
+        return {"images": len(self.index),
+                "originals": len({entry['sha256'] for entry in self.index.values()}),
+                **{f"derivatives_{key}": n for key, n in sorted(sizes.items())}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports one resolution of the stored images into a folder.")
+    parser.add_argument("--store", default=str(STORE_PATH))
+    parser.add_argument("--size", type=parse_size, default=(640, 480), help="e.g. 640x480")
+    parser.add_argument("--folder", help="folder to export <id>.jpg into, e.g. ./images")
+    parser.add_argument("--sizes", type=parse_size, nargs="*", default=[],
+                        help="further sizes to generate in the same pass")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    store = DerivativeStore(args.store)
+    made = store.generate([args.size, *args.sizes], processes=args.processes)
+    print(f"generated the missing derivatives of {made} images")
+    if args.folder:
+        n = store.export(args.size, args.folder)
+        print(f"✅ exported {n} images at {size_key(args.size)} to {args.folder}")
+    print(store.stats())
+
+
+if __name__ == "__main__":
+    main()
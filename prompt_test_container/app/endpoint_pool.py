@@ -0,0 +1,176 @@
+"""
+endpoint_pool.py
+
+Client-side load balancing over several ollama servers, given as a
+comma-separated OLLAMA_URL. Each request goes to the healthy endpoint
+with the fewest requests in flight (least outstanding requests), ties
+going to the one that has served the fewest so far.
+
+An endpoint is ejected for `eject_s` seconds after `max_failures`
+failed requests in a row, or when its /api/tags health check fails, and
+is readmitted once a health check passes or the ejection runs out. The
+latency of the recent requests of each endpoint is kept for stats().
+
+Requests given an affinity key (e.g. the prompt) stick to the endpoint
+that served that key before, as long as it is healthy and has at most
+`affinity_slack` more requests in flight than the least loaded one, so
+ollama's prompt cache on that server can reuse their shared prefix.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import requests
+
+from ollama_client import api_base
+
+LATENCY_WINDOW = 1000
+
+
+def parse_urls(value):
+    "Splits a comma-separated list of /api/chat urls"
+
+    return [url.strip() for url in (value or "").split(",") if url.strip()]
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def available(self, now):
+        return now >= self.ejected_until
+
+
+class EndpointPool:
+    def __init__(self, urls, max_failures=3, eject_s=30, health_interval=15, health_timeout=5, affinity_slack=1):
+        if not urls:
+            raise ValueError("no ollama endpoints given")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.max_failures = max_failures
+        self.eject_s = eject_s
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.last_check = 0.0
+        self.affinity_slack = affinity_slack
+        self.affinity = {}
+        # acquire / release are called from the event loop and from health-check threads
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, value=None, **kwargs):
+        "Builds a pool from a comma-separated list of urls, OLLAMA_URL by default"
+
+        return cls(parse_urls(value or os.getenv('OLLAMA_URL')), **kwargs)
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def acquire(self, exclude=(), affinity=None):
+        """
+        Picks the endpoint for the next request and counts it as in flight.
+        If every endpoint is ejected the one readmitted soonest is used
+        rather than failing the run; None once all are in `exclude`.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.available(now)]
+            if healthy:
+                endpoint = min(healthy, key=lambda e: (e.outstanding, e.requests))
+                sticky = self.affinity.get(affinity)
+                if sticky in healthy and sticky.outstanding <= endpoint.outstanding + self.affinity_slack:
+                    endpoint = sticky
+                elif affinity is not None:
+                    self.affinity[affinity] = endpoint
+            else:
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint, latency, failed):
+        "Records the outcome of a request, ejecting the endpoint after too many failures in a row"
+
+        with self.lock:
+            endpoint.outstanding -= 1
+            if not failed:
+                endpoint.consecutive_failures = 0
+                endpoint.latencies.append(latency)
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.max_failures:
+                self._eject(endpoint, f"{endpoint.consecutive_failures} failed requests in a row")
+
+    def cancel(self, endpoint):
+        "Frees an endpoint whose request was cancelled, without counting it as a success or failure"
+
+        with self.lock:
+            endpoint.outstanding -= 1
+
+    def _eject(self, endpoint, reason):
+        if endpoint.available(time.monotonic()):
+            print(f"⚠ Ejecting {endpoint.url} for {self.eject_s}s: {reason}")
+            endpoint.ejections += 1
+        endpoint.ejected_until = time.monotonic() + self.eject_s
+        # after the ejection a single failure is enough to eject it again
+        endpoint.consecutive_failures = self.max_failures - 1
+
+    def check_health(self):
+        "Queries /api/tags of every endpoint, ejecting those that do not answer and readmitting those that do"
+
+        for endpoint in self.endpoints:
+            try:
+                requests.get(api_base(endpoint.url) + "/api/tags", timeout=self.health_timeout).raise_for_status()
+                healthy = True
+            except requests.RequestException:
+                healthy = False
+            with self.lock:
+                if not healthy:
+                    self._eject(endpoint, "health check failed")
+                elif not endpoint.available(time.monotonic()):
+                    print(f"✅ Readmitting {endpoint.url}")
+                    endpoint.ejected_until = 0.0
+                    endpoint.consecutive_failures = 0
+        self.last_check = time.monotonic()
+
+    def maybe_check_health(self):
+        "Runs check_health if the last one is older than health_interval"
+
+        if time.monotonic() - self.last_check >= self.health_interval:
+            self.check_health()
+
+    def stats(self):
+        "Returns one dict per endpoint with its request counts and latency percentiles in milliseconds"
+
+        rows = []
+        now = time.monotonic()
+        with self.lock:
+            for e in self.endpoints:
+                latencies = np.array(e.latencies) * 1000
+                p50, p95 = np.percentile(latencies, [50, 95]) if len(latencies) else (np.nan, np.nan)
+                rows.append({"url": e.url,
+                             "requests": e.requests,
+                             "failures": e.failures,
+                             "ejections": e.ejections,
+                             "ejected": not e.available(now),
+                             "latency_mean_ms": latencies.mean() if len(latencies) else np.nan,
+                             "latency_p50_ms": p50,
+                             "latency_p95_ms": p95})
+        return rows
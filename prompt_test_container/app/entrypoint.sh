@@ -1,2 +1,2 @@
 python image_retrieval.py
-python prompts.py
\ No newline at end of file
+python prompts.py --resume
\ No newline at end of file
@@ -0,0 +1,314 @@
+"""
+evaluation.py
+
+Runs the (image, prompt) jobs built by prompts.py against ollama, either
+one request at a time or with several requests in flight.
+
+Each job is a dict holding at least 'messages', optionally a 'prompt'
+(the key of its timeout statistics) and an 'affinity' key that keeps
+related requests on the same server. The callback receives the job back
+together with the response and the latency of that single request, so
+results always map to the right image and prompt no matter the order in
+which they complete.
+
+With an EndpointPool each request is sent to the least loaded healthy
+server; a request that fails to connect is tried on the other servers
+before the failure is passed on. Timeouts, retries with backoff and
+hedging are decided by an optional RequestPolicy (request_policy.py).
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+from ollama_client import call_ollama_api, call_ollama_api_async
+
+
+def request_options(job, client_kwargs):
+    "Merges the client options of the whole run with those of a single job"
+
+    return {**(client_kwargs or {}), **job.get('client_kwargs', {})}
+
+
+def warm_up(messages, model, timeout, n=2, urls=(None,), client_kwargs=None):
+    """
+    Sends `n` untimed requests to each server, so the model is loaded and
+    the prompt cache filled before timing starts. Returns the load time in
+    seconds that ollama reported for each request.
+    """
+
+    load_times = []
+    for url in urls:
+        for _ in range(n):
+            # not streamed, a streamed answer stopped early has no final chunk with the timings
+            response = call_ollama_api(messages, model=model, timeout=timeout, url=url,
+                                       **{**(client_kwargs or {}), 'stream': False})
+            load_duration = (response.get('timings') or {}).get('load_duration')
+            load_times.append(load_duration / 1e9 if load_duration is not None else None)
+    return load_times
+
+
+def _retry_kwargs(policy):
+    "With a policy the retries are made here, with backoff, instead of inside the client"
+
+    return {'max_retries': 1} if policy else {}
+
+
+def _wait_for_breaker(policy):
+    while policy and (wait := policy.wait()):
+        time.sleep(wait)
+
+
+async def _wait_for_breaker_async(policy):
+    while policy and (wait := policy.wait()):
+        await asyncio.sleep(wait)
+
+
+def _next_attempt(response, retries, tried, pool, policy, elapsed):
+    """
+    Decides what follows an attempt: None if the response is final, 0 to
+    fail over to another endpoint of the pool straight away (connection
+    failures only), or the backoff in seconds before the next retry
+    """
+
+    error = response['error']
+    if error is None:
+        return None
+    if policy is None:
+        return 0 if error != "Timeout" and pool and len(tried) < len(pool) else None
+    # the attempts share one max_timeout, a request timed out at the ceiling is not retried
+    if error != "Timeout" and pool and len(tried) < len(pool) and policy.max_timeout - elapsed >= policy.min_timeout:
+        return 0
+    return policy.retry_after(retries, elapsed)
+
+
+def _send(job, model, timeout, options, pool, policy):
+    """
+    Sends a job through call_ollama_api until it succeeds or the policy
+    gives up. Returns the last response, annotated with the number of
+    attempts and timed out attempts, and the time taken by all of them.
+    """
+
+    key = job.get('prompt')
+    tried, retries, attempts, timeouts = [], 0, 0, 0
+    start_time = time.perf_counter()
+    while True:
+        _wait_for_breaker(policy)
+        endpoint = pool.acquire(exclude=tried, affinity=job.get('affinity')) if pool else None
+        url = {'url': endpoint.url} if endpoint else {}
+        request_timeout = policy.timeout(key, timeouts, time.perf_counter() - start_time) if policy else timeout
+        attempt_start = time.perf_counter()
+        response = call_ollama_api(messages=job['messages'], model=model, timeout=request_timeout,
+                                   **{**options, **url, **_retry_kwargs(policy)})
+        latency = time.perf_counter() - attempt_start
+
+        attempts += 1
+        timeouts += response['error'] == "Timeout"
+        if endpoint:
+            pool.release(endpoint, latency, response['error'] is not None)
+            tried.append(endpoint)
+        if policy:
+            policy.record(key, latency, response['error'] is not None, response['error'] == "Timeout")
+
+        delay = _next_attempt(response, retries, tried, pool, policy, time.perf_counter() - start_time)
+        if delay is None:
+            break
+        if delay:
+            print(f"Retrying in {delay:.1f}s ...")
+            retries, tried = retries + 1, []
+            time.sleep(delay)
+
+    response.update(attempts=attempts, timeouts=timeouts)
+    return response, time.perf_counter() - start_time
+
+
+async def _attempt_async(session, job, model, timeout, options, pool, endpoint):
+    "Sends one request; a cancelled (hedged) request only frees its endpoint"
+
+    url = {'url': endpoint.url} if endpoint else {}
+    start_time = time.perf_counter()
+    try:
+        response = await call_ollama_api_async(session, job['messages'], model=model, timeout=timeout,
+                                               **{**options, **url})
+    except asyncio.CancelledError:
+        if endpoint:
+            pool.cancel(endpoint)
+        raise
+    if endpoint:
+        pool.release(endpoint, time.perf_counter() - start_time, response['error'] is not None)
+    return response
+
+
+async def _hedged_attempt(session, job, model, timeout, options, pool, policy, tried):
+    """
+    Sends one request, duplicating it if it is still running after the
+    hedge delay of its prompt, and returns the first successful response
+    """
+
+    hedge_after = policy.hedge_after(job.get('prompt')) if policy else None
+    endpoint = pool.acquire(exclude=tried, affinity=job.get('affinity')) if pool else None
+    if endpoint:
+        tried.append(endpoint)
+    first = asyncio.create_task(_attempt_async(session, job, model, timeout, options, pool, endpoint))
+    if hedge_after is None or hedge_after >= timeout:
+        return await first, False
+
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result(), False
+
+    # another endpoint if the pool has a healthy one, otherwise another slot of the same server
+    second_endpoint = (pool.acquire(exclude=[endpoint]) or pool.acquire()) if pool else None
+    if second_endpoint and second_endpoint not in tried:
+        tried.append(second_endpoint)
+    second = asyncio.create_task(_attempt_async(session, job, model, timeout - hedge_after, options,
+                                                pool, second_endpoint))
+    pending = {first, second}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            response = task.result()
+            if response['error'] is None or not pending:
+                # cancelling closes the connection, which stops the generation in ollama
+                for other in pending:
+                    other.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                return response, True
+
+
+async def _send_async(session, job, model, timeout, options, pool, policy):
+    "Same as _send, hedging slow requests when the policy asks for it"
+
+    key = job.get('prompt')
+    options = {**options, **_retry_kwargs(policy)}
+    tried, retries, attempts, timeouts, hedged = [], 0, 0, 0, False
+    start_time = time.perf_counter()
+    while True:
+        await _wait_for_breaker_async(policy)
+        request_timeout = policy.timeout(key, timeouts, time.perf_counter() - start_time) if policy else timeout
+        attempt_start = time.perf_counter()
+        response, hedge = await _hedged_attempt(session, job, model, request_timeout, options, pool, policy, tried)
+        latency = time.perf_counter() - attempt_start
+
+        attempts += 1
+        hedged |= hedge
+        timeouts += response['error'] == "Timeout"
+        if policy:
+            policy.record(key, latency, response['error'] is not None, response['error'] == "Timeout")
+
+        delay = _next_attempt(response, retries, tried, pool, policy, time.perf_counter() - start_time)
+        if delay is None:
+            break
+        if delay:
+            print(f"Retrying in {delay:.1f}s ...")
+            retries, tried = retries + 1, []
+            await asyncio.sleep(delay)
+
+    response.update(attempts=attempts, timeouts=timeouts, hedged=hedged)
+    return response, time.perf_counter() - start_time
+
+
+def run_serial(jobs, on_result, model, timeout, delay_after_timeout=0, cache=None, client_kwargs=None, pool=None,
+               policy=None):
+    """
+    Sends each job to ollama in turn and passes the response to on_result.
+    client_kwargs (e.g. stream=True) are passed on to call_ollama_api,
+    merged with the job's own 'client_kwargs'. A RequestPolicy sets the
+    timeouts and retries; without one every request gets `timeout`.
+    """
+
+    for job in jobs:
+        options = request_options(job, client_kwargs)
+        response = cache.get(job['messages'], options) if cache else None
+        if response is not None:
+            on_result(job, response, response['time'])
+            continue
+        if pool:
+            pool.maybe_check_health()
+        response, execution_time = _send(job, model, timeout, options, pool, policy)
+        if cache:
+            cache.put(job['messages'], response, execution_time, options)
+        on_result(job, response, execution_time)
+        if response['error'] == "Timeout":
+            time.sleep(delay_after_timeout)
+
+
+async def _produce(queue, jobs, n_workers):
+    "Feeds the bounded queue, then tells every worker to stop"
+
+    for job in jobs:
+        await queue.put(job)
+    for _ in range(n_workers):
+        await queue.put(None)
+
+
+async def _check_health(pool):
+    "Health-checks the pool every health_interval seconds, off the event loop"
+
+    while True:
+        await asyncio.to_thread(pool.check_health)
+        await asyncio.sleep(pool.health_interval)
+
+
+async def _consume(queue, session, on_result, model, timeout, delay_after_timeout, cache, client_kwargs, pool,
+                   policy):
+    while True:
+        job = await queue.get()
+        if job is None:
+            return
+        options = request_options(job, client_kwargs)
+        response = cache.get(job['messages'], options) if cache else None
+        if response is not None:
+            on_result(job, response, response['time'])
+            continue
+        # the clock starts once a worker owns the job, so time spent
+        # waiting in the queue is not counted as request latency
+        response, execution_time = await _send_async(session, job, model, timeout, options, pool, policy)
+        if cache:
+            cache.put(job['messages'], response, execution_time, options)
+        on_result(job, response, execution_time)
+        if response['error'] == "Timeout":
+            await asyncio.sleep(delay_after_timeout)
+
+
+async def _run_async(jobs, on_result, model, timeout, concurrency, queue_size, delay_after_timeout, cache,
+                     client_kwargs, pool, policy):
+    queue = asyncio.Queue(maxsize=queue_size)
+    # one connection per worker (two when hedging), so a request never waits on the client side
+    connector = aiohttp.TCPConnector(limit=concurrency * (2 if policy and policy.hedge else 1))
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = [asyncio.create_task(_produce(queue, jobs, concurrency))]
+        for _ in range(concurrency):
+            tasks.append(asyncio.create_task(
+                _consume(queue, session, on_result, model, timeout, delay_after_timeout, cache, client_kwargs,
+                         pool, policy)
+            ))
+        health = asyncio.create_task(_check_health(pool)) if pool else None
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks + [health]:
+                if task:
+                    task.cancel()
+
+
+def run_async(jobs, on_result, model, timeout, concurrency=4, queue_size=None, delay_after_timeout=0, cache=None,
+              client_kwargs=None, pool=None, policy=None):
+    """
+    Sends the jobs to ollama with up to `concurrency` requests in flight.
+
+    The server must be started with OLLAMA_NUM_PARALLEL >= concurrency
+    (or, with a pool, concurrency / number of servers), otherwise requests
+    queue on the server and their latency includes that wait. A hedged
+    request briefly takes a second slot. Exceptions raised by on_result
+    stop the run. Responses found in the cache are passed on with the
+    latency they originally took.
+    """
+
+    queue_size = queue_size or 2 * concurrency
+    asyncio.run(_run_async(jobs, on_result, model, timeout, concurrency,
+                           queue_size, delay_after_timeout, cache, client_kwargs, pool, policy))
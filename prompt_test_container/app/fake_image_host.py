@@ -0,0 +1,97 @@
+"""
+fake_image_host.py
+
+Local stand-in for the image host of the dataset, so image_retrieval.py
+can be tested without network access. Serves /images/<id>.jpg, a JPEG
+generated from the media id, and with --csv writes a dataset csv whose
+point.media.path_best urls point at the server. Ids listed in --missing
+answer with a 404, ids in --broken send bytes that are not an image,
+and --error-rate answers that share of requests with a 503.
+
+Usage: python fake_image_host.py --port 8767 --images 50 --csv /tmp/images.csv
+       python image_retrieval.py --csv /tmp/images.csv --n 0 --folder /tmp/images
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import argparse
+import random
+from io import BytesIO
+
+import pandas as pd
+from aiohttp import web
+from PIL import Image
+
+FIRST_ID = 1000
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fake image host for testing image_retrieval.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--images", type=int, default=50, help="number of images, with ids from 1000")
+    parser.add_argument("--size", type=int, nargs=2, default=[1600, 1200], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--missing", type=int, nargs="*", default=[], help="media ids answered with a 404")
+    parser.add_argument("--broken", type=int, nargs="*", default=[], help="media ids served as bytes PIL cannot decode")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--csv", help="write a dataset csv of the images served to this path")
+    return parser.parse_args(argv)
+
+
+def image_bytes(media_id, size):
+    "Returns a JPEG whose colour depends on the media id, so every image differs"
+
+    buffer = BytesIO()
+    color = (media_id * 37 % 256, media_id * 91 % 256, media_id * 13 % 256)
+    Image.new("RGB", tuple(size), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def write_csv(path, base_url, images):
+    "Writes a dataset csv with one labelled row per image, as image_urls reads them"
+
+    media_ids = range(FIRST_ID, FIRST_ID + images)
+    pd.DataFrame({"point.media.id": media_ids,
+                  "point.media.path_best": [f"{base_url}/images/{k}.jpg" for k in media_ids],
+                  "label.name": "Sand"}).to_csv(path, index=False)
+
+
+class FakeImageHost:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(0)
+        self.requests = 0
+
+    @web.middleware
+    async def count(self, request, handler):
+        self.requests += 1
+        if self.random.random() < self.config.error_rate:
+            return web.Response(status=503, text="injected failure")
+        return await handler(request)
+
+    async def image(self, request):
+        media_id = int(request.match_info['id'])
+        if not FIRST_ID <= media_id < FIRST_ID + self.config.images or media_id in self.config.missing:
+            return web.Response(status=404, text="not found")
+        if media_id in self.config.broken:
+            return web.Response(body=b"<html>not an image</html>", content_type="image/jpeg")
+        return web.Response(body=image_bytes(media_id, self.config.size), content_type="image/jpeg")
+
+    async def stats(self, request):
+        return web.json_response({"requests": self.requests})
+
+
+def create_app(config):
+    host = FakeImageHost(config)
+    app = web.Application(middlewares=[host.count])
+    app.router.add_get("/images/{id}.jpg", host.image)
+    app.router.add_get("/stats", host.stats)
+    return app
+
+
+if __name__ == "__main__":
+    config = parse_args()
+    if config.csv:
+        write_csv(config.csv, f"http://{config.host}:{config.port}", config.images)
+    web.run_app(create_app(config), host=config.host, port=config.port)
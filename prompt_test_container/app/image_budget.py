@@ -0,0 +1,106 @@
+"""
+image_budget.py
+
+Downsizes images to a vision-token budget before they are sent to the
+model. Qwen2.5-VL cuts an image into 14x14 pixel patches and merges them
+2x2, so each vision token covers 28x28 pixels and an image costs about
+(width / 28) x (height / 28) tokens of prompt evaluation.
+
+An image over the budget is resized, keeping its aspect ratio, to the
+largest size in multiples of 28 pixels that fits the budget, and saved
+as a JPEG under IMAGE_BUDGET_DIR (./data/image_budget by default), keyed
+by the source file and the budget, so each image is resized once across
+runs. Images within the budget are sent as they are.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import hashlib
+import math
+import os
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+PATCH = 28
+QUALITY = 90
+
+
+def vision_tokens(width, height):
+    "Returns the vision tokens of an image, its sides rounded to multiples of 28 pixels as the model does"
+
+    return max(1, round(width / PATCH)) * max(1, round(height / PATCH))
+
+
+def fit(width, height, max_tokens):
+    "Returns the largest (width, height) in multiples of 28 pixels with the aspect ratio kept and at most max_tokens"
+
+    if vision_tokens(width, height) <= max_tokens:
+        return width, height
+    scale = math.sqrt(max_tokens * PATCH * PATCH / (width * height))
+    columns = max(1, math.floor(width * scale / PATCH))
+    rows = max(1, math.floor(height * scale / PATCH))
+    while columns * rows > max_tokens:
+        if columns >= rows:
+            columns -= 1
+        else:
+            rows -= 1
+    return columns * PATCH, rows * PATCH
+
+
+class ImageBudget:
+    "Disk cache of images resized to a vision-token budget"
+
+    def __init__(self, directory=None, quality=QUALITY):
+        self.directory = Path(directory or os.getenv('IMAGE_BUDGET_DIR', "./data/image_budget"))
+        self.quality = quality
+        self.info = {}
+        self.resized = 0
+        # prepared from the event loop and from the serial client alike
+        self.lock = threading.Lock()
+
+    def key(self, path, max_tokens):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, max_tokens, self.quality)
+
+    def prepare(self, path, max_tokens):
+        """
+        Returns the path to send for image `path` under a budget of
+        max_tokens vision tokens, and its (width, height, tokens)
+        """
+
+        if max_tokens is None:
+            with Image.open(path) as img:
+                width, height = img.size
+            return path, (width, height, vision_tokens(width, height))
+
+        key = self.key(path, max_tokens)
+        with self.lock:
+            if key in self.info:
+                return self.info[key]
+
+        with Image.open(path) as img:
+            size = fit(*img.size, max_tokens)
+            if size == img.size:
+                result = (path, (*size, vision_tokens(*size)))
+            else:
+                digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+                target = self.directory / str(max_tokens) / f"{digest}.jpg"
+                if not target.exists():
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    # JPEGs are decoded at a reduced DCT scale when that still covers the target
+                    img.draft("RGB", size)
+                    tmp = target.with_name(target.name + ".tmp")
+                    img.convert("RGB").resize(size, Image.LANCZOS).save(tmp, format="JPEG", quality=self.quality)
+                    os.replace(tmp, target)
+                    self.resized += 1
+                result = (str(target), (*size, vision_tokens(*size)))
+
+        with self.lock:
+            self.info[key] = result
+        return result
+
+
+image_budget = ImageBudget()
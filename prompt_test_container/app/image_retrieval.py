@@ -3,49 +3,224 @@ image_retrieval.py
 
 Retrieves images from dataset for the app to run.
 
+Images are downloaded by a pool of threads sharing one pooled
+connection session (with timeouts and retries on transient errors),
+and each download is handed to a process pool that decodes, resizes and
+saves it, so the network and the CPU work overlap. Images already saved
+at the right resolution are skipped, and images that fail are recorded
+in a retry manifest; --retry downloads only those.
+
+With --store the downloaded originals are kept in a derivative store
+(derivative_store.py) and every size in --sizes is made from the same
+decode; images already in the store are not downloaded again, only
+exported into the folder at the requested resolution.
+
+The functions can be imported and pointed at any url, e.g. the local
+stand-in fake_image_host.py serving generated test images.
+
+Usage: python image_retrieval.py --csv ./data/train_full.csv --n 0 --folder ./all_images
+
 Author: Aidan Murray
 Date: 2025-09-26
 """
 
-import pandas as pd
-from PIL import Image
-import requests
+import argparse
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from io import BytesIO
 from pathlib import Path
 
+import pandas as pd
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from derivative_store import DerivativeStore, parse_size, render
+
 N = 302
 # RESOLUTION = (128, 128)
 RESOLUTION = (640, 480)
 FOLDER_PATH = Path("./images")
-FOLDER_PATH.mkdir(exist_ok=True)
 DATABASE_PATH = "./data/validation.csv"
+MANIFEST_PATH = Path("./data/image_retry_manifest.json")
+# connect and read timeouts in seconds
+TIMEOUT = (10, 60)
+
+
+def image_urls(database_path, n=N, seed=42):
+    "Returns {media id: url} of a seeded sample of n labelled images of a dataset csv, all of them if n is 0"
+
+    # get the image ids and urls without redundency
+    data = pd.read_csv(database_path)
+    data = data.dropna(subset=['label.name'])
+    data = data[['point.media.id', 'point.media.path_best']].drop_duplicates()
+    sample = data.sample(n=n, random_state=seed) if n else data
+    return {k: v for k, v in zip(sample['point.media.id'], sample['point.media.path_best'])}
+
+
+def is_valid(path, resolution):
+    "True if `path` is an image that opens and has the requested resolution"
+
+    try:
+        with Image.open(path) as img:
+            return img.size == tuple(resolution)
+    except (OSError, ValueError):
+        return False
+
+
+def make_session(pool_size, retries=3):
+    "Returns a session keeping up to pool_size connections per host, retrying transient errors with backoff"
+
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def resize_image(content, path, resolution):
+    "Decodes, resizes and saves an image; runs in the process pool"
+
+    img = Image.open(BytesIO(content))
+    img_resized = img.convert("RGB").resize(tuple(resolution))
+    # written to a hidden file next to the target and renamed, so an interrupted
+    # run never leaves a truncated image that prompts.py would read
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            img_resized.save(f, format="JPEG")
+        # mkstemp makes the file readable by its owner only
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return str(path)
+
+
+def fetch(session, url, timeout=TIMEOUT):
+    "Downloads one image, returning its bytes"
+
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+
+def load_manifest(path=MANIFEST_PATH):
+    "Returns {media id: {'url', 'error'}} of the images that failed last time"
+
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return {int(k): v for k, v in json.loads(path.read_text()).items()}
+
+
+def save_manifest(failed, path=MANIFEST_PATH):
+    path = Path(path)
+    if not failed:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({str(k): v for k, v in failed.items()}, indent=1))
+
+
+def retrieve(urls, folder=FOLDER_PATH, resolution=RESOLUTION, workers=16, processes=None, timeout=TIMEOUT,
+             session=None, store=None, sizes=()):
+    """
+    Downloads {media id: url} into folder/<id>.jpg at `resolution`,
+    skipping images already there (or already in the DerivativeStore
+    `store`, which also gets the `sizes` derivatives). Returns (saved,
+    skipped, failed), failed mapping each media id to its url and error.
+    """
+
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    # temporary files left by an interrupted run
+    for tmp in folder.glob("*.tmp"):
+        tmp.unlink(missing_ok=True)
+    sizes = [tuple(resolution), *[tuple(size) for size in sizes if tuple(size) != tuple(resolution)]]
+    if store is None:
+        todo = {k: v for k, v in urls.items() if not is_valid(folder / f"{k}.jpg", resolution)}
+    else:
+        todo = {k: v for k, v in urls.items() if k not in store}
+    skipped = len(urls) - len(todo)
+    if skipped:
+        print(f"{skipped} images already downloaded, skipping them")
+
+    def download(k, url, processes):
+        content = fetch(session, url, timeout)
+        # the thread waits for its image, so at most one download per thread is held in memory
+        if store is None:
+            return processes.submit(resize_image, content, folder / f"{k}.jpg", resolution).result()
+        sha256 = store.add(k, content, url)
+        targets = store.missing(k, sizes)
+        if targets:
+            store.made(k, processes.submit(render, store.original_path(sha256), targets).result())
+
+    session = session or make_session(workers)
+    failed = {}
+    saved = 0
+    with ProcessPoolExecutor(max_workers=processes) as process_pool, \
+            ThreadPoolExecutor(max_workers=workers) as thread_pool:
+        futures = {thread_pool.submit(download, k, url, process_pool): (k, url) for k, url in todo.items()}
+        for n, future in enumerate(as_completed(futures), 1):
+            k, url = futures[future]
+            try:
+                future.result()
+                saved += 1
+            except Exception as e:
+                # network errors, bad status codes and images PIL cannot decode alike
+                print(f"⚠ Failed to retrieve image {k}: {e}")
+                failed[k] = {"url": url, "error": str(e)}
+            if n % 100 == 0 or n == len(futures):
+                print(f"Downloaded {n} of {len(futures)} images")
+
+    if store is not None:
+        stored = [k for k in urls if k in store]
+        store.generate(sizes, stored, processes)
+        store.export(resolution, folder, stored)
+        store.save()
+    return saved, skipped, failed
 
-# get the image ids and urls without redundency, and sample a random n-values
-data = pd.read_csv(DATABASE_PATH)
-data = data = data.dropna(subset=['label.name'])
-data = data[['point.media.id', 'point.media.path_best']].drop_duplicates()
-sample = data.sample(n=N, random_state=42)
-image_urls = {k:v for k, v in zip(sample['point.media.id'], sample['point.media.path_best'])}
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Downloads and resizes the images of a dataset csv.")
+    parser.add_argument("--csv", default=DATABASE_PATH, help="dataset csv with point.media.id and point.media.path_best")
+    parser.add_argument("--n", type=int, default=N, help="number of images to sample, 0 for all of them")
+    parser.add_argument("--folder", default=str(FOLDER_PATH))
+    parser.add_argument("--resolution", type=int, nargs=2, default=list(RESOLUTION), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--workers", type=int, default=16, help="downloads in flight")
+    parser.add_argument("--processes", type=int, default=None, help="processes decoding and resizing (default all cores)")
+    parser.add_argument("--manifest", default=str(MANIFEST_PATH), help="json file of the images that failed")
+    parser.add_argument("--retry", action="store_true", help="only download the images in the retry manifest")
+    parser.add_argument("--store", help="derivative store keeping the originals, e.g. ./data/image_store")
+    parser.add_argument("--sizes", type=parse_size, nargs="*", default=[],
+                        help="further sizes to make from the same decode when using --store, e.g. 128x128 1280x720")
+    return parser.parse_args()
 
-# download the images at desired resolution
-skipped = []
-no_iters = 0
 
-for id, url in image_urls.items():
-    no_iters += 1
-    print(f"Downloading image {no_iters}")
+def main():
+    args = parse_args()
+    if args.retry:
+        urls = {k: v['url'] for k, v in load_manifest(args.manifest).items()}
+        print(f"retrying {len(urls)} images from {args.manifest}")
+    else:
+        urls = image_urls(args.csv, args.n)
 
-    path = FOLDER_PATH / (str(id) + ".jpg")
-    
-    response = requests.get(url)
-    if response.status_code != 200:
-        print("Failed to retrieve the image.")
-        skipped.append(id)
-        continue
+    store = DerivativeStore(args.store) if args.store else None
+    saved, skipped, failed = retrieve(urls, args.folder, args.resolution, args.workers, args.processes,
+                                      store=store, sizes=args.sizes)
+    save_manifest(failed, args.manifest)
+    if failed:
+        print(f"⚠ {len(failed)} images failed, rerun with --retry to download them ({args.manifest})")
+    print(f"Finished. Successfully downloaded {saved} images ({skipped} already present)")
 
-    img = Image.open(BytesIO(response.content))
-    img_resized = img.resize(RESOLUTION)
-    img_resized.save(path)
 
-print(f"Finished. Successfully downloaded {no_iters - len(skipped)} images")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
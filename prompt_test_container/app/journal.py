@@ -0,0 +1,93 @@
+"""
+journal.py
+
+Append-only JSONL journal of completed (image, prompt) results, so an
+interrupted run of prompts.py can be resumed without redoing inference.
+Extra samples of a request (used by the cascade to measure agreement)
+are journalled with a 'sample' number and kept apart from the answers.
+
+The first line records the config of the run (model, prompts, flags
+changing the answers); a journal is only resumed by a run with the same
+config, so answers of another model or prompt are never reused.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import json
+import os
+from pathlib import Path
+
+
+def read_lines(path):
+    "Yields the records of a journal as written, the config header included"
+
+    if not Path(path).exists():
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # a line cut short by a crash, that request is simply redone
+                continue
+
+
+def read_config(path):
+    "Returns the run config a journal was started with, None if it has none"
+
+    return next((record['config'] for record in read_lines(path) if 'config' in record), None)
+
+
+class Journal:
+    "One json line per completed request, flushed to disk as soon as it is written"
+
+    def __init__(self, path, resume=False, config=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not resume:
+            self.path.unlink(missing_ok=True)
+        if config is not None:
+            # compared as it reads back from json, tuples become lists
+            config = json.loads(json.dumps(config))
+            written = self.config()
+            if written is None and self.records():
+                raise ValueError(f"{self.path} has no run config, start a new run without --resume")
+            if written is not None and written != config:
+                changed = sorted(k for k in written.keys() | config.keys() if written.get(k) != config.get(k))
+                raise ValueError(f"{self.path} was written with a different {', '.join(changed)}, "
+                                 f"start a new run without --resume or use another --output-dir")
+        new = not self.path.exists() or self.path.stat().st_size == 0
+        self.file = open(self.path, "a", encoding="utf-8")
+        if config is not None and new:
+            self.append({"config": config})
+
+    def append(self, record):
+        "Writes a record and makes sure it survives a crash or container restart"
+
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def config(self):
+        "Returns the run config the journal was started with, None if it has none"
+
+        return read_config(self.path)
+
+    def records(self, sample=0):
+        "Returns the journalled records of a sample number, the latest one winning for each (image, prompt)"
+
+        latest = {}
+        for record in read_lines(self.path):
+            if 'config' in record or record.get('sample', 0) != sample:
+                continue
+            latest[(record['image_id'], record['prompt'])] = record
+        return list(latest.values())
+
+    def completed(self, sample=0):
+        "Returns the set of (image_id, prompt) pairs that already have a result"
+
+        return {(r['image_id'], r['prompt']) for r in self.records(sample)}
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,172 @@
+"""
+label_index.py
+
+Ecoregion -> label frequency index built from the training split (the
+csvs add_ecoregions.py writes to data/ecoregions/), used to prune the
+AllowedLabels of a prompt to the labels common in the image's region.
+
+The candidates of a region are its most frequent labels, taken until
+they cover `coverage` of the (image, label) pairs of that region in the
+training split. Images whose region is unknown, or has fewer than
+`min_images` training images, keep the full label list.
+
+The index is kept in a sidecar (<name>.<level>.label_index.json) next to
+the training csv and rebuilt when the csv changes.
+
+Usage: python label_index.py --coverage 0.9 0.95 0.99
+       prints the recall ceiling on the validation split per coverage
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import argparse
+import json
+import os
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from label_store import ID_COLUMN, LABEL_COLUMN, LabelStore, parse_labels, sidecar_path
+
+LEVELS = ("ECOREGION", "PROVINCE", "REALM")
+TRAIN_PATH = "./data/ecoregions/train_partial.csv"
+VAL_PATH = "./data/ecoregions/validation.csv"
+
+
+def read_regions(csv_path, level="ECOREGION"):
+    "Returns the region of each image of a csv written by add_ecoregions.py"
+
+    df = pd.read_csv(csv_path, usecols=[ID_COLUMN, level]).dropna(subset=[level])
+    return df.drop_duplicates(ID_COLUMN).set_index(ID_COLUMN)[level].to_dict()
+
+
+def parse_coverage(value):
+    "Parses the share of a region's labels --prune-labels keeps, in (0, 1]"
+
+    coverage = float(value)
+    if not 0 < coverage <= 1:
+        raise ValueError(f"expected a label coverage in (0, 1], got {value!r}")
+    return coverage
+
+
+class LabelIndex:
+    def __init__(self, level, regions):
+        "regions maps each region to {'images': n, 'labels': {label: images with that label}}"
+
+        self.level = level
+        self.regions = regions
+
+    @classmethod
+    def from_csv(cls, csv_path, level="ECOREGION"):
+        "Counts the images of each label per region, each label once per image"
+
+        df = pd.read_csv(csv_path, usecols=[ID_COLUMN, LABEL_COLUMN, level]).dropna(subset=[LABEL_COLUMN, level])
+        df[LABEL_COLUMN] = df[LABEL_COLUMN].astype(str)
+        parsed = {value: parse_labels(value) for value in df[LABEL_COLUMN].unique()}
+
+        images = defaultdict(set)
+        pairs = set()
+        for media_id, value, region in df[[ID_COLUMN, LABEL_COLUMN, level]].itertuples(index=False, name=None):
+            images[region].add(media_id)
+            pairs.update((region, media_id, label) for label in parsed[value])
+
+        counts = defaultdict(Counter)
+        for region, _, label in pairs:
+            counts[region][label] += 1
+        return cls(level, {region: {"images": len(images[region]), "labels": dict(counts[region])}
+                           for region in images})
+
+    @classmethod
+    def load(cls, csv_path, level="ECOREGION", rebuild=False):
+        "Loads the sidecar of a training csv, (re)building it if it is missing or older than the csv"
+
+        stat = os.stat(csv_path)
+        path = sidecar_path(csv_path, f".{level.lower()}.label_index.json")
+        if not rebuild and path.exists():
+            data = json.loads(path.read_text())
+            if data['source_mtime_ns'] == stat.st_mtime_ns and data['source_size'] == stat.st_size:
+                return cls(data['level'], data['regions'])
+
+        index = cls.from_csv(csv_path, level)
+        path.write_text(json.dumps({"level": level,
+                                    "source_mtime_ns": stat.st_mtime_ns,
+                                    "source_size": stat.st_size,
+                                    "regions": index.regions}))
+        return index
+
+    def candidates(self, region, coverage, min_images=20):
+        """
+        Returns the most frequent labels of a region covering `coverage` of
+        its (image, label) pairs, most frequent first; None if the region
+        is unknown or too small, meaning the full label list is used.
+        """
+
+        if not 0 < coverage <= 1:
+            raise ValueError(f"expected a label coverage in (0, 1], got {coverage}")
+        entry = self.regions.get(region)
+        if entry is None or entry['images'] < min_images or not entry['labels']:
+            return None
+        counts = sorted(entry['labels'].items(), key=lambda item: (-item[1], item[0]))
+        total = sum(count for _, count in counts)
+        kept, covered = [], 0
+        for label, count in counts:
+            if covered >= coverage * total:
+                break
+            kept.append(label)
+            covered += count
+        return kept
+
+
+def recall_ceiling(true_labels, candidates):
+    """
+    Returns the share of true labels still allowed after pruning, over all
+    (image, label) pairs and as the mean per image, and the share of images
+    keeping all their labels. A candidate list of None allows every label.
+    """
+
+    kept, total, per_image = 0, 0, []
+    for labels, allowed in zip(true_labels, candidates):
+        if not labels:
+            continue
+        allowed = set(labels) if allowed is None else set(allowed)
+        n = sum(label in allowed for label in labels)
+        kept += n
+        total += len(labels)
+        per_image.append(n / len(labels))
+    return {"recall_ceiling": kept / total if total else np.nan,
+            "mean_image_recall_ceiling": float(np.mean(per_image)) if per_image else np.nan,
+            "images_fully_covered": float(np.mean([r == 1 for r in per_image])) if per_image else np.nan}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports what pruning the allowed labels by region costs in recall.")
+    parser.add_argument("--train", default=TRAIN_PATH, help="training split with the region columns")
+    parser.add_argument("--validation", default=VAL_PATH, help="split the recall ceiling is measured on")
+    parser.add_argument("--level", choices=LEVELS, default="ECOREGION")
+    parser.add_argument("--coverage", type=parse_coverage, nargs="+", default=[0.8, 0.9, 0.95, 0.99, 1.0])
+    parser.add_argument("--min-images", type=int, default=20)
+    args = parser.parse_args()
+
+    index = LabelIndex.load(args.train, args.level)
+    store = LabelStore.load(args.validation)
+    regions = read_regions(args.validation, args.level)
+    media_ids = store.media_ids.tolist()
+    true_labels = [store.labels(media_id) for media_id in media_ids]
+    print(f"{len(index.regions)} regions ({args.level}) in the training split, "
+          f"{len(store.vocabulary)} labels in the validation split")
+
+    rows = []
+    for coverage in args.coverage:
+        candidates = [index.candidates(regions.get(media_id), coverage, args.min_images) for media_id in media_ids]
+        rows.append({"coverage": coverage,
+                     "fallback_images": sum(c is None for c in candidates),
+                     "mean_allowed_labels": float(np.mean([len(c) for c in candidates if c is not None]))
+                     if any(c is not None for c in candidates) else np.nan,
+                     **recall_ceiling(true_labels, candidates)})
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
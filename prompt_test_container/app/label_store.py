@@ -0,0 +1,181 @@
+"""
+label_store.py
+
+Parses the 'label.name' column of a dataset csv once into integer label
+ids indexed by 'point.media.id', and keeps the result in a binary
+sidecar (<name>.labels.npz) next to the csv so later runs skip parsing.
+
+The split csvs (train / validation / test) hold one stringified tuple
+of labels per image, while combined.csv holds one label per annotated
+point; both end up as the set of labels of each image.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import ast
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ID_COLUMN = 'point.media.id'
+LABEL_COLUMN = 'label.name'
+
+
+def parse_labels(value):
+    "Parses a single 'label.name' cell into a tuple of label names"
+
+    if value[:1] in ("(", "["):
+        return tuple(ast.literal_eval(value))
+    return (value,)
+
+
+def sidecar_path(csv_path, suffix=".labels.npz"):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.stem + suffix)
+
+
+def save_vectors(csv_path, media_ids, vectors, vocabulary):
+    """
+    Saves a multi-hot matrix next to a csv: the rows bit-packed in
+    <name>.vectors.npy, and the media ids and label names they line up
+    with in <name>.vectors.index.npz
+    """
+
+    np.save(sidecar_path(csv_path, ".vectors.npy"), np.packbits(vectors, axis=1))
+    np.savez(sidecar_path(csv_path, ".vectors.index.npz"),
+             media_ids=media_ids,
+             vocabulary=np.array(vocabulary, dtype=str))
+
+
+def load_vectors(csv_path, mmap_mode="r"):
+    """
+    Returns (media_ids, packed, vocabulary) saved by save_vectors. The
+    packed matrix is memory-mapped by default; unpack the rows needed
+    with np.unpackbits(packed, axis=1, count=len(vocabulary)).
+    """
+
+    packed = np.load(sidecar_path(csv_path, ".vectors.npy"), mmap_mode=mmap_mode)
+    with np.load(sidecar_path(csv_path, ".vectors.index.npz")) as index:
+        return index['media_ids'], packed, index['vocabulary'].tolist()
+
+
+class LabelStore:
+    "Labels of each image stored in CSR form: label_ids[indptr[row]:indptr[row + 1]]"
+
+    def __init__(self, media_ids, indptr, label_ids, vocabulary):
+        self.media_ids = media_ids
+        self.indptr = indptr
+        self.label_ids = label_ids
+        self.vocabulary = list(vocabulary)
+        self.rows = {media_id: row for row, media_id in enumerate(media_ids.tolist())}
+
+    @classmethod
+    def from_csv(cls, csv_path, vocabulary=None):
+        """
+        Parses a csv, reading only the id and label columns. Each distinct
+        'label.name' string is parsed once, however many rows share it.
+        Labels missing from `vocabulary` are given ids after it.
+        """
+
+        df = pd.read_csv(csv_path, usecols=[ID_COLUMN, LABEL_COLUMN]).dropna(subset=[LABEL_COLUMN])
+        codes, uniques = pd.factorize(df[LABEL_COLUMN].astype(str))
+        parsed = [parse_labels(u) for u in uniques]
+
+        vocabulary = list(vocabulary) if vocabulary is not None else \
+            sorted({label for labels in parsed for label in labels})
+        label_index = {label: i for i, label in enumerate(vocabulary)}
+        for labels in parsed:
+            for label in labels:
+                if label not in label_index:
+                    label_index[label] = len(vocabulary)
+                    vocabulary.append(label)
+
+        # flatten the parsed strings, then gather the labels of every row
+        unique_lengths = np.array([len(labels) for labels in parsed], dtype=np.int64)
+        unique_offsets = np.concatenate(([0], np.cumsum(unique_lengths)[:-1]))
+        unique_ids = np.array([label_index[label] for labels in parsed for label in labels], dtype=np.int32)
+        row_lengths = unique_lengths[codes]
+        row_starts = np.repeat(unique_offsets[codes], row_lengths)
+        position = np.arange(row_lengths.sum()) - np.repeat(np.cumsum(row_lengths) - row_lengths, row_lengths)
+        pair_labels = unique_ids[row_starts + position]
+
+        media_ids, media_rows = np.unique(df[ID_COLUMN].to_numpy(dtype=np.int64), return_inverse=True)
+        pair_rows = np.repeat(media_rows, row_lengths)
+
+        # drop repeated (image, label) pairs but keep the order labels first appear in
+        _, first = np.unique(pair_rows * len(vocabulary) + pair_labels, return_index=True)
+        first = np.sort(first)
+        pair_rows, pair_labels = pair_rows[first], pair_labels[first]
+        order = np.argsort(pair_rows, kind="stable")
+
+        indptr = np.zeros(len(media_ids) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(pair_rows, minlength=len(media_ids)))
+        return cls(media_ids, indptr, pair_labels[order], vocabulary)
+
+    @classmethod
+    def load(cls, csv_path, rebuild=False):
+        "Loads the sidecar of a csv, (re)building it if it is missing or older than the csv"
+
+        stat = os.stat(csv_path)
+        path = sidecar_path(csv_path)
+        if not rebuild and path.exists():
+            with np.load(path) as data:
+                if data['source_mtime_ns'] == stat.st_mtime_ns and data['source_size'] == stat.st_size:
+                    return cls(data['media_ids'], data['indptr'], data['label_ids'],
+                               data['vocabulary'].tolist())
+
+        store = cls.from_csv(csv_path)
+        np.savez(path,
+                 media_ids=store.media_ids,
+                 indptr=store.indptr,
+                 label_ids=store.label_ids,
+                 vocabulary=np.array(store.vocabulary, dtype=str),
+                 source_mtime_ns=stat.st_mtime_ns,
+                 source_size=stat.st_size)
+        return store
+
+    def __len__(self):
+        return len(self.media_ids)
+
+    def __contains__(self, media_id):
+        return media_id in self.rows
+
+    def ids(self, media_id):
+        "Returns the label ids of an image"
+
+        row = self.rows[media_id]
+        return self.label_ids[self.indptr[row]:self.indptr[row + 1]]
+
+    def labels(self, media_id):
+        "Returns the label names of an image, in the order they appear in the csv"
+
+        return tuple(self.vocabulary[i] for i in self.ids(media_id))
+
+    def multi_hot(self, vocabulary=None, media_ids=None):
+        """
+        Returns a boolean (images x labels) matrix with a column per label
+        in `vocabulary` (the store's own by default); labels outside the
+        vocabulary are left out. Rows follow `media_ids`, or self.media_ids.
+        """
+
+        vocabulary = self.vocabulary if vocabulary is None else list(vocabulary)
+        column = {label: i for i, label in enumerate(vocabulary)}
+        columns = np.array([column.get(label, -1) for label in self.vocabulary], dtype=np.int64)
+
+        if media_ids is None:
+            rows = np.arange(len(self.media_ids))
+        else:
+            rows = np.array([self.rows[media_id] for media_id in media_ids], dtype=np.int64)
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = ends - starts
+        out_rows = np.repeat(np.arange(len(rows)), lengths)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        out_columns = columns[self.label_ids[positions]]
+        keep = out_columns >= 0
+
+        vectors = np.zeros((len(rows), len(vocabulary)), dtype=bool)
+        vectors[out_rows[keep], out_columns[keep]] = True
+        return vectors
@@ -0,0 +1,129 @@
+"""
+metrics.py
+
+Multi-label metrics computed with NumPy on whole (n_samples x n_labels)
+matrices, replacing the per-sample set arithmetic of f1_score_custom.
+Every function also accepts stacked runs, e.g. (n_prompts x n_samples x
+n_labels) predictions against (n_samples x n_labels) ground truth, and
+rows bit-packed with np.packbits (uint8) as saved by vectorize.py.
+
+Empty sets: a sample where both the true and the predicted label sets
+are empty scores `empty_score` (1.0, the two sets agree). A class with
+no predictions has precision `zero_division`, one with no support has
+recall `zero_division`, and one with neither has F1 `zero_division`
+(0.0, as in sklearn).
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import numpy as np
+
+
+def _label(label):
+    # malformed answers can hold None, numbers or nested lists; they become
+    # their repr, so they stay comparable and count as false positives
+    return label if isinstance(label, str) else repr(label)
+
+
+def label_vocabulary(*label_lists):
+    "Returns the sorted labels found in any of the given lists of label lists, non-str labels as their repr"
+
+    return sorted({_label(label) for labels in label_lists for sample in labels for label in sample})
+
+
+def binarize(label_lists, vocabulary):
+    "Returns the boolean (n_samples x n_labels) matrix of label lists over a vocabulary"
+
+    column = {label: i for i, label in enumerate(vocabulary)}
+    rows = [i for i, sample in enumerate(label_lists) for label in map(_label, sample) if label in column]
+    columns = [column[label] for sample in label_lists for label in map(_label, sample) if label in column]
+    matrix = np.zeros((len(label_lists), len(vocabulary)), dtype=bool)
+    matrix[rows, columns] = True
+    return matrix
+
+
+def unpack(packed, n_labels):
+    "Unpacks rows bit-packed with np.packbits back to a boolean matrix"
+
+    return np.unpackbits(packed, axis=-1, count=n_labels).astype(bool)
+
+
+def _divide(numerator, denominator, zero_division):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.full(np.broadcast(numerator, denominator).shape, zero_division, dtype=np.float64)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def _sample_counts(y_true, y_pred):
+    "Returns |true & pred|, |true| and |pred| per sample, counting set bits of packed rows directly"
+
+    if y_true.dtype == np.uint8 and y_pred.dtype == np.uint8:
+        count = lambda m: np.bitwise_count(m).sum(axis=-1, dtype=np.int64)
+    else:
+        y_true, y_pred = y_true.astype(bool), y_pred.astype(bool)
+        count = lambda m: m.sum(axis=-1, dtype=np.int64)
+    return count(y_true & y_pred), count(y_true), count(y_pred)
+
+
+def sample_f1(y_true, y_pred, empty_score=1.0):
+    "F1 score of each sample, 2|T & P| / (|T| + |P|)"
+
+    tp, n_true, n_pred = _sample_counts(y_true, y_pred)
+    return _divide(2 * tp, n_true + n_pred, empty_score)
+
+
+def sample_jaccard(y_true, y_pred, empty_score=1.0):
+    "Jaccard index of each sample, |T & P| / |T | P|"
+
+    tp, n_true, n_pred = _sample_counts(y_true, y_pred)
+    return _divide(tp, n_true + n_pred - tp, empty_score)
+
+
+def class_counts(y_true, y_pred, n_labels=None):
+    "Returns true positives, false positives and false negatives of each class, summed over samples"
+
+    if n_labels is not None:
+        y_true, y_pred = unpack(y_true, n_labels), unpack(y_pred, n_labels)
+    y_true, y_pred = y_true.astype(bool), y_pred.astype(bool)
+    tp = (y_true & y_pred).sum(axis=-2, dtype=np.int64)
+    fp = (~y_true & y_pred).sum(axis=-2, dtype=np.int64)
+    fn = (y_true & ~y_pred).sum(axis=-2, dtype=np.int64)
+    return tp, fp, fn
+
+
+def per_class(y_true, y_pred, n_labels=None, zero_division=0.0):
+    "Returns precision, recall, F1 and support of each class"
+
+    tp, fp, fn = class_counts(y_true, y_pred, n_labels)
+    precision = _divide(tp, tp + fp, zero_division)
+    recall = _divide(tp, tp + fn, zero_division)
+    f1 = _divide(2 * tp, 2 * tp + fp + fn, zero_division)
+    return precision, recall, f1, tp + fn
+
+
+def summary(y_true, y_pred, n_labels=None, zero_division=0.0, empty_score=1.0):
+    """
+    Returns micro, macro and support-weighted precision / recall / F1
+    plus the mean per-sample F1 and Jaccard, each with the leading run
+    dimensions of the inputs
+    """
+
+    tp, fp, fn = class_counts(y_true, y_pred, n_labels)
+    precision, recall, f1, support = per_class(y_true, y_pred, n_labels, zero_division)
+    weights = _divide(support, support.sum(axis=-1, keepdims=True), 0.0)
+
+    tp_all, fp_all, fn_all = tp.sum(axis=-1), fp.sum(axis=-1), fn.sum(axis=-1)
+    return {"micro_precision": _divide(tp_all, tp_all + fp_all, zero_division),
+            "micro_recall": _divide(tp_all, tp_all + fn_all, zero_division),
+            "micro_f1": _divide(2 * tp_all, 2 * tp_all + fp_all + fn_all, zero_division),
+            "macro_precision": precision.mean(axis=-1),
+            "macro_recall": recall.mean(axis=-1),
+            "macro_f1": f1.mean(axis=-1),
+            "weighted_precision": (precision * weights).sum(axis=-1),
+            "weighted_recall": (recall * weights).sum(axis=-1),
+            "weighted_f1": (f1 * weights).sum(axis=-1),
+            "samples_f1": sample_f1(y_true, y_pred, empty_score).mean(axis=-1),
+            "samples_jaccard": sample_jaccard(y_true, y_pred, empty_score).mean(axis=-1)}
@@ -0,0 +1,234 @@
+"""
+mock_ollama.py
+
+Local stand-in for the ollama server, so the client code can be tested
+and benchmarked without a model container. Implements /api/chat
+(streaming and non-streaming) and /api/tags with configurable latency,
+token rates, parallel slots and error / timeout injection, plus
+/api/create, /api/delete and /api/ps so model variants can be created.
+
+With --prefix-cache each slot remembers the messages of its last
+request, like the KV cache of an ollama runner: a request is given the
+free slot sharing the longest prefix of messages with it, and only the
+tokens after that prefix are evaluated (and reported in
+prompt_eval_count).
+
+Images are counted as the vision tokens of their resolution (28x28
+pixels per token), so downsized images evaluate faster.
+
+Requests sampled with a temperature above 0 sometimes answer with fewer
+labels than the greedy answer, so sampling agreement can be tested.
+
+Usage: python mock_ollama.py --port 11435 --latency-ms 200 --parallel 4
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import random
+import time
+from io import BytesIO
+
+from aiohttp import web
+from PIL import Image
+
+from image_budget import vision_tokens
+
+ANSWER = "['Crustose coralline algae', 'Sponges (encrusting)']"
+COT_ANSWER = ("{'reasoning': 'There is a pink crust covering the rock.', "
+              "'labels': ['Crustose coralline algae']}")
+# qwen2.5-vl turns a 640x480 image into roughly this many vision tokens
+IMAGE_TOKENS = 391
+
+
+def image_tokens(image):
+    "Returns the vision tokens of a base64 image, IMAGE_TOKENS if it cannot be read"
+
+    try:
+        with Image.open(BytesIO(base64.b64decode(image))) as img:
+            return vision_tokens(*img.size)
+    except (OSError, ValueError, binascii.Error):
+        return IMAGE_TOKENS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock ollama server for tests and benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--model", nargs="+", default=["Benthiq:3b"], help="models the server has pulled")
+    parser.add_argument("--latency", choices=("constant", "uniform", "lognormal"), default="lognormal",
+                        help="distribution of the prompt-eval latency of a request")
+    parser.add_argument("--latency-ms", type=float, default=200,
+                        help="median prompt-eval latency in milliseconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.25,
+                        help="spread of the lognormal / uniform latency, relative to the median")
+    parser.add_argument("--tokens-per-s", type=float, default=200,
+                        help="generation rate")
+    parser.add_argument("--prompt-tokens-per-s", type=float, default=0,
+                        help="prompt evaluation rate, added to the latency; 0 leaves it out")
+    parser.add_argument("--prefix-cache", action="store_true",
+                        help="reuse the evaluated prefix of the previous request of the same slot")
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="requests processed at once, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0,
+                        help="fraction of requests that hang for --hang-s seconds")
+    parser.add_argument("--hang-s", type=float, default=3600)
+    parser.add_argument("--trailing-text", default=" These labels were chosen because they are visible.",
+                        help="text generated after the answer, cut off by streaming clients")
+    parser.add_argument("--sample-disagreement", type=float, default=0.3,
+                        help="chance that a request with temperature > 0 leaves out the last label")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+class MockOllama:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.slots = asyncio.Semaphore(config.parallel)
+        self.free_slots = list(range(config.parallel))
+        self.slot_cache = [[] for _ in range(config.parallel)]
+        self.requests = 0
+        self.models = set(config.model)
+        self.loaded = None
+
+    def latency(self):
+        "Samples the prompt-eval latency of one request, in seconds"
+
+        median = self.config.latency_ms / 1000
+        sigma = self.config.latency_sigma
+        if self.config.latency == "constant":
+            return median
+        if self.config.latency == "uniform":
+            return self.random.uniform(median * (1 - sigma), median * (1 + sigma))
+        return self.random.lognormvariate(0, sigma) * median
+
+    def answer(self, body):
+        "Returns the text to generate, as a list of ~4 character tokens"
+
+        first = body['messages'][0].get('content') or ""
+        text = COT_ANSWER if "reasoning" in first else ANSWER
+        # sampled answers do not always agree with the greedy one
+        temperature = (body.get('options') or {}).get('temperature', 0)
+        if temperature > 0 and text == ANSWER and self.random.random() < self.config.sample_disagreement:
+            text = "['Crustose coralline algae']"
+        if body.get('format') is None:
+            text += self.config.trailing_text
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def take_slot(self, sequence):
+        "Takes the free slot whose cached messages share the longest prefix with the request"
+
+        def common(slot):
+            n = 0
+            for cached, message in zip(self.slot_cache[slot], sequence):
+                if cached != message:
+                    break
+                n += 1
+            return n
+
+        slot = max(self.free_slots, key=common)
+        self.free_slots.remove(slot)
+        # the last message is always evaluated, as in ollama
+        return slot, min(common(slot), len(sequence) - 1) if self.config.prefix_cache else 0
+
+    async def tags(self, request):
+        return web.json_response({"models": [{"name": name, "model": name,
+                                              "digest": hashlib.sha1(name.encode()).hexdigest()}
+                                             for name in sorted(self.models)]})
+
+    async def create(self, request):
+        body = await request.json()
+        self.models.add(body['model'])
+        return web.json_response({"status": "success"})
+
+    async def delete(self, request):
+        body = await request.json()
+        self.models.discard(body['model'])
+        return web.json_response({})
+
+    async def ps(self, request):
+        models = [{"name": self.loaded, "model": self.loaded, "size": 4 * 1024 ** 3}] if self.loaded else []
+        return web.json_response({"models": models})
+
+    async def chat(self, request):
+        body = await request.json()
+        if body['model'] not in self.models:
+            return web.json_response({"error": f"model '{body['model']}' not found"}, status=404)
+        self.requests += 1
+        self.loaded = body['model']
+        if self.random.random() < self.config.error_rate:
+            return web.json_response({"error": "injected failure"}, status=500)
+        if self.random.random() < self.config.timeout_rate:
+            await asyncio.sleep(self.config.hang_s)
+
+        async with self.slots:
+            start = time.perf_counter()
+            sequence = [(hashlib.sha1(json.dumps(m, sort_keys=True).encode()).hexdigest(),
+                         len(m.get('content') or "") // 4 + sum(map(image_tokens, m.get('images', []))))
+                        for m in body['messages']]
+            slot, cached = self.take_slot(sequence)
+            try:
+                prompt_tokens = sum(tokens for _, tokens in sequence[cached:])
+                prompt_eval = self.latency()
+                if self.config.prompt_tokens_per_s:
+                    prompt_eval += prompt_tokens / self.config.prompt_tokens_per_s
+                await asyncio.sleep(prompt_eval)
+                return await self.generate(request, body, start, prompt_tokens, prompt_eval)
+            finally:
+                self.slot_cache[slot] = sequence
+                self.free_slots.append(slot)
+
+    async def generate(self, request, body, start, prompt_tokens, prompt_eval):
+        tokens = self.answer(body)
+        token_time = 1 / self.config.tokens_per_s
+
+        def final(eval_count):
+            return {"model": body['model'], "done": True,
+                    "total_duration": int((time.perf_counter() - start) * 1e9),
+                    "load_duration": 1_000_000,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prompt_eval * 1e9),
+                    "eval_count": eval_count,
+                    "eval_duration": int(eval_count * token_time * 1e9)}
+
+        if not body.get('stream', True):
+            await asyncio.sleep(len(tokens) * token_time)
+            return web.json_response({"message": {"role": "assistant", "content": "".join(tokens)},
+                                      **final(len(tokens))})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for token in tokens:
+            await asyncio.sleep(token_time)
+            chunk = {"model": body['model'], "done": False,
+                     "message": {"role": "assistant", "content": token}}
+            await response.write((json.dumps(chunk) + "\n").encode())
+        await response.write((json.dumps({"message": {"role": "assistant", "content": ""},
+                                          **final(len(tokens))}) + "\n").encode())
+        return response
+
+
+def create_app(config):
+    mock = MockOllama(config)
+    app = web.Application(client_max_size=256 * 1024 ** 2)
+    app.router.add_get("/api/tags", mock.tags)
+    app.router.add_post("/api/chat", mock.chat)
+    app.router.add_post("/api/create", mock.create)
+    app.router.add_delete("/api/delete", mock.delete)
+    app.router.add_get("/api/ps", mock.ps)
+    app['mock'] = mock
+    return app
+
+
+if __name__ == "__main__":
+    config = parse_args()
+    web.run_app(create_app(config), host=config.host, port=config.port)
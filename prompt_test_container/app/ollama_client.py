@@ -0,0 +1,291 @@
+"""
+ollama_client.py
+
+Helper functions for calling the ollama chat API from prompts.py, both
+blocking (requests) and concurrent (asyncio / aiohttp).
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import ast
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+import numpy as np
+import requests
+
+from image_budget import image_budget
+from payload_cache import payload_cache
+from timings import extract_timings
+
+# OLLAMA_URL may list several servers separated by commas (see endpoint_pool.py),
+# requests without an explicit url go to the first
+OLLAMA_URL = (os.getenv('OLLAMA_URL') or "").split(",")[0].strip() or None
+HEADERS = {
+    "Content-Type": "application/json"
+}
+
+
+def api_base(url=None):
+    "Returns the server address of an /api/chat url"
+
+    url = url or OLLAMA_URL
+    return url.split("/api/")[0]
+
+
+def model_digest(model, url=None):
+    "Returns the digest ollama reports for a model in /api/tags, or None if it is unavailable"
+
+    try:
+        response = requests.get(api_base(url) + "/api/tags", timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    names = {model.lower(), f"{model.lower()}:latest"}
+    for m in response.json().get('models', []):
+        if m.get('name', '').lower() in names or m.get('model', '').lower() in names:
+            return m.get('digest')
+    return None
+
+
+def wait_until_ready(model, url=None, timeout=600, interval=2):
+    "Polls ollama until it answers and lists `model`, returns False if it is not ready within `timeout` seconds"
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if model_digest(model, url) is not None:
+            return True
+        time.sleep(interval)
+    return False
+
+
+def encode_messages(messages, image_tokens=None):
+    """
+    Returns a copy of the messages with image paths replaced by base64
+    strings, images over `image_tokens` vision tokens being downsized first
+    """
+
+    new_messages = []
+    for m in messages:
+        m = m.copy()
+        if 'images' in m:
+            paths = m['images']
+            if image_tokens is not None:
+                paths = [image_budget.prepare(img_path, image_tokens)[0] for img_path in paths]
+            m['images'] = [payload_cache.get(img_path) for img_path in paths]
+        new_messages.append(m)
+    return new_messages
+
+
+def build_payload(messages, model, stream=False, format=None, keep_alive=None, options=None, image_tokens=None):
+    """
+    Builds the json body of an /api/chat request, `format` being an
+    optional json schema for the answer, `keep_alive` how long ollama
+    keeps the model (and its prompt cache) loaded afterwards, e.g. "30m" or -1,
+    `options` model parameters overriding the Modelfile, e.g. {"temperature": 0.7},
+    and `image_tokens` a vision-token budget the images are downsized to (see image_budget.py)
+    """
+
+    payload = {
+        "model": model,
+        "messages": encode_messages(messages, image_tokens),
+        "stream": stream
+    }
+    if format is not None:
+        payload["format"] = format
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    if options is not None:
+        payload["options"] = options
+    return json.dumps(payload)
+
+
+def answer_end(text, answer="list"):
+    """
+    Returns the index just past a whole, parseable label list in `text`,
+    or for answer="dict" past the {'reasoning': ..., 'labels': [...]} dict
+    of the CoT prompt; None while the answer is still incomplete
+    """
+
+    start = text.find("[" if answer == "list" else "{")
+    if start < 0:
+        return None
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == quote:
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c in "[{":
+            depth += 1
+        elif c in "]}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    parsed = ast.literal_eval(text[start:i + 1])
+                except (ValueError, SyntaxError):
+                    return None
+                if answer == "list" and isinstance(parsed, list) \
+                        or answer == "dict" and isinstance(parsed, dict) and 'labels' in parsed:
+                    return i + 1
+                return None
+    return None
+
+
+class StreamReader:
+    "Accumulates the NDJSON chunks of a streamed response and times every token"
+
+    def __init__(self, start_time, answer="list", early_stop=True):
+        self.start_time = start_time
+        self.answer = answer
+        self.early_stop = early_stop
+        self.text = ""
+        self.token_times = []
+        self.final = None
+        self.stopped_early = False
+
+    def feed(self, line):
+        "Adds one chunk, returns True when the response is finished or already complete"
+
+        if not line.strip():
+            return False
+        chunk = json.loads(line)
+        if 'error' in chunk:
+            raise ValueError(chunk['error'])
+        content = chunk.get('message', {}).get('content', "")
+        if content:
+            self.token_times.append(time.perf_counter())
+            self.text += content
+        if chunk.get('done'):
+            self.final = chunk
+            return True
+        # only a closing bracket can complete the answer
+        if self.early_stop and ("]" in content or "}" in content):
+            end = answer_end(self.text, self.answer)
+            if end is not None:
+                self.text = self.text[:end]
+                self.stopped_early = True
+                return True
+        return False
+
+    def result(self):
+        gaps = np.diff(self.token_times)
+        stream = {"ttft": self.token_times[0] - self.start_time if self.token_times else None,
+                  "itl_mean": float(gaps.mean()) if len(gaps) else None,
+                  "itl_p50": float(np.percentile(gaps, 50)) if len(gaps) else None,
+                  "itl_p95": float(np.percentile(gaps, 95)) if len(gaps) else None,
+                  "chunks": len(self.token_times),
+                  "stopped_early": self.stopped_early}
+        # ollama only sends its timing breakdown in the final chunk
+        return {"message": self.text,
+                "error": None,
+                "timings": extract_timings(self.final) if self.final else None,
+                "stream": stream}
+
+
+def call_ollama_api(messages, model='qwen2.5vl:3b', timeout=120, delay=10, max_retries=3, url=None,
+                    stream=False, answer="list", format=None, keep_alive=None, options=None,
+                    image_tokens=None):
+    """
+    Sends a chat request to ollama. With stream=True the answer is read
+    chunk by chunk, time-to-first-token and inter-token latency are
+    recorded, and the request is closed as soon as the answer is complete.
+    A json schema given as `format` constrains what the model can generate.
+    """
+
+    url = url or OLLAMA_URL
+    data = build_payload(messages, model, stream, format, keep_alive, options, image_tokens)
+
+    retries = 0
+    while retries < max_retries:
+        try:
+            start_time = time.perf_counter()
+            response = requests.post(url, headers=HEADERS, data=data, timeout=timeout, stream=stream)
+            response.raise_for_status()
+            if not stream:
+                body = response.json()
+                return {"message": body['message']['content'],
+                        "error": None,
+                        "timings": extract_timings(body)}
+
+            reader = StreamReader(start_time, answer)
+            # closing the connection early makes ollama stop generating
+            with response:
+                for line in response.iter_lines():
+                    if reader.feed(line):
+                        break
+                    if time.perf_counter() - start_time > timeout:
+                        raise requests.Timeout()
+            return reader.result()
+
+        except requests.Timeout:
+            print(f"⚠ Request timed out after {timeout} seconds.")
+            return {"error": "Timeout",
+                    "message": None}
+
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠ Request failed: {e}")
+            retries += 1
+            if retries < max_retries:
+                print("Retrying ...")
+                time.sleep(delay)
+                continue
+            return {"error": str(e),
+                    "message": None}
+
+
+async def call_ollama_api_async(session, messages, model='qwen2.5vl:3b', timeout=120, delay=10, max_retries=3, url=None,
+                                stream=False, answer="list", format=None, keep_alive=None, options=None,
+                                image_tokens=None):
+    "Same as call_ollama_api, but sends the request through an aiohttp session"
+
+    url = url or OLLAMA_URL
+    data = build_payload(messages, model, stream, format, keep_alive, options, image_tokens)
+
+    retries = 0
+    while retries < max_retries:
+        try:
+            start_time = time.perf_counter()
+            async with session.post(url, headers=HEADERS, data=data,
+                                    timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                response.raise_for_status()
+                if not stream:
+                    body = await response.json(content_type=None)
+                    return {"message": body['message']['content'],
+                            "error": None,
+                            "timings": extract_timings(body)}
+
+                reader = StreamReader(start_time, answer)
+                async for line in response.content:
+                    if reader.feed(line):
+                        break
+                if not reader.final:
+                    response.close()
+                return reader.result()
+
+        except asyncio.TimeoutError:
+            print(f"⚠ Request timed out after {timeout} seconds.")
+            return {"error": "Timeout",
+                    "message": None}
+
+        except (aiohttp.ClientError, ValueError) as e:
+            print(f"⚠ Request failed: {e}")
+            retries += 1
+            if retries < max_retries:
+                print("Retrying ...")
+                await asyncio.sleep(delay)
+                continue
+            return {"error": str(e),
+                    "message": None}
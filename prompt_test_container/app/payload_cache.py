@@ -0,0 +1,81 @@
+"""
+payload_cache.py
+
+In-memory LRU cache of base64 encoded images, so each image sent to
+ollama is read from disk and encoded once per run.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import base64
+import os
+import time
+from collections import OrderedDict
+
+
+class PayloadCache:
+    "LRU cache of base64 image payloads keyed by path, mtime and size"
+
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_read = 0
+        self.bytes_saved = 0
+        self.encode_seconds = 0.0
+
+    def key(self, path):
+        "A modified or replaced file gets a new key, so stale payloads are never served"
+
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path):
+        "Returns the base64 string of the image at path"
+
+        key = self.key(path)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += key[2]
+            return self.entries[key]
+
+        start_time = time.perf_counter()
+        with open(path, "rb") as f:
+            img_bytes = f.read()
+        encoded = base64.b64encode(img_bytes).decode("utf-8")
+        self.encode_seconds += time.perf_counter() - start_time
+        self.misses += 1
+        self.bytes_read += len(img_bytes)
+
+        # payloads bigger than the whole cache are served but not kept
+        if len(encoded) <= self.max_bytes:
+            self.entries[key] = encoded
+            self.size += len(encoded)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        return encoded
+
+    def stats(self):
+        "Returns the hit / miss and byte counters of the cache"
+
+        lookups = self.hits + self.misses
+        mean_encode = self.encode_seconds / self.misses if self.misses else 0.0
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "cached_bytes": self.size,
+                "disk_bytes_read": self.bytes_read,
+                "disk_bytes_saved": self.bytes_saved,
+                "encode_seconds": self.encode_seconds,
+                "encode_seconds_saved": self.hits * mean_encode}
+
+
+payload_cache = PayloadCache(int(os.getenv('PAYLOAD_CACHE_MB', 512)) * 1024 ** 2)
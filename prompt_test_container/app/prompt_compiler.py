@@ -0,0 +1,90 @@
+"""
+prompt_compiler.py
+
+Renders the prompt templates of prompts.py with either the full label
+names or short label codes. In code mode AllowedLabels becomes a legend
+of "L7: Sand" lines and the model is asked to answer with the codes,
+which are shorter to generate than the names; decode() maps them back
+to the canonical label names before scoring.
+
+Templates are string.Template strings with the fields $allowed_labels,
+$example and $cot_example (the label lists of the output examples).
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+from string import Template
+
+EXAMPLE = ['Crustose coralline algae', 'Sponges (encrusting)']
+COT_EXAMPLE = ['Turfing algae (<2 cm high algal/sediment mat on rock)', 'Medium foliose red algae']
+CODE_NOTE = ("Each line of AllowedLabels is a label code followed by its label name. "
+             "Answer with the label codes only, never with the label names.")
+
+
+class PromptCompiler:
+    def __init__(self, label_names, allowed_labels=None, codes=False, prefix="L"):
+        """
+        label_names are the labels the model may answer with, allowed_labels
+        the text listing them in name mode (str(label_names) by default)
+        """
+
+        self.label_names = list(label_names)
+        self.codes = codes
+        self.prefix = prefix
+        self.code_of = {name: f"{prefix}{i}" for i, name in enumerate(sorted(self.label_names), 1)}
+        self.name_of = {code.lower(): name for name, code in self.code_of.items()}
+        self.names_text = allowed_labels if allowed_labels is not None else str(self.label_names)
+
+    @property
+    def mode(self):
+        return "codes" if self.codes else "names"
+
+    def output_labels(self):
+        "Returns what the model answers with: the codes, or the label names"
+
+        return [self.code_of[name] for name in self.label_names] if self.codes else list(self.label_names)
+
+    def allowed_labels(self):
+        if not self.codes:
+            return self.names_text
+        legend = "\n".join(f"{self.code_of[name]}: {name}" for name in self.label_names)
+        return legend + "\n" + CODE_NOTE
+
+    def encode(self, labels):
+        "Returns the labels as the model should answer them; labels without a code are left out in code mode"
+
+        if not self.codes:
+            return list(labels)
+        return [self.code_of[label] for label in labels if label in self.code_of]
+
+    def decode(self, labels):
+        "Maps codes in an answer back to label names, case-insensitively; anything else is kept as it is"
+
+        if not self.codes:
+            return list(labels)
+        return [self.name_of.get(label.strip().lower(), label) if isinstance(label, str) else label
+                for label in labels]
+
+    def example(self, labels):
+        "Returns an output example, made of the first codes if none of its labels are in the dataset"
+
+        encoded = self.encode(labels)
+        if self.codes and not encoded:
+            encoded = sorted(self.code_of.values(), key=lambda code: int(code[len(self.prefix):]))[:len(labels)]
+        return str(encoded)
+
+    def restrict(self, labels):
+        "Returns a compiler listing only `labels` (in this compiler's order), keeping this compiler's codes"
+
+        labels = set(labels)
+        subset = [name for name in self.label_names if name in labels]
+        compiler = PromptCompiler(subset, str(subset), codes=self.codes, prefix=self.prefix)
+        compiler.code_of = {name: self.code_of[name] for name in subset}
+        compiler.name_of = self.name_of
+        return compiler
+
+    def render(self, template):
+        return Template(template).substitute(allowed_labels=self.allowed_labels(),
+                                             example=self.example(EXAMPLE),
+                                             cot_example=self.example(COT_EXAMPLE))
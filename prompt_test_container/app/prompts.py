@@ -13,80 +13,126 @@ Date: 2025-06-03
 print("Initialising prompts.py ...")
 import numpy as np
 import pandas as pd
+from functools import lru_cache
 from pathlib import Path
 import ast
+import hashlib
 import warnings
-from f1_score_custom import f1_score
+from metrics import label_vocabulary, binarize, sample_f1
+from timings import FIELDS as TIMING_FIELDS, LOAD_EVENT_MS, summarise as summarise_timings, latency_percentiles
 import os
+import sys
+import argparse
 import time
-import requests
-import json
-import base64
-
-def call_ollama_api(messages, model='qwen2.5vl:3b', timeout=120, delay=10, max_retries=3):
-    headers = {
-        "Content-Type": "application/json"
-    }
-
-    new_messages = []
-    for m in messages:
-        m = m.copy()
-        if 'images' in m:
-            encoded_images = []
-            for img_path in m['images']:
-                with open(img_path, "rb") as f:
-                    img_bytes = f.read()
-                encoded = base64.b64encode(img_bytes).decode("utf-8")
-                encoded_images.append(encoded)
-            m['images'] = encoded_images
-        new_messages.append(m)
-
-
-    payload = {
-        "model": model,
-        "messages": new_messages,
-        "stream": False
-    }
-    retries = 0
-    while retries < max_retries:
-        try:
-            response = requests.post(OLLAMA_URL, headers=headers, data=json.dumps(payload), timeout=timeout)
-            response.raise_for_status()
-            return {"message": response.json()['message']['content'],
-                    "error": None}
-        
-        except requests.Timeout:
-            print(f"⚠ Request timed out after {timeout} seconds.")
-            return {"error": "Timeout",
-                    "message": None}
-        
-        except requests.RequestException as e:
-            print(f"⚠ Request failed: {e}")
-            retries += 1
-            if retries < max_retries:
-                print("Retrying ...")
-                time.sleep(delay)
-                continue
-            return {"error": str(e),
-                    "message": None}
-
+from evaluation import run_serial, run_async, warm_up
+from image_budget import PATCH, image_budget
+from payload_cache import payload_cache
+from journal import Journal
+from label_store import LabelStore
+from response_cache import ResponseCache
+from ollama_client import model_digest, wait_until_ready
+from endpoint_pool import EndpointPool
+from request_policy import RequestPolicy
+from structured_output import LabelParser, label_schema
+from prompt_compiler import PromptCompiler
+from label_index import LEVELS, LabelIndex, parse_coverage, read_regions, recall_ceiling
+from cascade import REASONS, escalation_reason, read_baseline
+from shards import find_shards, merge_journals, parse_shard, read_run_stats, shard_dir, shard_items
+
+parser = argparse.ArgumentParser(description="Tests each prompt against the model served by ollama.")
+parser.add_argument("--concurrency", type=int, default=int(os.getenv('CONCURRENCY', 1)),
+                    help="number of requests in flight, 1 sends the requests one at a time")
+parser.add_argument("--queue-size", type=int, default=None,
+                    help="maximum number of requests waiting for a free slot (default 2 x concurrency)")
+parser.add_argument("--resume", action="store_true",
+                    help="skip the (image, prompt) pairs already in the journal instead of starting a new run")
+parser.add_argument("--stream", action="store_true",
+                    help="stream the answers, recording time-to-first-token and stopping once the label list is complete")
+parser.add_argument("--structured", action="store_true",
+                    help="constrain the answers with a json schema of the allowed labels and parse them tolerantly")
+parser.add_argument("--response-cache", default=os.getenv('RESPONSE_CACHE_DIR'),
+                    help="directory of the on-disk response cache, no cache is used if unset")
+parser.add_argument("--bypass-response-cache", action="store_true",
+                    help="send every request to ollama, but still store the answers in the cache")
+parser.add_argument("--invalidate-response-cache", action="store_true",
+                    help="delete the cached responses of the models of this run before it starts")
+parser.add_argument("--timeout-factor", type=float, default=3.0,
+                    help="timeout of a request as a multiple of the p99 latency of its prompt")
+parser.add_argument("--prefix-reuse", action="store_true",
+                    help="send the requests prompt by prompt, keep the model loaded and keep each prompt on one server, "
+                         "so ollama can reuse the cached few-shot demonstrations")
+parser.add_argument("--warmup", type=int, default=2,
+                    help="untimed requests sent to each server before the run, so the model is loaded")
+parser.add_argument("--hedge", action="store_true",
+                    help="duplicate requests still running after the p95 latency of their prompt (concurrent runs only)")
+parser.add_argument("--model", default=os.getenv('OLLAMA_MODEL', "Benthiq:3b"),
+                    help="ollama model to evaluate")
+parser.add_argument("--prompts", type=int, nargs="+", default=None,
+                    help="evaluate only these prompts (0-4)")
+parser.add_argument("--limit", type=int, default=None,
+                    help="evaluate only the first N images of the seeded shuffle")
+parser.add_argument("--label-codes", action="store_true",
+                    help="list the labels as short codes in the prompts and have the model answer with the codes")
+parser.add_argument("--prune-labels", type=parse_coverage, default=None, metavar="COVERAGE",
+                    help="list only the labels of the image's region covering this share of its training labels")
+parser.add_argument("--prune-level", choices=LEVELS, default="ECOREGION",
+                    help="region the labels are pruned by")
+parser.add_argument("--prune-min-images", type=int, default=20,
+                    help="regions with fewer training images keep the full label list")
+parser.add_argument("--cascade", default=os.getenv('CASCADE_MODEL'), metavar="MODEL",
+                    help="larger model the answers of --model are escalated to when they fail, are empty or "
+                         "Unscorable, or disagree with a second sample")
+parser.add_argument("--cascade-agreement", type=float, default=None,
+                    help="sample each answer twice and escalate when the label sets overlap less than this (Jaccard)")
+parser.add_argument("--cascade-temperature", type=float, default=0.7,
+                    help="temperature of the second sample")
+parser.add_argument("--cascade-baseline", nargs="+", default=[],
+                    help="output directories of single-model runs the cascade is compared with")
+parser.add_argument("--shard", type=parse_shard, default=None, metavar="I/N",
+                    help="evaluate only shard I (from 0) of N, writing to <output-dir>/shard_I_of_N")
+parser.add_argument("--merge", action="store_true",
+                    help="combine the shards in --output-dir into the outputs of a single run, without ollama")
+parser.add_argument("--image-tokens", type=int, default=int(os.getenv('IMAGE_TOKENS', 0)) or None, metavar="N",
+                    help="downsize images to at most N vision tokens (28x28 pixels each) before sending them")
+parser.add_argument("--image-pixels", type=int, default=None, metavar="N",
+                    help="same as --image-tokens, as a budget of pixels")
+parser.add_argument("--output-dir", default="./data/output",
+                    help="directory the results are written to")
+args = parser.parse_args()
+if args.image_pixels:
+    args.image_tokens = max(1, args.image_pixels // PATCH ** 2)
 
 np.random.seed(42)
-OLLAMA_URL = os.getenv('OLLAMA_URL')
 N_DEMOS = 2
 TIMEOUT = 600
-OUTPUT_PATH = Path("./data/output")
+OUTPUT_PATH = Path(args.output_dir)
+if args.shard:
+    OUTPUT_PATH = shard_dir(OUTPUT_PATH, *args.shard)
 DATASET_PATH = "./data/combined.csv"
 VAL_PATH = "./data/validation.csv"
+TRAIN_REGIONS_PATH = "./data/ecoregions/train_partial.csv"
+VAL_REGIONS_PATH = "./data/ecoregions/validation.csv"
 FOLDER_PATH = Path('./images')
-DELAY = 10
+MODEL = args.model
+KEEP_ALIVE = -1
+RESPONSE_CACHE_MB = int(os.getenv('RESPONSE_CACHE_MB', 1024))
 
 # get annotations
-annotations = pd.read_csv(DATASET_PATH)
+annotations = pd.read_csv(DATASET_PATH, usecols=['label.name'])
 allowed_labels = str(list(annotations['label.name'].unique()))
+label_names = [label for label in annotations['label.name'].unique() if isinstance(label, str)]
+# with --label-codes the prompts list short codes and the answers are decoded back to label names
+compiler = PromptCompiler(label_names, allowed_labels, codes=args.label_codes)
 
 # get db
-val_set = pd.read_csv(VAL_PATH)
+val_labels = LabelStore.load(VAL_PATH)
+
+# with --prune-labels each image lists only the labels common in its region
+label_index = None
+image_regions = {}
+if args.prune_labels is not None:
+    label_index = LabelIndex.load(TRAIN_REGIONS_PATH, args.prune_level)
+    image_regions = read_regions(VAL_REGIONS_PATH, args.prune_level)
 
 # design prompts
 # 0. basic concise prompt
@@ -94,14 +140,14 @@ prompt_0 = """
 ### Task ###
 Analyse the entire image and decide which of the label names in AllowedLabels are visible.
 AllowedLabels:
-""" + allowed_labels + """
+$allowed_labels
 Never invent labels, synonyms, descriptions or taxonomic levels that are not in AllowedLabels.
 Never repeat labels.
 If it is unclear whether a label is present, treat it as absent and instead return "Unscorable".
 
 ### Output Format ###
 Output the answer as a JSON array of label strings, alphabetically sorted, without extra keys or text.
-Output format example: ['Crustose coralline algae', 'Sponges (encrusting)']
+Output format example: $example
 """
 
 # 1. basic prompt with more emphasis
@@ -109,14 +155,14 @@ prompt_1 = """
 ### Task ###
 Analyse the entire image carefully and decide which (if any) of the exact label names in AllowedLabels correspond to features that are clearly visible in the image.
 AllowedLabels:
-""" + allowed_labels + """
+$allowed_labels
 Never invent labels, synonyms, descriptions or taxonomic levels that are not in AllowedLabels.
 Never repeat labels.
 If it is unclear whether a label is present, treat it as absent and instead return "Unscorable".
 
 ### Output Format ###
 Output the answer strictly as a JSON array of distinct label strings, alphabetically sorted, without extra keys or text.
-Output format example: ['Crustose coralline algae', 'Sponges (encrusting)']
+Output format example: $example
 """
 
 # 2. prompt with extra context
@@ -124,7 +170,7 @@ prompt_2 = """
 ### Task ###
 Analyse the entire image carefully and decide which (if any) of the exact label names in AllowedLabels correspond to features that are clearly visible in the image.
 AllowedLabels:
-""" + allowed_labels + """
+$allowed_labels
 Never invent labels, synonyms, descriptions or taxonomic levels that are not in AllowedLabels.
 Never repeat labels.
 If it is unclear whether a label is present, treat it as absent and instead return "Unscorable".
@@ -140,7 +186,7 @@ If the algae is medium sized and has a structure other than filamentous, ie. bra
 
 ### Output Format ###
 Output the answer strictly as a JSON array of distinct label strings, alphabetically sorted, without extra keys or text.
-Output format example: ['Crustose coralline algae', 'Sponges (encrusting)']
+Output format example: $example
 """
 
 # 3. few-shot prompt
@@ -149,14 +195,14 @@ prompt_3 = """
 ### Task ###
 Analyse the entire image carefully and decide which (if any) of the exact label names in AllowedLabels correspond to features that are clearly visible in the image.
 AllowedLabels:
-""" + allowed_labels + """
+$allowed_labels
 Never invent labels, synonyms, descriptions or taxonomic levels that are not in AllowedLabels.
 Never repeat labels.
 If it is unclear whether a label is present, treat it as absent and instead return "Unscorable".
 
 ### Output Format ###
 Output the answer strictly as a JSON array of distinct label strings, alphabetically sorted, without extra keys or text.
-Output format example: ['Crustose coralline algae', 'Sponges (encrusting)']
+Output format example: $example
 """
 
 # 4. zero-shot COT prompt
@@ -164,7 +210,7 @@ prompt_4 = """
 ### Task ###
 Analyse the entire image carefully and decide which (if any) of the exact label names in AllowedLabels correspond to features that are clearly visible in the image.
 AllowedLabels:
-""" + allowed_labels + """
+$allowed_labels
 Never repeat labels.
 If it is unclear whether a label is present, treat it as absent and instead return "Unscorable".
 
@@ -176,98 +222,403 @@ Never add to "labels" invented labels, synonyms, descriptions or taxonomic level
 
 Output format example: 
 {'reasoning': 'There is a matt-forming covering of short filamentous algae intermixed with any sediment in it. This means that "Turf" is present. There is medium sized algae, red in colour with a non-filamentous structure (globular), therefore medium foliose red algae is present.',
-'labels': ['Turfing algae (<2 cm high algal/sediment mat on rock)', 'Medium foliose red algae']}
+'labels': $cot_example}
 """
 print("randomizing prompt order...")
 # randomize prompt order
-prompts = {0 : prompt_0,
-           1 : prompt_1,
-           2 : prompt_2,
-           3 : prompt_3,
-           4 : prompt_4}
+templates = {0 : prompt_0,
+             1 : prompt_1,
+             2 : prompt_2,
+             3 : prompt_3,
+             4 : prompt_4}
 prompt_order = [i for i in range(5)]
 np.random.shuffle(prompt_order)
+# selecting prompts after the shuffle keeps the image order of full runs
+if args.prompts is not None:
+    prompt_order = [j for j in prompt_order if j in args.prompts]
 
 # get image paths and randomise order
-image_paths = [str(file_path) for file_path in FOLDER_PATH.iterdir() if file_path.is_file()]
+# sorted first, iterdir order depends on the filesystem and every shard must shuffle the same list
+image_paths = sorted(str(file_path) for file_path in FOLDER_PATH.iterdir()
+                     if file_path.is_file() and not file_path.name.startswith("."))
 np.random.shuffle(image_paths)
 
 # set aside examples for few shot demonstrations and get their labels
 demo_image_paths = [image_paths.pop(0) for _ in range(N_DEMOS)]
 demo_image_ids = [int(Path(path).stem) for path in demo_image_paths]
-demo_y_true = [str(list(ast.literal_eval(val_set.loc[val_set['point.media.id'] == image_id, 'label.name'].iloc[0]))) for image_id in demo_image_ids]
+if args.limit is not None:
+    image_paths = image_paths[:args.limit]
+# every shard shuffles and holds out the demonstrations the same way, then takes its share of the rest
+if args.shard:
+    image_paths = shard_items(image_paths, *args.shard)
+    print(f"shard {args.shard[0]} of {args.shard[1]}: {len(image_paths)} images")
+
+
+@lru_cache(maxsize=None)
+def compiler_for(region):
+    "Returns the compiler listing the candidate labels of a region, the full list if it has none"
+
+    candidates = label_index.candidates(region, args.prune_labels, args.prune_min_images) if label_index else None
+    return compiler if candidates is None else compiler.restrict(candidates)
+
+
+@lru_cache(maxsize=None)
+def prompts_for(region):
+    return {j: compiler_for(region).render(template) for j, template in templates.items()}
+
+
+@lru_cache(maxsize=None)
+def few_shot_prefix(region):
+    """
+    The demonstrations are built once per region, so every few-shot request
+    of a region starts with byte-identical messages and ollama's prompt
+    cache can skip re-evaluating them
+    """
+
+    demo_y_true = [str(compiler_for(region).encode(val_labels.labels(image_id))) for image_id in demo_image_ids]
+    prefix = [{'role'       : 'user',
+               'content'    : prompts_for(region)[3],
+               'images'     : [demo_image_paths[0]]},
+              {'role'       : 'assistant',
+               'content'    : demo_y_true[0]}]
+    for k in range(1, N_DEMOS):
+        prefix.append({'role'     : 'user',
+                       'images'   : [demo_image_paths[k]]})
+        prefix.append({'role'     : 'assistant',
+                       'content'  : demo_y_true[k]})
+    return prefix
 
 true_labels = []
-predicted_labels = {k : [] for k in prompt_order}
-times = {k: [] for k in prompt_order}
+predicted_labels = {k : [None] * len(image_paths) for k in prompt_order}
+times = {k: [None] * len(image_paths) for k in prompt_order}
 failed_parse = {k: 0 for k in prompt_order}
 timeouts = {k: 0 for k in prompt_order}
+timed_out_attempts = {k: 0 for k in prompt_order}
 
 
-print("beginning api calls...")
-# make a seperate api call for each image, for each prompt
-for i, path in enumerate(image_paths):
-    print(f"Image {i}")
+def build_messages(j, path, region=None):
+    "Builds the chat history sent to the model for image `path` under prompt j"
 
-    image_id = int(Path(path).stem)
-    y_true = ast.literal_eval(val_set.loc[val_set['point.media.id'] == image_id, 'label.name'].iloc[0])
-    true_labels.append(y_true)
+    # zero shot prompts
+    if j != 3:
+        messages=[{'role'       : 'user',
+                    'content'    : prompts_for(region)[j],
+                    'images'     : [path]}]
+    # few-shot prompt
+    else:
+        messages = few_shot_prefix(region) + [{'role'     : 'user',
+                                               'images'   : [path]}]
+    return messages
 
-    for j in prompt_order:
-        print(f"Prompt {j}...")
-        start_time = time.time()
-        # zero shot prompts
-        if j != 3:
-            messages=[{'role'       : 'user',
-                        'content'    : prompts[j],
-                        'images'     : [path]}]
-        # few-shot prompt
-        else:
-            messages=[{ 'role'       : 'user',
-                        'content'    : prompts[j],
-                        'images'     : [demo_image_paths[0]]},
-                        {'role'      : 'assistant',
-                        ' content'   : demo_y_true[0]}]
-            
-            for k in range(1, N_DEMOS):
-                messages.append({'role'     : 'user',
-                                 'images'   : [demo_image_paths[k]]})
-                messages.append({'role'     : 'assistant',
-                                 'content'  : demo_y_true[k]})
-                
-            messages.append({'role'     : 'user',
-                             'images'   : [path]})
-
-        
-        response = call_ollama_api(messages=messages, model="Benthiq:3b", timeout=TIMEOUT)
-
-        if response['message'] is not None:
-            end_time = time.time()
-            execution_time = end_time - start_time
-            try:
+
+def record_result(job, response, execution_time):
+    "Parses a response and writes its result for the job's image and prompt to the journal"
+
+    i, j, path = job['index'], job['prompt'], job['path']
+    print(f"Image {i}, prompt {j} done")
+
+    if response['message'] is not None:
+        status = "ok"
+        try:
+            if args.structured:
+                y_pred, strict = label_parser(job.get('region')).parse(response['message'],
+                                                                       "dict" if j == 4 else "list")
+                status = "ok" if strict else "recovered"
+            else:
                 y_pred = ast.literal_eval(response['message'])
                 if j == 4:
                     y_pred = y_pred['labels']
-            except (ValueError, SyntaxError) as e:
-                warnings.warn(f"Warning: Failed to parse model output at image {path}. Error: {e}")
-                y_pred = ['Failed']
-                failed_parse[j] += 1
-        elif response['error'] == "Timeout":
-            y_pred = ['Timeout']
-            timeouts[j] += 1
-            execution_time = TIMEOUT
-            time.sleep(DELAY)
-        else:
-            print("Failed to connect to ollama server...\nExiting app")
-            exit()
-        times[j].append(execution_time)
-        predicted_labels[j].append(y_pred)
+                if not isinstance(y_pred, (list, tuple)):
+                    raise TypeError(f"expected a list of labels, got {type(y_pred).__name__}")
+            y_pred = compiler.decode(y_pred)
+        # a cached or deterministic answer of the wrong shape would otherwise crash every rerun
+        except (ValueError, SyntaxError, TypeError, KeyError) as e:
+            warnings.warn(f"Warning: Failed to parse model output at image {path}. Error: {e}")
+            y_pred = ['Failed']
+            status = "failed_parse"
+    elif response['error'] == "Timeout":
+        y_pred = ['Timeout']
+        status = "timeout"
+    else:
+        raise ConnectionError(response['error'])
+
+    # the model is pinned in memory, a long load means ollama reloaded it mid-run
+    load_duration = (response.get('timings') or {}).get('load_duration') or 0
+    reloaded = not response.get('cached', False) and load_duration / 1e6 > LOAD_EVENT_MS
+    if reloaded:
+        print(f"⚠ The model was reloaded for image {i}, prompt {j} ({load_duration / 1e9:.1f}s)")
+
+    # the resolution the model saw after downsizing, already measured when the request was encoded;
+    # without a budget the images are sent as they are and never opened
+    width = height = vision_tokens = None
+    if args.image_tokens:
+        width, height, vision_tokens = image_budget.prepare(path, args.image_tokens)[1]
+
+    journal.append({'image_id' : job['image_id'],
+                    'prompt'   : j,
+                    **({'sample': job['sample']} if job.get('sample') else {}),
+                    'model'    : job.get('model', MODEL),
+                    **job.get('cascade', {}),
+                    'status'   : status,
+                    'y_pred'   : list(y_pred),
+                    'time'     : execution_time,
+                    'cached'   : response.get('cached', False),
+                    'timings'  : response.get('timings'),
+                    'stream'   : response.get('stream'),
+                    'attempts' : response.get('attempts', 1),
+                    'timeouts' : response.get('timeouts', int(status == "timeout")),
+                    'hedged'   : response.get('hedged', False),
+                    'reloaded' : reloaded,
+                    **({'image_size': [width, height], 'vision_tokens': vision_tokens} if args.image_tokens else {}),
+                    'message'  : response['message']})
+
+
+@lru_cache(maxsize=None)
+def label_parser(region):
+    return LabelParser(compiler_for(region).output_labels())
+
+
+@lru_cache(maxsize=None)
+def schema(region, answer):
+    return label_schema(compiler_for(region).output_labels(), answer)
+
+
+def client_kwargs(j, region=None):
+    "Returns the request options of prompt j, the CoT prompt answering with a dict"
+
+    answer = "dict" if j == 4 else "list"
+    kwargs = {'answer': answer}
+    if args.structured:
+        kwargs['format'] = schema(region, answer)
+    return kwargs
+
+
+# everything that changes the answers; a journal is only resumed by a run with the same config
+run_config = {'model'               : MODEL,
+              'cascade'             : args.cascade,
+              'cascade_agreement'   : args.cascade_agreement,
+              'cascade_temperature' : args.cascade_temperature,
+              'structured'          : args.structured,
+              'stream'              : args.stream,
+              'label_codes'         : args.label_codes,
+              'prune_labels'        : args.prune_labels,
+              'prune_level'         : args.prune_level,
+              'prune_min_images'    : args.prune_min_images,
+              'image_tokens'        : args.image_tokens,
+              'templates'           : hashlib.sha256(repr(sorted(templates.items())).encode()).hexdigest(),
+              'demo_image_ids'      : demo_image_ids}
+try:
+    if args.merge:
+        shards = find_shards(OUTPUT_PATH)
+        print(f"merging {len(shards)} shards...")
+        merge_journals(shards, OUTPUT_PATH / "prompt_journal.jsonl")
+    # the flags of a merge are not those of the shards, their journals carry the config
+    journal = Journal(OUTPUT_PATH / "prompt_journal.jsonl", resume=args.resume or args.merge,
+                      config=None if args.merge else run_config)
+except ValueError as e:
+    print(f"{e}\nExiting app")
+    sys.exit(1)
+completed = journal.completed()
+if completed and not args.merge:
+    print(f"resuming, {len(completed)} requests already in the journal")
+
+# OLLAMA_URL can list several ollama servers, requests are spread over them
+pool = None
+ready = []
+if not args.merge:
+    pool = EndpointPool.from_env()
+    print("waiting for ollama...")
+    ready = [endpoint.url for endpoint in pool.endpoints if wait_until_ready(MODEL, endpoint.url)]
+    if not ready:
+        print(f"{MODEL} is not available on any ollama server...\nExiting app")
+        sys.exit(1)
+    if args.cascade and not any(wait_until_ready(args.cascade, url) for url in ready):
+        print(f"{args.cascade} is not available on any ollama server...\nExiting app")
+        sys.exit(1)
+    if len(pool) > 1:
+        print(f"balancing requests over {len(pool)} ollama servers")
+        pool.check_health()
+
+
+def open_response_cache(model):
+    "Returns the response cache of a model, None if there is none"
+
+    if not args.response_cache:
+        return None
+    # the digest changes whenever the model is rebuilt from an edited Modelfile
+    digest = model_digest(model)
+    if digest is None:
+        print(f"Could not get the digest of {model} from ollama, running without the response cache")
+        return None
+    cache = ResponseCache(args.response_cache, f"{model}@{digest}",
+                          max_bytes=RESPONSE_CACHE_MB * 1024 ** 2,
+                          bypass=args.bypass_response_cache)
+    if args.invalidate_response_cache:
+        cache.clear()
+    return cache
+
+
+response_cache = None if args.merge else open_response_cache(MODEL)
+
+# timeouts follow the observed latency of each prompt, TIMEOUT being the ceiling
+policy = RequestPolicy(max_timeout=TIMEOUT, factor=args.timeout_factor, hedge=args.hedge)
 
+# make a seperate api call for each image, for each prompt
+all_jobs = []
+for i, path in enumerate(image_paths):
+    image_id = int(Path(path).stem)
+    y_true = val_labels.labels(image_id)
+    true_labels.append(y_true)
+    region = image_regions.get(image_id)
 
+    for j in prompt_order:
+        all_jobs.append({'index'         : i,
+                         'image_id'      : image_id,
+                         'prompt'        : j,
+                         'path'          : path,
+                         'region'        : region,
+                         'messages'      : build_messages(j, path, region),
+                         'client_kwargs' : client_kwargs(j, region)})
+jobs = [job for job in all_jobs if (job['image_id'], job['prompt']) not in completed]
+if args.merge and jobs:
+    print(f"{len(jobs)} requests are missing from the shards, finish them with --resume before merging\nExiting app")
+    sys.exit(1)
+
+# the cascade measures agreement with a second, sampled answer of the small model
+if args.cascade and args.cascade_agreement is not None:
+    sampled = journal.completed(sample=1)
+    options = {'temperature': args.cascade_temperature, 'seed': 42}
+    jobs += [{**job, 'sample': 1, 'client_kwargs': {**job['client_kwargs'], 'options': options}}
+             for job in all_jobs if (job['image_id'], job['prompt']) not in sampled | completed]
+
+# every request pins the model in memory, so ollama never unloads it mid-run
+run_kwargs = {'stream': args.stream, 'keep_alive': KEEP_ALIVE}
+# the budget is a request option, so budgeted answers are cached apart from full-size ones
+if args.image_tokens:
+    run_kwargs['image_tokens'] = args.image_tokens
+
+
+def order_jobs(jobs):
+    "Sends the requests prompt by prompt with --prefix-reuse, each prompt sticking to one server"
+
+    if args.prefix_reuse:
+        # consecutive requests of the same prompt (and region, when pruning) share their prefix,
+        # images keep their shuffled order
+        jobs.sort(key=lambda job: (prompt_order.index(job['prompt']), str(job['region'])))
+        for job in jobs:
+            job['affinity'] = (job['prompt'], job['region'])
+    return jobs
+
+
+def warm(jobs, model):
+    "Loads the model with untimed requests; answers to a demo image are discarded, only the load time is reported"
+
+    if not jobs or not args.warmup:
+        return
+    j, region = jobs[0]['prompt'], jobs[0]['region']
+    load_times = warm_up(build_messages(j, demo_image_paths[0], region), model, TIMEOUT, n=args.warmup, urls=ready,
+                         client_kwargs={**run_kwargs, **client_kwargs(j, region)})
+    first_load = f"{load_times[0]:.1f}s" if load_times[0] is not None else "an unknown time"
+    print(f"warm-up of {model}: {len(load_times)} requests, first load took {first_load}")
+
+
+def run(jobs, model, cache, policy):
+    "Sends the jobs to `model`, returning the seconds it took"
+
+    start = time.perf_counter()
+    try:
+        if args.concurrency > 1:
+            run_async(jobs, record_result, model=model, timeout=TIMEOUT,
+                      concurrency=args.concurrency, queue_size=args.queue_size,
+                      cache=cache, client_kwargs=run_kwargs,
+                      pool=pool, policy=policy)
+        else:
+            run_serial(jobs, record_result, model=model, timeout=TIMEOUT,
+                       cache=cache, client_kwargs=run_kwargs,
+                       pool=pool, policy=policy)
+    except ConnectionError:
+        print("Failed to connect to ollama server...\nExiting app")
+        print("Rerun with --resume to continue from the journal")
+        sys.exit(1)
+    return time.perf_counter() - start
+
+
+jobs = order_jobs(jobs)
+warm(jobs, MODEL)
+print("beginning api calls...")
+run_seconds = run(jobs, MODEL, response_cache, policy)
+
+escalated = []
+escalation_seconds = 0.0
+if args.cascade:
+    # answers of the small model that are still the final answer; escalated ones were overwritten
+    first = {(r['image_id'], r['prompt']): r for r in journal.records() if r.get('model', MODEL) == MODEL}
+    samples = {(r['image_id'], r['prompt']): r for r in journal.records(sample=1)}
+    for job in all_jobs:
+        key = (job['image_id'], job['prompt'])
+        reason = escalation_reason(first[key], samples.get(key), args.cascade_agreement) if key in first else None
+        if reason:
+            escalated.append({**job, 'model': args.cascade,
+                              'cascade': {'escalation'   : reason,
+                                          'first_status' : first[key]['status'],
+                                          'first_y_pred' : first[key]['y_pred'],
+                                          'first_time'   : first[key]['time']}})
+
+    if args.merge and escalated:
+        print(f"{len(escalated)} escalations are missing from the shards, finish them with --resume before merging"
+              f"\nExiting app")
+        sys.exit(1)
+    print(f"escalating {len(escalated)} of {len(all_jobs)} answers to {args.cascade}...")
+    escalated = order_jobs(escalated)
+    warm(escalated, args.cascade)
+    # the large model has its own latency, so its timeouts are learnt separately
+    cascade_policy = RequestPolicy(max_timeout=TIMEOUT, factor=args.timeout_factor, hedge=args.hedge)
+    escalation_seconds = run(escalated, args.cascade, open_response_cache(args.cascade), cascade_policy)
+first_stage_seconds = run_seconds
+run_seconds += escalation_seconds
+# extra samples are requests, not answers
+answered = sum(not job.get('sample') for job in jobs)
+requests_sent = len(jobs) + len(escalated)
+n_escalated = len(escalated)
+if args.merge:
+    # the shards ran side by side, so the run took as long as the slowest of them
+    shard_stats = [read_run_stats(shard) for shard in shards]
+    answered = sum(int(stats['answers']) for stats in shard_stats)
+    requests_sent = sum(int(stats['requests']) for stats in shard_stats)
+    n_escalated = sum(int(stats.get('escalated', 0)) for stats in shard_stats)
+    run_seconds = max(float(stats['seconds']) for stats in shard_stats)
+    first_stage_seconds = max(float(stats.get('first_stage_seconds', stats['seconds'])) for stats in shard_stats)
+    escalation_seconds = max(float(stats.get('escalation_seconds', 0)) for stats in shard_stats)
+
+
+# rebuild the results from the journal, which also covers resumed runs
+image_index = {int(Path(path).stem): i for i, path in enumerate(image_paths)}
+records = journal.records()
+for record in records:
+    i = image_index.get(record['image_id'])
+    j = record['prompt']
+    if i is None or j not in predicted_labels:
+        continue
+    predicted_labels[j][i] = record['y_pred']
+    times[j][i] = record['time']
+    if record['status'] == "failed_parse":
+        failed_parse[j] += 1
+    elif record['status'] == "timeout":
+        timeouts[j] += 1
+    timed_out_attempts[j] += record.get('timeouts', int(record['status'] == "timeout"))
+journal.close()
+reloads = sum(bool(record.get('reloaded')) for record in records)
+if reloads:
+    print(f"⚠ the model was reloaded during {reloads} requests, see 'reloaded' in prompt_requests.csv")
 
 print("evaluating predictions...")
-evals = { i : [f1_score(true_labels[j], predicted_labels[i][j])
-           for j in range(len(true_labels))] for i in prompt_order}
+# predicted labels outside the ground truth (hallucinations, 'Failed',
+# 'Timeout') get their own columns, so they count as false positives
+vocabulary = label_vocabulary(true_labels, *predicted_labels.values())
+y_true = binarize(true_labels, vocabulary)
+y_pred = np.stack([binarize(predicted_labels[k], vocabulary) for k in prompt_order])
+scores = sample_f1(y_true, y_pred)
+evals = {k : scores[n] for n, k in enumerate(prompt_order)}
 
 df_eval = pd.DataFrame()
 for k, v in evals.items():
@@ -281,12 +632,172 @@ for k, v in times.items():
 df_times.to_csv(OUTPUT_PATH / "prompt_times.csv")
 df_times.describe().to_csv(OUTPUT_PATH / "prompt_time_stats.csv")   
 
+# one row per request with ollama's own timing breakdown next to its F1
+df_requests = pd.DataFrame([{'image'    : image_index[r['image_id']],
+                             'image_id' : r['image_id'],
+                             'prompt'   : r['prompt'],
+                             'model'    : r.get('model', MODEL),
+                             'escalation' : r.get('escalation'),
+                             'status'   : r['status'],
+                             'f1'       : evals[r['prompt']][image_index[r['image_id']]],
+                             'time'     : r['time'],
+                             'attempts' : r.get('attempts', 1),
+                             'timeouts' : r.get('timeouts', 0),
+                             'hedged'   : r.get('hedged', False),
+                             'reloaded' : r.get('reloaded', False),
+                             'allowed_labels' : len(compiler_for(image_regions.get(r['image_id'])).label_names),
+                             'image_width'    : (r.get('image_size') or [None, None])[0],
+                             'image_height'   : (r.get('image_size') or [None, None])[1],
+                             'vision_tokens'  : r.get('vision_tokens'),
+                             **(r.get('timings') or dict.fromkeys(TIMING_FIELDS)),
+                             **(r.get('stream') or {})}
+                            for r in records
+                            if r['image_id'] in image_index and r['prompt'] in evals])
+df_requests.sort_values(['image', 'prompt']).to_csv(OUTPUT_PATH / "prompt_requests.csv", index=False)
+summarise_timings(df_requests).to_csv(OUTPUT_PATH / "prompt_server_timing_stats.csv")
+latency_percentiles(df_requests).to_csv(OUTPUT_PATH / "prompt_latency_percentiles.csv")
+
+# parse failures and generated tokens, kept per mode so constrained and
+# unconstrained runs written to the same folder can be compared
+mode = "structured" if args.structured else "free"
+tokens = df_requests['eval_count'] if 'chunks' not in df_requests else \
+    df_requests['eval_count'].fillna(df_requests['chunks'])
+df_output = df_requests.assign(tokens=tokens).groupby('prompt').agg(
+    requests=('status', 'size'),
+    failed_parse=('status', lambda s: int((s == "failed_parse").sum())),
+    recovered=('status', lambda s: int((s == "recovered").sum())),
+    mean_tokens=('tokens', 'mean'))
+df_output['failed_parse_rate'] = df_output['failed_parse'] / df_output['requests']
+df_output.to_csv(OUTPUT_PATH / f"prompt_output_report_{mode}.csv")
+other = OUTPUT_PATH / f"prompt_output_report_{'free' if args.structured else 'structured'}.csv"
+if other.exists():
+    df_compare = df_output.join(pd.read_csv(other, index_col='prompt'),
+                                lsuffix=f"_{mode}", rsuffix="_free" if args.structured else "_structured")
+    df_compare.to_csv(OUTPUT_PATH / "prompt_output_comparison.csv")
+
+# prompt and output tokens against F1 per template, kept per label mode so
+# runs with and without --label-codes written to the same folder can be compared
+df_template = df_requests.assign(total_ms=df_requests['total_duration'] / 1e6).groupby('prompt').agg(
+    requests=('status', 'size'),
+    mean_allowed_labels=('allowed_labels', 'mean'),
+    mean_prompt_tokens=('prompt_eval_count', 'mean'),
+    mean_output_tokens=('eval_count', 'mean'),
+    mean_total_ms=('total_ms', 'mean'),
+    mean_f1=('f1', 'mean'),
+    failed_parse=('status', lambda s: int((s == "failed_parse").sum())))
+df_template.to_csv(OUTPUT_PATH / f"prompt_template_report_{compiler.mode}.csv")
+other = OUTPUT_PATH / f"prompt_template_report_{'names' if args.label_codes else 'codes'}.csv"
+if other.exists():
+    df_compare = df_template.join(pd.read_csv(other, index_col='prompt'),
+                                  lsuffix=f"_{compiler.mode}", rsuffix="_names" if args.label_codes else "_codes")
+    df_compare.to_csv(OUTPUT_PATH / "prompt_template_comparison.csv")
+
+# the F1 pruning can reach: true labels left out of an image's AllowedLabels can never be predicted
+if label_index is not None:
+    image_ids = [int(Path(path).stem) for path in image_paths]
+    candidates = [label_index.candidates(image_regions.get(image_id), args.prune_labels, args.prune_min_images)
+                  for image_id in image_ids]
+    pruning = {"level": args.prune_level,
+               "coverage": args.prune_labels,
+               "images": len(image_ids),
+               "fallback_images": sum(c is None for c in candidates),
+               "full_labels": len(label_names),
+               "mean_allowed_labels": float(np.mean([len(compiler_for(image_regions.get(image_id)).label_names)
+                                                     for image_id in image_ids])) if image_ids else np.nan,
+               **recall_ceiling(true_labels, candidates)}
+    print(f"label pruning: {pruning['mean_allowed_labels']:.1f} of {len(label_names)} labels per image, "
+          f"recall ceiling {pruning['recall_ceiling']:.1%} ({pruning['fallback_images']} images use the full list)")
+    with open(OUTPUT_PATH / "label_pruning_report.txt", "w") as f:
+        for k, v in pruning.items():
+            f.write(f"{k}: {v}\n")
+
+# escalation rate and F1 of the cascade against the small model alone (its
+# first answers to every image) and the single-model runs given as baselines
+if args.cascade:
+    first_labels = {k: [None] * len(image_paths) for k in prompt_order}
+    for record in records:
+        i = image_index.get(record['image_id'])
+        if i is not None and record['prompt'] in first_labels:
+            first_labels[record['prompt']][i] = record.get('first_y_pred', record['y_pred'])
+    first_vocabulary = label_vocabulary(true_labels, *first_labels.values())
+    first_scores = sample_f1(binarize(true_labels, first_vocabulary),
+                             np.stack([binarize(first_labels[k], first_vocabulary) for k in prompt_order]))
+    df_requests['first_f1'] = [first_scores[prompt_order.index(j)][i]
+                               for i, j in zip(df_requests['image'], df_requests['prompt'])]
+    df_cascade = df_requests.assign(escalated=df_requests['escalation'].notna()).groupby('prompt').agg(
+        requests=('status', 'size'),
+        escalated=('escalated', 'sum'),
+        **{reason: ('escalation', lambda s, reason=reason: int((s == reason).sum())) for reason in REASONS},
+        first_f1=('first_f1', 'mean'),
+        f1=('f1', 'mean'))
+    df_cascade['escalation_rate'] = df_cascade['escalated'] / df_cascade['requests']
+    df_cascade.to_csv(OUTPUT_PATH / "prompt_cascade_report.csv")
+
+    def images_per_s(seconds):
+        return answered / len(prompt_order) / seconds if seconds else np.nan
+
+    df_compare = pd.DataFrame([{"run": "cascade", "model": f"{MODEL} -> {args.cascade}",
+                                "images_per_s": images_per_s(run_seconds),
+                                "escalation_rate": df_cascade['escalated'].sum() / df_cascade['requests'].sum(),
+                                **{f"f1_prompt_{k}": v for k, v in df_cascade['f1'].items()},
+                                "f1": df_cascade['f1'].mean()},
+                               {"run": "first stage", "model": MODEL,
+                                "images_per_s": images_per_s(first_stage_seconds),
+                                **{f"f1_prompt_{k}": v for k, v in df_cascade['first_f1'].items()},
+                                "f1": df_cascade['first_f1'].mean()},
+                               *[read_baseline(directory) for directory in args.cascade_baseline]])
+    df_compare.to_csv(OUTPUT_PATH / "prompt_cascade_comparison.csv", index=False)
+    print(df_compare[["run", "model", "images_per_s", "f1"]].to_string(index=False))
+
 with open(OUTPUT_PATH / "prompt_failed_parses.txt", "w") as f:
     for k, v in failed_parse.items():
         f.write(f"Prompt {k} failed to parse {v} times\n")
 
+# throughput of this run only, resumed requests are not counted
+with open(OUTPUT_PATH / "prompt_run_stats.txt", "w") as f:
+    f.write(f"model: {MODEL}\n")
+    f.write(f"requests: {requests_sent}\n")
+    f.write(f"answers: {answered}\n")
+    f.write(f"seconds: {run_seconds}\n")
+    f.write(f"requests_per_s: {requests_sent / run_seconds if run_seconds else float('nan')}\n")
+    f.write(f"images_per_s: {answered / len(prompt_order) / run_seconds if run_seconds else float('nan')}\n")
+    f.write(f"image_tokens: {args.image_tokens}\n")
+    if args.cascade:
+        f.write(f"cascade_model: {args.cascade}\n")
+        f.write(f"escalated: {n_escalated}\n")
+        f.write(f"first_stage_seconds: {first_stage_seconds}\n")
+        f.write(f"escalation_seconds: {escalation_seconds}\n")
+
 with open(OUTPUT_PATH / "prompt_timeouts.txt", "w") as f:
     for k, v in timeouts.items():
-        f.write(f"Prompt {k} timed out {v} times\n")
+        f.write(f"Prompt {k} timed out {v} times ({timed_out_attempts[k]} timed out attempts, "
+                f"{timed_out_attempts[k] - v} of them retried)\n")
+
+if args.image_tokens:
+    print(f"image budget: {args.image_tokens} vision tokens, {image_budget.resized} images resized this run, "
+          f"mean {df_requests['vision_tokens'].mean():.0f} tokens and "
+          f"{df_requests['prompt_eval_count'].mean():.0f} prompt tokens per request")
+
+cache_stats = payload_cache.stats()
+print(f"image payload cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+      f"{cache_stats['disk_bytes_saved'] / 1024 ** 2:.1f} MB of reads and "
+      f"{cache_stats['encode_seconds_saved']:.2f} s of encoding saved")
+with open(OUTPUT_PATH / "payload_cache_stats.txt", "w") as f:
+    for k, v in cache_stats.items():
+        f.write(f"{k}: {v}\n")
+
+if pool is not None:
+    pd.DataFrame(pool.stats()).to_csv(OUTPUT_PATH / "prompt_endpoint_stats.csv", index=False)
+with open(OUTPUT_PATH / "request_policy_stats.txt", "w") as f:
+    for k, v in policy.stats().items():
+        f.write(f"{k}: {v}\n")
+
+if response_cache:
+    cache_stats = response_cache.stats()
+    print(f"response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+          f"({cache_stats['hit_rate']:.1%} hit rate)")
+    with open(OUTPUT_PATH / "response_cache_stats.txt", "w") as f:
+        for k, v in cache_stats.items():
+            f.write(f"{k}: {v}\n")
 
 print("evaluations complete")
\ No newline at end of file
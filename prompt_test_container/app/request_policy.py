@@ -0,0 +1,150 @@
+"""
+request_policy.py
+
+Timeouts, retries and hedging of the requests sent by evaluation.py,
+replacing the fixed 600 s timeout and fixed retry delays.
+
+- The timeout of a request is the p99 latency of its prompt times
+  `factor`, once `min_samples` requests of that prompt have succeeded
+  (max_timeout before then). A timed out request is retried with double
+  the timeout, but all the attempts of a request share one max_timeout,
+  so a hung request stalls a worker for at most max_timeout. Timed out
+  attempts count in the latencies at their timeout, so the p99 is not
+  learnt from the successful requests only.
+- Failed requests are retried after a jittered exponential backoff.
+- After `breaker_failures` failures in a row the circuit breaker opens
+  and no request is sent for `breaker_reset_s` seconds; then a single
+  trial request decides whether it closes again.
+- Hedging (async runs only): a request still running after the p95
+  latency of its prompt is duplicated, and the first answer is used.
+
+Timed out attempts are counted per request, so retried timeouts still
+show up in the statistics.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class RequestPolicy:
+    def __init__(self, max_timeout=600, min_timeout=30, factor=3.0, min_samples=20, window=500,
+                 max_attempts=3, backoff_base=1.0, backoff_cap=60, breaker_failures=5, breaker_reset_s=60,
+                 hedge=False, hedge_quantile=0.95, seed=None):
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.factor = factor
+        self.min_samples = min_samples
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_s = breaker_reset_s
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.random = random.Random(seed)
+
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self.half_open = False
+        self.trial_running = False
+        self.breaker_opened = 0
+        self.lock = threading.Lock()
+
+    def _quantile(self, key, q):
+        with self.lock:
+            latencies = list(self.latencies[key])
+        if len(latencies) < self.min_samples:
+            return None
+        return float(np.quantile(latencies, q))
+
+    def timeout(self, key, timeouts=0, elapsed=0):
+        """
+        Returns the timeout of a request for prompt `key` that has already
+        timed out `timeouts` times, its earlier attempts having taken `elapsed` seconds
+        """
+
+        remaining = self.max_timeout - elapsed
+        p99 = self._quantile(key, 0.99)
+        if p99 is None:
+            return remaining
+        timeout = max(self.min_timeout, p99 * self.factor) * 2 ** timeouts
+        return min(timeout, remaining)
+
+    def retry_after(self, retries, elapsed):
+        """
+        Returns the backoff before retry number `retries` + 1 of a request
+        whose attempts have taken `elapsed` seconds, None once it should be given up
+        """
+
+        if retries + 1 >= self.max_attempts:
+            return None
+        delay = self.backoff(retries + 1)
+        if self.max_timeout - elapsed - delay < self.min_timeout:
+            return None
+        return delay
+
+    def hedge_after(self, key):
+        "Returns how long to wait before duplicating a request, None if it should not be hedged"
+
+        return self._quantile(key, self.hedge_quantile) if self.hedge else None
+
+    def backoff(self, attempt):
+        "Seconds to wait before retry number `attempt` (1, 2, ...), with full jitter"
+
+        return self.random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def record(self, key, latency, failed, timed_out=False):
+        """
+        Records the outcome of an attempt, opening the breaker after too many
+        failures in a row; a timed out attempt's latency is its timeout
+        """
+
+        with self.lock:
+            self.trial_running = False
+            if timed_out:
+                self.latencies[key].append(latency)
+            if not failed:
+                self.latencies[key].append(latency)
+                self.consecutive_failures = 0
+                self.half_open = False
+                return
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.breaker_failures:
+                if time.monotonic() >= self.opened_until:
+                    print(f"⚠ {self.consecutive_failures} failed requests in a row, "
+                          f"pausing requests for {self.breaker_reset_s}s")
+                    self.breaker_opened += 1
+                self.opened_until = time.monotonic() + self.breaker_reset_s
+                self.half_open = True
+                # while half-open, a single failure is enough to open it again
+                self.consecutive_failures = self.breaker_failures - 1
+
+    def wait(self):
+        """
+        Returns how long to wait before the next request may be sent, 0 if
+        it can be sent now. While the breaker is half-open only one trial
+        request is let through.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            if now < self.opened_until:
+                return self.opened_until - now
+            if not self.half_open:
+                return 0
+            if self.trial_running:
+                return 1.0
+            self.trial_running = True
+            return 0
+
+    def stats(self):
+        return {"breaker_opened": self.breaker_opened,
+                **{f"timeout_prompt_{key}": self.timeout(key) for key in sorted(self.latencies, key=str)}}
@@ -0,0 +1,136 @@
+"""
+response_cache.py
+
+On-disk cache of ollama responses. The model runs at temperature 0, so
+a request with the same model, messages, images and options always gets
+the same answer and never needs to be sent twice.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# request options that do not change the answer, left out of the key
+IGNORED_OPTIONS = ("keep_alive",)
+
+
+class ResponseCache:
+    "Stores one json file per request key, evicting the least recently used files above max_bytes"
+
+    def __init__(self, directory, model_id, max_bytes=1024 ** 3, bypass=False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_id = model_id
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.image_digests = {}
+        self.size = sum(p.stat().st_size for p in self.directory.glob("*/*.json"))
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def image_digest(self, path):
+        "Returns the sha256 of an image file, hashing each file version once"
+
+        stat = os.stat(path)
+        file_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        if file_key not in self.image_digests:
+            with open(path, "rb") as f:
+                self.image_digests[file_key] = hashlib.sha256(f.read()).hexdigest()
+        return self.image_digests[file_key]
+
+    def key(self, messages, options=None):
+        "Hashes the model id, the full message list with image contents, and the request options"
+
+        hashed_messages = []
+        for m in messages:
+            m = dict(m)
+            if 'images' in m:
+                m['images'] = [self.image_digest(p) for p in m['images']]
+            hashed_messages.append(m)
+        request = {"model": self.model_id,
+                   "messages": hashed_messages,
+                   "options": {k: v for k, v in (options or {}).items() if k not in IGNORED_OPTIONS}}
+        encoded = json.dumps(request, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, messages, options=None):
+        "Returns the cached response for a request, or None"
+
+        if self.bypass:
+            return None
+        path = self.path(self.key(messages, options))
+        try:
+            with open(path, encoding="utf-8") as f:
+                response = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        # mtime doubles as the last-used time for eviction
+        os.utime(path)
+        self.hits += 1
+        response.pop('model_id', None)
+        response['cached'] = True
+        return response
+
+    def put(self, messages, response, execution_time, options=None):
+        "Stores a successful response together with the latency it originally took"
+
+        if response['error'] is not None:
+            return
+        path = self.path(self.key(messages, options))
+        path.parent.mkdir(exist_ok=True)
+        old_size = path.stat().st_size if path.exists() else 0
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**response, "time": execution_time, "model_id": self.model_id}, f)
+        os.replace(tmp_path, path)
+        self.size += path.stat().st_size - old_size
+        self.writes += 1
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        "Deletes the least recently used responses until the cache is below 90% of max_bytes"
+
+        files = sorted(self.directory.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            if self.size <= 0.9 * self.max_bytes:
+                break
+            self.size -= path.stat().st_size
+            path.unlink()
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Invalidates the cached responses of this cache's model; the
+        directory is shared by every model, so their responses are kept
+        """
+
+        for path in self.directory.glob("*/*.json"):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    model_id = json.load(f).get('model_id')
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            if model_id == self.model_id:
+                self.size -= path.stat().st_size
+                path.unlink()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"model": self.model_id,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "cached_bytes": self.size}
@@ -0,0 +1,89 @@
+"""
+shards.py
+
+Splits an evaluation run of prompts.py over several processes or hosts
+(--shard i/n) and merges their results (--merge).
+
+Every shard shuffles the image list with the same seed and holds out the
+same few-shot demonstrations, then keeps every n-th image starting at
+i, so the shards are disjoint, together cover the whole run, and each
+image is evaluated exactly as in a single-process run. Each shard writes
+to <output-dir>/shard_<i>_of_<n>/; merging combines their journals into
+<output-dir>/prompt_journal.jsonl, from which prompts.py rebuilds the
+same outputs a single run would have written.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import json
+import re
+from pathlib import Path
+
+from journal import read_config
+
+SHARD_DIR = re.compile(r"shard_(\d+)_of_(\d+)$")
+
+
+def parse_shard(value):
+    "Parses 'i/n' into (i, n), shards being numbered from 0"
+
+    match = re.fullmatch(r"(\d+)/(\d+)", value.strip())
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise ValueError(f"expected a shard as i/n with 0 <= i < n, got {value!r}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard_items(items, index, count):
+    "Returns the items of shard `index` of `count`: every count-th item, starting at index"
+
+    return items[index::count]
+
+
+def shard_dir(output, index, count):
+    return Path(output) / f"shard_{index}_of_{count}"
+
+
+def find_shards(output):
+    "Returns the shard directories under `output` in shard order, checking that none is missing"
+
+    found = {}
+    for path in Path(output).iterdir():
+        match = SHARD_DIR.match(path.name)
+        if path.is_dir() and match:
+            found[(int(match.group(1)), int(match.group(2)))] = path
+    counts = {count for _, count in found}
+    if len(counts) != 1:
+        raise ValueError(f"expected the shards of a single run in {output}, found {sorted(found)}")
+    count = counts.pop()
+    missing = [i for i in range(count) if (i, count) not in found]
+    if missing:
+        raise ValueError(f"shards {missing} of {count} are missing from {output}")
+    return [found[(i, count)] for i in range(count)]
+
+
+def merge_journals(shards, path):
+    """
+    Concatenates the journals of the shards into one journal at `path`,
+    keeping the run config once; shards run with different configs are refused
+    """
+
+    configs = {shard: read_config(shard / "prompt_journal.jsonl") for shard in shards}
+    if len({json.dumps(config, sort_keys=True) for config in configs.values()}) > 1:
+        raise ValueError(f"the shards in {Path(path).parent} were run with different configs")
+    with open(path, "w", encoding="utf-8") as out:
+        config = next(iter(configs.values()), None)
+        if config is not None:
+            out.write(json.dumps({"config": config}) + "\n")
+        for shard in shards:
+            with open(shard / "prompt_journal.jsonl", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip() and not line.startswith('{"config"'):
+                        out.write(line if line.endswith("\n") else line + "\n")
+
+
+def read_run_stats(directory):
+    "Reads the prompt_run_stats.txt of a run into a dict of strings"
+
+    with open(Path(directory) / "prompt_run_stats.txt") as f:
+        return dict(line.strip().split(": ", 1) for line in f if ": " in line)
@@ -0,0 +1,101 @@
+"""
+structured_output.py
+
+JSON schemas passed to ollama's `format` parameter so the model can only
+answer with labels from AllowedLabels, and a tolerant parser that
+recovers label lists from answers that are almost, but not quite, a
+valid Python / JSON literal.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import ast
+import json
+import re
+
+from ollama_client import answer_end
+
+UNSCORABLE = "Unscorable"
+QUOTED = re.compile(r"""(?:'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)")""")
+LABELS_KEY = re.compile(r"""['"]labels['"]""")
+
+
+def label_schema(allowed_labels, answer="list"):
+    """
+    Returns the schema of an alphabetised array of distinct allowed labels,
+    or for answer="dict" the {reasoning, labels} object of the CoT prompt
+    """
+
+    labels = {"type": "array",
+              "items": {"type": "string", "enum": list(allowed_labels) + [UNSCORABLE]},
+              "uniqueItems": True}
+    if answer == "list":
+        return labels
+    return {"type": "object",
+            "properties": {"reasoning": {"type": "string"},
+                           "labels": labels},
+            "required": ["reasoning", "labels"]}
+
+
+def _literal(text):
+    "Parses a Python or JSON literal, None if it is neither"
+
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        pass
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def _labels(parsed, answer):
+    if answer == "dict":
+        parsed = parsed.get('labels') if isinstance(parsed, dict) else None
+    if isinstance(parsed, (list, tuple)) and all(isinstance(label, str) for label in parsed):
+        return list(parsed)
+    return None
+
+
+class LabelParser:
+    "Maps model answers to label lists, matching label names case-insensitively"
+
+    def __init__(self, allowed_labels):
+        self.canonical = {label.strip().lower(): label for label in allowed_labels}
+        self.canonical[UNSCORABLE.lower()] = UNSCORABLE
+
+    def normalise(self, labels):
+        "Replaces near-miss spellings (case, surrounding spaces) by the allowed label names"
+
+        return [self.canonical.get(label.strip().lower(), label) for label in labels]
+
+    def parse(self, text, answer="list"):
+        """
+        Returns (labels, strict), strict being True when the whole answer
+        was already a valid literal. Otherwise the first complete list /
+        dict in the answer is used, and failing that every quoted allowed
+        label it mentions. Raises ValueError if nothing can be recovered.
+        """
+
+        labels = _labels(_literal(text.strip()), answer)
+        if labels is not None:
+            return self.normalise(labels), True
+
+        start = text.find("[" if answer == "list" else "{")
+        end = answer_end(text, answer)
+        if end is not None:
+            labels = _labels(_literal(text[start:end]), answer)
+            if labels is not None:
+                return self.normalise(labels), False
+
+        # the CoT reasoning may name labels it decided against
+        key = LABELS_KEY.search(text) if answer == "dict" else None
+        if key:
+            text = text[key.end():]
+        quoted = [a or b for a, b in QUOTED.findall(text)]
+        labels = [self.canonical[q.strip().lower()] for q in quoted if q.strip().lower() in self.canonical]
+        if labels:
+            return list(dict.fromkeys(labels)), False
+        raise ValueError(f"no label list found in {text[:80]!r}")
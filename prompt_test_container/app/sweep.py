@@ -0,0 +1,288 @@
+"""
+sweep.py
+
+Sweeps ollama runtime parameters and reports how each setting trades
+throughput against F1. For every combination of the grid a model
+variant is created from its base model through /api/create (the
+Modelfile of each variant is saved with its results), a fixed, seeded
+subset of the validation images is run through prompts.py, and the
+images/s, prompt-eval and generation tokens/s, peak memory and F1 of
+the run are collected in sweep_results.csv, with the Pareto-optimal
+variants (no other variant is both faster and more accurate) marked.
+plots/sweep_pareto.py plots the results.
+
+num_ctx, num_batch, num_thread and num_predict are model parameters and
+`base` can be any pulled tag, e.g. a quantization variant such as
+qwen2.5vl:3b-q8_0. A null value keeps ollama's default. The number of
+parallel slots is a server setting: with --restart-cmd the server is
+restarted with OLLAMA_NUM_PARALLEL set to each value, otherwise
+`parallel` only sets the concurrency of the client.
+
+Peak RSS is sampled with `docker stats` when --container is given (run
+the sweep on the docker host then); the memory ollama reports for the
+loaded model (/api/ps) is recorded either way.
+
+Usage: python sweep.py --grid grid.json --limit 50 --prompts 0 \
+           --container benthiq-container --restart-cmd "docker compose up -d --force-recreate ollama"
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+from ollama_client import OLLAMA_URL, api_base, wait_until_ready
+
+DEFAULT_GRID = {"base": ["qwen2.5vl:3b"],
+                "num_ctx": [4096, 8192],
+                "num_batch": [256, 512],
+                "num_thread": [None],
+                "num_predict": [512],
+                "parallel": [1, 2]}
+MODEL_PARAMETERS = ("num_ctx", "num_batch", "num_thread", "num_predict")
+# the outputs of prompts.py a run is scored from
+RUN_OUTPUTS = ("prompt_run_stats.txt", "prompt_requests.csv", "prompt_journal.jsonl")
+SIZE_UNITS = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4,
+              "kB": 1000, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+
+
+def default_modelfile():
+    """
+    Returns the repo's ollama_container/Modelfile, or None when sweep.py
+    runs outside the repo (e.g. as /app/sweep.py in the app container)
+    """
+
+    for parent in Path(__file__).resolve().parents:
+        path = parent / "ollama_container" / "Modelfile"
+        if path.exists():
+            return str(path)
+    return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweeps ollama runtime parameters against throughput and F1.")
+    parser.add_argument("--grid", help="json file mapping each parameter to the values to try")
+    parser.add_argument("--limit", type=int, default=50, help="number of validation images per run")
+    parser.add_argument("--prompts", type=int, nargs="+", default=[0], help="prompts to run")
+    parser.add_argument("--workdir", default=".", help="directory holding data/ and images/ for prompts.py")
+    parser.add_argument("--output-dir", default="./data/sweep")
+    parser.add_argument("--modelfile", default=os.getenv('MODELFILE') or default_modelfile(),
+                        help="Modelfile whose SYSTEM prompt and parameters every variant keeps, "
+                             "the repo's ollama_container/Modelfile by default")
+    parser.add_argument("--container", help="docker container of ollama, to sample its memory with docker stats")
+    parser.add_argument("--restart-cmd", help="shell command restarting ollama, run with OLLAMA_NUM_PARALLEL set")
+    parser.add_argument("--cleanup", action="store_true", help="delete the variant models after their run")
+    return parser.parse_args()
+
+
+def read_modelfile(path):
+    "Returns the SYSTEM prompt and PARAMETERs of a Modelfile, falling back to temperature 0 if it is missing"
+
+    if path is None or not Path(path).exists():
+        print(f"⚠ No Modelfile at {path}, the variants only set temperature 0")
+        return None, {"temperature": 0}
+    text = Path(path).read_text()
+    system = re.search(r'SYSTEM\s+"""(.*?)"""', text, re.S)
+    parameters = {}
+    for name, value in re.findall(r"^PARAMETER\s+(\S+)\s+(.+)$", text, re.M):
+        parameters[name] = json.loads(value) if re.fullmatch(r"-?\d+(\.\d+)?", value.strip()) else value.strip()
+    return system.group(1) if system else None, parameters
+
+
+def variants(grid):
+    "Returns one dict per combination of the grid, grouped by parallel so the server restarts as little as possible"
+
+    grid = {**DEFAULT_GRID, **grid}
+    keys = list(grid)
+    combinations = [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+    return sorted(combinations, key=lambda v: v['parallel'])
+
+
+def variant_name(variant):
+    "Returns a model name describing the variant, e.g. sweep-qwen2.5vl-3b:ctx4096-batch512-thread0-predict512"
+
+    base = re.sub(r"[^A-Za-z0-9._-]", "-", variant['base'])
+    tag = "-".join(f"{p.removeprefix('num_')}{variant[p] or 0}" for p in MODEL_PARAMETERS)
+    return f"sweep-{base}:{tag}"
+
+
+def modelfile(variant, system, parameters):
+    "Returns the Modelfile text of a variant, saved for reproducing it with `ollama create`"
+
+    lines = [f"FROM {variant['base']}", ""]
+    lines += [f"PARAMETER {k} {v}" for k, v in parameters.items()]
+    if system is not None:
+        lines += ["", f'SYSTEM """{system}"""']
+    return "\n".join(lines) + "\n"
+
+
+def create_model(name, variant, system, parameters, url):
+    "Creates the variant through /api/create from its base model"
+
+    body = {"model": name, "from": variant['base'], "parameters": parameters, "stream": False}
+    if system is not None:
+        body["system"] = system
+    response = requests.post(api_base(url) + "/api/create", json=body, timeout=3600)
+    response.raise_for_status()
+
+
+def delete_model(name, url):
+    requests.delete(api_base(url) + "/api/delete", json={"model": name}, timeout=60)
+
+
+def loaded_size(name, url):
+    "Returns the memory ollama reports for a loaded model in /api/ps, None if it is not loaded"
+
+    try:
+        models = requests.get(api_base(url) + "/api/ps", timeout=10).json().get('models', [])
+    except (requests.RequestException, ValueError):
+        return None
+    return next((m.get('size') for m in models if m.get('name') == name or m.get('model') == name), None)
+
+
+def parse_size(text):
+    "Parses a docker stats size such as '1.5GiB' into bytes"
+
+    match = re.match(r"([\d.]+)\s*([A-Za-z]+)", text.strip())
+    return float(match.group(1)) * SIZE_UNITS.get(match.group(2), 1) if match else None
+
+
+class MemorySampler(threading.Thread):
+    "Keeps the peak memory usage docker stats reports for a container while it runs"
+
+    def __init__(self, container, interval=2):
+        super().__init__(daemon=True)
+        self.container = container
+        self.interval = interval
+        self.peak = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                usage = subprocess.run(["docker", "stats", "--no-stream", "--format", "{{.MemUsage}}",
+                                        self.container], capture_output=True, text=True, timeout=30).stdout
+                used = parse_size(usage.split("/")[0]) if usage else None
+            except (OSError, subprocess.TimeoutExpired):
+                used = None
+            if used is not None:
+                self.peak = max(self.peak or 0, used)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def clear_outputs(output):
+    "Deletes the outputs of an earlier run, so a failed run is never scored from them"
+
+    for name in RUN_OUTPUTS:
+        (Path(output) / name).unlink(missing_ok=True)
+
+
+def run_metrics(output):
+    "Reads throughput, token rates and F1 from the outputs prompts.py wrote to `output`"
+
+    with open(output / "prompt_run_stats.txt") as f:
+        stats = dict(line.strip().split(": ", 1) for line in f if ": " in line)
+    df = pd.read_csv(output / "prompt_requests.csv")
+    served = df.dropna(subset=["total_duration"])
+    return {"images_per_s": float(stats['images_per_s']),
+            "requests_per_s": float(stats['requests_per_s']),
+            "prompt_eval_tokens_per_s": float(served['prompt_eval_count'].sum()
+                                              / (served['prompt_eval_duration'].sum() / 1e9)),
+            "eval_tokens_per_s": float(served['eval_count'].sum() / (served['eval_duration'].sum() / 1e9)),
+            "latency_p50_s": float(df['time'].quantile(0.5)),
+            "latency_p95_s": float(df['time'].quantile(0.95)),
+            "f1": float(df['f1'].mean()),
+            "failed_parse": int((df['status'] == "failed_parse").sum()),
+            "timeouts": int((df['status'] == "timeout").sum())}
+
+
+def pareto_front(df, x="images_per_s", y="f1"):
+    "Marks the rows no other row beats on both x and y (higher is better for both)"
+
+    values = df[[x, y]].to_numpy()
+    dominated = [bool(np.any(np.all(values >= v, axis=1) & np.any(values > v, axis=1))) for v in values]
+    return ~np.array(dominated, dtype=bool)
+
+
+def main():
+    args = parse_args()
+    url = OLLAMA_URL
+    grid = json.loads(Path(args.grid).read_text()) if args.grid else {}
+    system, base_parameters = read_modelfile(args.modelfile)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    parallel = None
+    for variant in variants(grid):
+        name = variant_name(variant)
+        out = output_dir / re.sub(r"[^A-Za-z0-9._-]", "_", f"{name}_par{variant['parallel']}")
+        out.mkdir(parents=True, exist_ok=True)
+        print(f"--- {name}, {variant['parallel']} parallel slots ---")
+
+        if args.restart_cmd and variant['parallel'] != parallel:
+            env = {**os.environ, "OLLAMA_NUM_PARALLEL": str(variant['parallel'])}
+            subprocess.run(args.restart_cmd, shell=True, check=True, env=env)
+            parallel = variant['parallel']
+            if not wait_until_ready(variant['base'], url):
+                print(f"ollama did not come back with {variant['base']}, skipping")
+                continue
+
+        parameters = {**base_parameters,
+                      **{p: variant[p] for p in MODEL_PARAMETERS if variant[p] is not None}}
+        (out / "Modelfile").write_text(modelfile(variant, system, parameters))
+        try:
+            create_model(name, variant, system, parameters, url)
+        except requests.RequestException as e:
+            print(f"could not create {name}: {e}")
+            continue
+
+        sampler = MemorySampler(args.container) if args.container else None
+        if sampler:
+            sampler.start()
+        command = [sys.executable, str(Path(__file__).with_name("prompts.py")),
+                   "--model", name, "--limit", str(args.limit), "--prompts", *map(str, args.prompts),
+                   "--concurrency", str(variant['parallel']), "--warmup", "1", "--output-dir", str(out.resolve())]
+        clear_outputs(out)
+        process = subprocess.run(command, cwd=args.workdir)
+        peak_rss = sampler.stop() if sampler else None
+
+        if process.returncode != 0 or not (out / "prompt_run_stats.txt").exists():
+            print(f"run of {name} failed")
+            continue
+        results.append({"model": name, **variant,
+                        **run_metrics(out),
+                        "peak_rss_gb": peak_rss / 1024 ** 3 if peak_rss else None,
+                        "model_size_gb": (loaded_size(name, url) or np.nan) / 1024 ** 3})
+        print(results[-1])
+        if args.cleanup:
+            delete_model(name, url)
+
+        # written after every run, so an interrupted sweep keeps what it measured
+        df = pd.DataFrame(results)
+        df['pareto'] = pareto_front(df)
+        df.sort_values("images_per_s", ascending=False).to_csv(output_dir / "sweep_results.csv", index=False)
+
+    if results:
+        print(df[df['pareto']].sort_values("images_per_s", ascending=False).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
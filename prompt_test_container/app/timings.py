@@ -0,0 +1,59 @@
+"""
+timings.py
+
+Server-side timing breakdown that ollama returns with every
+non-streaming /api/chat response, and its summary per prompt.
+
+Durations are reported by ollama in nanoseconds.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import pandas as pd
+
+FIELDS = ("total_duration", "load_duration", "prompt_eval_count",
+          "prompt_eval_duration", "eval_count", "eval_duration")
+
+# a model that is already in memory reports a load of a few milliseconds
+LOAD_EVENT_MS = 500
+
+
+def extract_timings(body):
+    "Returns the timing fields of an ollama response body, None for those it lacks"
+
+    return {field: body.get(field) for field in FIELDS}
+
+
+def summarise(df):
+    """
+    Summarises a dataframe with a 'prompt' column and the timing FIELDS
+    into one row per prompt: tokens/s, milliseconds per image and the
+    number of requests where the model had to be loaded
+    """
+
+    df = df.dropna(subset=["total_duration"])
+    grouped = df.groupby("prompt")
+    summary = pd.DataFrame({
+        "requests": grouped.size(),
+        "total_ms": grouped["total_duration"].mean() / 1e6,
+        "load_ms": grouped["load_duration"].mean() / 1e6,
+        "load_events": grouped["load_duration"].apply(lambda d: int((d / 1e6 > LOAD_EVENT_MS).sum())),
+        "prompt_eval_tokens": grouped["prompt_eval_count"].mean(),
+        "prompt_eval_ms": grouped["prompt_eval_duration"].mean() / 1e6,
+        "prompt_eval_tokens_per_s": grouped["prompt_eval_count"].sum()
+                                    / (grouped["prompt_eval_duration"].sum() / 1e9),
+        "eval_tokens": grouped["eval_count"].mean(),
+        "eval_ms": grouped["eval_duration"].mean() / 1e6,
+        "eval_tokens_per_s": grouped["eval_count"].sum() / (grouped["eval_duration"].sum() / 1e9),
+    })
+    return summary
+
+
+def latency_percentiles(df, columns=("time", "ttft", "itl_mean")):
+    "Returns the p50 / p95 / p99 of each latency column, one row per prompt"
+
+    columns = [c for c in columns if c in df.columns]
+    percentiles = df.groupby("prompt")[columns].quantile([0.5, 0.95, 0.99]).unstack()
+    percentiles.columns = [f"{column}_p{round(q * 100)}" for column, q in percentiles.columns]
+    return percentiles
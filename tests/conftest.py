@@ -0,0 +1,16 @@
+"""
+conftest.py
+
+The app and dataset scripts import each other as flat modules, so their
+folders are put on the path the way running them from there would.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+for folder in ("prompt_test_container/app", "preparing_dataset"):
+    sys.path.insert(0, str(ROOT / folder))
@@ -0,0 +1,81 @@
+"""
+test_csv_combine.py
+
+Tests of the streaming combine of squidle+ exports, in particular exports
+whose schemas differ and widen the dataset's schema.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from csv_combine import cast_array, combine, load_manifest, partition_path
+
+
+def export(folder, name, text):
+    folder.mkdir(exist_ok=True)
+    (folder / name).write_text(text)
+
+
+def read(output):
+    df = pd.read_parquet(output)
+    df = df.astype({c: object for c in df.select_dtypes("category").columns})
+    return df.sort_values(["export"], kind="stable").reset_index(drop=True)
+
+
+def test_widening_schemas_across_exports(tmp_path):
+    exports, output = tmp_path / "datasets", tmp_path / "combined"
+    export(exports, "annotations_1.csv", "x,n,flag,label.name\n1,1,True,Sand\n2,2,False,Sand\n3,3,True,Sand\n")
+    combine(exports, output, chunksize=2)
+    assert pq.read_schema(partition_path(output, "annotations_1.csv")).field("n").type == pa.int8()
+
+    # x turns into repeated strings, n outgrows int8 and becomes float, flag holds text,
+    # and a new column appears
+    export(exports, "annotations_2.csv",
+           "x,n,flag,label.name,comment\nfoo,1000.5,maybe,Kelp\nfoo,2,yes,Kelp,checked\nfoo,,no,Kelp,\n")
+    combine(exports, output, chunksize=2)
+
+    schema = pq.read_schema(output / "_common_metadata")
+    assert pa.types.is_dictionary(schema.field("x").type)
+    assert schema.field("n").type == pa.float64()
+    assert pa.types.is_string(schema.field("flag").type)
+    for name in ("annotations_1.csv", "annotations_2.csv"):
+        assert pq.read_schema(partition_path(output, name)).equals(schema)
+
+    df = read(output)
+    assert list(df["x"]) == ["1", "2", "3", "foo", "foo", "foo"]
+    assert list(df["n"][:5]) == [1, 2, 3, 1000.5, 2] and pd.isna(df["n"][5])
+    assert list(df["flag"]) == ["True", "False", "True", "maybe", "yes", "no"]
+    assert list(df["label.name"]) == ["Sand"] * 3 + ["Kelp"] * 3
+    assert df["comment"][:3].isna().all() and df["comment"][4] == "checked"
+
+
+def test_rerun_only_processes_new_changed_and_removed_exports(tmp_path):
+    exports, output = tmp_path / "datasets", tmp_path / "combined"
+    for i in range(3):
+        export(exports, f"annotations_{i}.csv", f"point.media.id,label.name\n{i},Sand\n{i},Kelp\n")
+    assert combine(exports, output) == [f"annotations_{i}.csv" for i in range(3)]
+    assert combine(exports, output) == []
+
+    export(exports, "annotations_1.csv", "point.media.id,label.name\n1,Sand\n")
+    (exports / "annotations_2.csv").unlink()
+    assert combine(exports, output) == ["annotations_1.csv"]
+    assert set(load_manifest(output)["files"]) == {"annotations_0.csv", "annotations_1.csv"}
+    assert len(read(output)) == 3
+    assert not partition_path(output, "annotations_2.csv").exists()
+
+
+@pytest.mark.parametrize("array, to_type, expected", [
+    (pa.array([1, None, 3], pa.int8()), pa.dictionary(pa.int32(), pa.string()), ["1", None, "3"]),
+    (pa.array([1, 2], pa.int8()), pa.int32(), [1, 2]),
+    (pa.array([True, None]), pa.string(), ["True", None]),
+    (pa.array(["a", "a"]).dictionary_encode(), pa.string(), ["a", "a"]),
+])
+def test_cast_array(array, to_type, expected):
+    result = cast_array(array, to_type)
+    assert result.type == to_type
+    assert result.to_pylist() == expected
@@ -0,0 +1,59 @@
+"""
+test_derivative_store.py
+
+Tests of the content-addressed image store and its resized derivatives.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from derivative_store import DerivativeStore, parse_size
+
+
+def jpeg_bytes(color, size=(320, 240)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_originals_are_stored_once_per_content(tmp_path):
+    store = DerivativeStore(tmp_path / "store")
+    first = store.add(1000, jpeg_bytes("blue"), url="http://images/1000.jpg")
+    assert store.add("1001", jpeg_bytes("blue")) == first
+    store.add(1002, jpeg_bytes("red"))
+    assert 1001 in store and store.index['1000']['size'] == [320, 240]
+    assert store.stats() == {"images": 3, "originals": 2}
+
+
+def test_generate_export_and_reload(tmp_path):
+    store = DerivativeStore(tmp_path / "store")
+    store.add(1000, jpeg_bytes("blue"))
+    store.add(1001, jpeg_bytes("red"))
+    sizes = [parse_size("64x48"), parse_size("160x120")]
+    assert store.generate(sizes, processes=1) == 2
+    assert store.generate(sizes, processes=1) == 0
+
+    assert store.export((64, 48), tmp_path / "images") == 2
+    with Image.open(tmp_path / "images" / "1001.jpg") as img:
+        assert img.size == (64, 48)
+
+    store = DerivativeStore(tmp_path / "store")
+    assert store.stats() == {"images": 2, "originals": 2, "derivatives_160x120": 2, "derivatives_64x48": 2}
+    with Image.open(store.path(1000, (32, 24))) as img:
+        assert img.size == (32, 24)
+
+
+def test_threads_adding_the_same_bytes(tmp_path):
+    store = DerivativeStore(tmp_path / "store")
+    content = jpeg_bytes("green", size=(1600, 1200))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        digests = set(pool.map(lambda k: store.add(k, content), range(1000, 1032)))
+    assert len(digests) == 1 and store.stats() == {"images": 32, "originals": 1}
+    original = store.original_path(digests.pop())
+    assert original.read_bytes() == content
+    assert list(original.parent.iterdir()) == [original]
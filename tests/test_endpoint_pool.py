@@ -0,0 +1,48 @@
+"""
+test_endpoint_pool.py
+
+Tests of the load balancing over several ollama servers.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import pytest
+
+from endpoint_pool import EndpointPool, parse_urls
+
+URLS = ["http://a:11434/api/chat", "http://b:11434/api/chat"]
+
+
+def test_parse_urls():
+    assert parse_urls(" http://a:11434/api/chat,,http://b:11434/api/chat ") == URLS
+    with pytest.raises(ValueError):
+        EndpointPool.from_env("")
+
+
+def test_least_outstanding_requests():
+    pool = EndpointPool(URLS)
+    first, second = pool.acquire(), pool.acquire()
+    assert {first.url, second.url} == set(URLS)
+    pool.release(first, 0.1, failed=False)
+    assert pool.acquire() is first
+    assert pool.acquire(exclude=pool.endpoints) is None
+
+
+def test_failures_in_a_row_eject_an_endpoint():
+    pool = EndpointPool(URLS, max_failures=2, eject_s=60)
+    a, b = pool.endpoints
+    for _ in range(2):
+        pool.release(pool.acquire(exclude=[b]), 1.0, failed=True)
+    assert [row['ejected'] for row in pool.stats()] == [True, False]
+    assert all(pool.acquire() is b for _ in range(3))
+    # with every endpoint ejected the run carries on with the one readmitted soonest
+    assert pool.acquire(exclude=[b]) is a
+
+
+def test_affinity_sticks_within_the_slack():
+    pool = EndpointPool(URLS, affinity_slack=1)
+    sticky = pool.acquire(affinity=0)
+    assert pool.acquire(affinity=0) is sticky
+    # two more in flight than the other endpoint, past the slack
+    assert pool.acquire(affinity=0) is not sticky
@@ -0,0 +1,48 @@
+"""
+test_image_budget.py
+
+Tests of downsizing images to a vision-token budget.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import pytest
+from PIL import Image
+
+from image_budget import PATCH, ImageBudget, fit, vision_tokens
+
+
+def test_vision_tokens():
+    assert vision_tokens(640, 480) == 23 * 17
+    assert vision_tokens(10, 10) == 1
+
+
+@pytest.mark.parametrize("size", [(1600, 1200), (1920, 1080), (480, 3000), (100, 100)])
+@pytest.mark.parametrize("max_tokens", [16, 64, 256, 1024])
+def test_fit_stays_within_the_budget(size, max_tokens):
+    width, height = fit(*size, max_tokens)
+    assert vision_tokens(width, height) <= max_tokens or (width, height) == size
+    if (width, height) != size:
+        assert width % PATCH == 0 and height % PATCH == 0
+        assert width <= size[0] and height <= size[1]
+        # both sides are scaled alike, up to the rounding down to whole patches
+        assert abs(width / size[0] - height / size[1]) <= PATCH / min(size)
+
+
+def test_prepare_resizes_once_and_keeps_small_images(tmp_path):
+    large, small = tmp_path / "1000.jpg", tmp_path / "1001.jpg"
+    Image.new("RGB", (1600, 1200)).save(large)
+    Image.new("RGB", (112, 84)).save(small)
+    budget = ImageBudget(tmp_path / "budget")
+
+    path, (width, height, tokens) = budget.prepare(str(large), 256)
+    assert path != str(large) and tokens <= 256
+    with Image.open(path) as img:
+        assert img.size == (width, height)
+    assert budget.prepare(str(large), 256)[0] == path
+    # a new process finds the resized image on disk
+    assert ImageBudget(tmp_path / "budget").prepare(str(large), 256)[0] == path
+    assert budget.resized == 1
+
+    assert budget.prepare(str(small), 256) == (str(small), (112, 84, 12))
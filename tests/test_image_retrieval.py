@@ -0,0 +1,64 @@
+"""
+test_image_retrieval.py
+
+Downloads images from fake_image_host.py, with missing and broken
+images, an interrupted earlier run and the retry manifest.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import asyncio
+import socket
+import threading
+
+import pytest
+from aiohttp import web
+from PIL import Image
+
+from fake_image_host import create_app, parse_args, write_csv
+from image_retrieval import image_urls, is_valid, load_manifest, retrieve, save_manifest
+
+
+@pytest.fixture
+def image_host():
+    "Runs the fake image host in a thread, yielding its base url"
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    config = parse_args(["--images", "6", "--size", "320", "240", "--missing", "1004", "--broken", "1005"])
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(create_app(config))
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{port}"
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
+
+
+def test_retrieve_resizes_and_records_failures(tmp_path, image_host):
+    write_csv(tmp_path / "images.csv", image_host, 6)
+    urls = image_urls(tmp_path / "images.csv", n=0)
+    folder = tmp_path / "images"
+    folder.mkdir()
+    # left by an interrupted run, never read as an image
+    (folder / ".1000.jpg.abc.tmp").write_bytes(b"\xff\xd8")
+    (folder / "1001.tmp").write_bytes(b"\xff\xd8")
+
+    saved, skipped, failed = retrieve(urls, folder, (64, 48), workers=4, processes=1)
+    assert (saved, skipped, sorted(failed)) == (4, 0, [1004, 1005])
+    assert sorted(path.name for path in folder.iterdir()) == [f"{k}.jpg" for k in range(1000, 1004)]
+    assert all(is_valid(folder / f"{k}.jpg", (64, 48)) for k in range(1000, 1004))
+    with Image.open(folder / "1002.jpg") as img:
+        assert img.mode == "RGB"
+
+    save_manifest(failed, tmp_path / "retry.json")
+    retry = {k: v['url'] for k, v in load_manifest(tmp_path / "retry.json").items()}
+    assert retry == {1004: urls[1004], 1005: urls[1005]}
+    # a rerun skips the images already saved at the right resolution
+    assert retrieve(urls, folder, (64, 48), workers=4, processes=1)[:2] == (0, 4)
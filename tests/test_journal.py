@@ -0,0 +1,65 @@
+"""
+test_journal.py
+
+Tests of the result journal prompts.py resumes from.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import pytest
+
+from journal import Journal, read_config
+
+
+def test_resume_keeps_the_latest_record_and_skips_a_torn_line(tmp_path):
+    journal = Journal(tmp_path / "prompt_journal.jsonl")
+    journal.append({"image_id": "1000", "prompt": 0, "answer": "['Sand']"})
+    journal.append({"image_id": "1000", "prompt": 0, "answer": "['Sponges']"})
+    journal.append({"image_id": "1001", "prompt": 0, "answer": "[]", "sample": 1})
+    journal.close()
+    # a crash halfway through writing a line
+    with open(tmp_path / "prompt_journal.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"image_id": "1002", "pro')
+
+    journal = Journal(tmp_path / "prompt_journal.jsonl", resume=True)
+    assert journal.records() == [{"image_id": "1000", "prompt": 0, "answer": "['Sponges']"}]
+    assert journal.completed() == {("1000", 0)}
+    assert journal.completed(sample=1) == {("1001", 0)}
+    journal.close()
+
+
+def test_without_resume_the_journal_starts_empty(tmp_path):
+    journal = Journal(tmp_path / "prompt_journal.jsonl")
+    journal.append({"image_id": "1000", "prompt": 0, "answer": "['Sand']"})
+    journal.close()
+
+    journal = Journal(tmp_path / "prompt_journal.jsonl")
+    assert journal.completed() == set()
+    journal.close()
+
+
+def test_resume_refuses_a_journal_of_another_config(tmp_path):
+    config = {"model": "Benthiq:3b", "label_codes": False, "demo_image_ids": (1000, 1001)}
+    journal = Journal(tmp_path / "prompt_journal.jsonl", resume=True, config=config)
+    journal.append({"image_id": "1000", "prompt": 0, "answer": "['Sand']"})
+    journal.close()
+
+    journal = Journal(tmp_path / "prompt_journal.jsonl", resume=True, config=config)
+    assert journal.config()['demo_image_ids'] == [1000, 1001]
+    assert journal.completed() == {("1000", 0)}
+    journal.close()
+    with pytest.raises(ValueError, match="different label_codes, model"):
+        Journal(tmp_path / "prompt_journal.jsonl", resume=True,
+                config={**config, "model": "Benthiq:7b", "label_codes": True})
+    # a new run replaces the journal and its config
+    Journal(tmp_path / "prompt_journal.jsonl", config={**config, "model": "Benthiq:7b"}).close()
+    assert read_config(tmp_path / "prompt_journal.jsonl")["model"] == "Benthiq:7b"
+
+
+def test_resume_refuses_a_journal_without_config(tmp_path):
+    journal = Journal(tmp_path / "prompt_journal.jsonl")
+    journal.append({"image_id": "1000", "prompt": 0, "answer": "['Sand']"})
+    journal.close()
+    with pytest.raises(ValueError, match="no run config"):
+        Journal(tmp_path / "prompt_journal.jsonl", resume=True, config={"model": "Benthiq:3b"})
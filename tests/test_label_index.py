@@ -0,0 +1,37 @@
+"""
+test_label_index.py
+
+Tests of the labels kept per region by --prune-labels.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import pytest
+
+from label_index import LabelIndex, parse_coverage
+
+INDEX = LabelIndex("ECOREGION", {"Bassian": {"images": 30, "labels": {"Sand": 20, "Kelp": 8, "Sponges": 2}},
+                                 "Cortezian": {"images": 5, "labels": {"Sand": 5}},
+                                 "Manning-Hawkesbury": {"images": 25, "labels": {}}})
+
+
+@pytest.mark.parametrize("coverage, expected", [(0.01, ["Sand"]), (0.6, ["Sand"]), (0.9, ["Sand", "Kelp"]),
+                                                (1.0, ["Sand", "Kelp", "Sponges"])])
+def test_candidates_cover_the_share_of_labels(coverage, expected):
+    assert INDEX.candidates("Bassian", coverage) == expected
+
+
+def test_small_unknown_and_empty_regions_keep_the_full_list():
+    assert INDEX.candidates("Cortezian", 0.9) is None
+    assert INDEX.candidates(None, 0.9) is None
+    assert INDEX.candidates("Manning-Hawkesbury", 0.9) is None
+
+
+@pytest.mark.parametrize("coverage", ["0", "-0.5", "1.5", "nan"])
+def test_a_coverage_outside_0_1_is_refused(coverage):
+    # an empty AllowedLabels list leaves the model no valid answer
+    with pytest.raises(ValueError):
+        parse_coverage(coverage)
+    with pytest.raises(ValueError):
+        INDEX.candidates("Bassian", float(coverage))
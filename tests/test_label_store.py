@@ -0,0 +1,58 @@
+"""
+test_label_store.py
+
+Tests of the pre-parsed label store, for both the split csvs (a tuple
+of labels per image) and combined.csv (a label per annotated point).
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from label_store import LabelStore, load_vectors, save_vectors, sidecar_path
+
+
+def write_csv(path, rows):
+    pd.DataFrame(rows, columns=['point.media.id', 'label.name']).to_csv(path, index=False)
+    return path
+
+
+def test_split_and_point_csvs_give_the_labels_of_each_image(tmp_path):
+    split = write_csv(tmp_path / "validation.csv", [(1000, "('Sand', 'Sponges')"), (1001, "('Sand',)")])
+    points = write_csv(tmp_path / "combined.csv", [(1000, "Sand"), (1000, "Sponges"), (1000, "Sand"),
+                                                   (1001, "Sand"), (1002, None)])
+    for path in (split, points):
+        store = LabelStore.from_csv(path)
+        assert len(store) == 2 and 1002 not in store
+        assert store.labels(1000) == ("Sand", "Sponges")
+        assert store.labels(1001) == ("Sand",)
+
+
+def test_multi_hot_follows_the_given_vocabulary_and_ids(tmp_path):
+    store = LabelStore.from_csv(write_csv(tmp_path / "test.csv", [(1000, "('Sand', 'Sponges')"),
+                                                                 (1001, "('Sand',)")]))
+    vectors = store.multi_hot(["Sponges", "Kelp", "Sand"], media_ids=[1001, 1000])
+    assert vectors.tolist() == [[False, False, True], [True, False, True]]
+
+
+def test_sidecar_is_rebuilt_when_the_csv_changes(tmp_path):
+    path = write_csv(tmp_path / "train.csv", [(1000, "('Sand',)")])
+    assert LabelStore.load(path).labels(1000) == ("Sand",)
+    assert sidecar_path(path).exists()
+
+    write_csv(path, [(1000, "('Sponges', 'Kelp')")])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert LabelStore.load(path).labels(1000) == ("Sponges", "Kelp")
+
+
+def test_vectors_round_trip_bit_packed(tmp_path):
+    vectors = np.array([[True, False, True] + [False] * 7, [False] * 9 + [True]])
+    save_vectors(tmp_path / "test.csv", np.array([1000, 1001]), vectors, [f"L{i}" for i in range(10)])
+    media_ids, packed, vocabulary = load_vectors(tmp_path / "test.csv")
+    assert media_ids.tolist() == [1000, 1001]
+    assert np.unpackbits(packed, axis=1, count=len(vocabulary)).astype(bool).tolist() == vectors.tolist()
@@ -0,0 +1,62 @@
+"""
+test_metrics.py
+
+Tests of the vectorized multi-label metrics against the per-sample set
+arithmetic they replaced.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import numpy as np
+import pytest
+
+from metrics import binarize, label_vocabulary, per_class, sample_f1, sample_jaccard, unpack
+
+
+def set_f1(y_true, y_pred):
+    "The F1 of f1_score_custom, for comparison"
+
+    y_true, y_pred = set(y_true), set(y_pred)
+    if not y_true and not y_pred:
+        return 1.0
+    return 2 * len(y_true & y_pred) / (len(y_true) + len(y_pred))
+
+
+def test_sample_f1_matches_set_arithmetic():
+    true = [("Sand",), ("Sand", "Sponges"), (), ("Kelp",)]
+    pred = [["Sand"], ["Sand", "Kelp"], [], ["Failed"]]
+    vocabulary = label_vocabulary(true, pred)
+    scores = sample_f1(binarize(true, vocabulary), binarize(pred, vocabulary))
+    assert scores == pytest.approx([set_f1(t, p) for t, p in zip(true, pred)])
+
+
+def test_non_str_labels_count_as_false_positives():
+    true = [("Sand",), ("Kelp",)]
+    pred = [["Sand", None], ["Kelp", 3, ["nested"]]]
+    vocabulary = label_vocabulary(true, pred)
+    assert vocabulary == sorted(vocabulary)
+    scores = sample_f1(binarize(true, vocabulary), binarize(pred, vocabulary))
+    assert scores == pytest.approx([2 / 3, 0.5])
+
+
+def test_stacked_runs_and_packed_rows():
+    rng = np.random.default_rng(0)
+    y_true = rng.random((50, 13)) < 0.3
+    y_pred = rng.random((3, 50, 13)) < 0.3
+    stacked = sample_f1(y_true, y_pred)
+    assert stacked.shape == (3, 50)
+    assert stacked[1] == pytest.approx(sample_f1(y_true, y_pred[1]))
+    packed = sample_jaccard(np.packbits(y_true, axis=-1), np.packbits(y_pred[0], axis=-1))
+    assert packed == pytest.approx(sample_jaccard(y_true, y_pred[0]))
+    assert (unpack(np.packbits(y_true, axis=-1), 13) == y_true).all()
+
+
+def test_per_class_zero_division():
+    y_true = np.array([[1, 0], [1, 0]], dtype=bool)
+    y_pred = np.array([[1, 0], [0, 0]], dtype=bool)
+    precision, recall, f1, support = per_class(y_true, y_pred)
+    assert precision == pytest.approx([1.0, 0.0])
+    assert recall == pytest.approx([0.5, 0.0])
+    assert f1 == pytest.approx([2 / 3, 0.0])
+    assert list(support) == [2, 0]
@@ -0,0 +1,38 @@
+"""
+test_prompt_compiler.py
+
+Tests of the prompt compiler's label codes.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+from prompt_compiler import CODE_NOTE, PromptCompiler
+
+LABELS = ['Sponges', 'Sand', 'Crustose coralline algae']
+
+
+def test_names_mode_leaves_the_prompt_as_it_was():
+    compiler = PromptCompiler(LABELS)
+    assert compiler.render("$allowed_labels | $example") == \
+        f"{LABELS} | ['Crustose coralline algae', 'Sponges (encrusting)']"
+    assert compiler.decode(["L1"]) == ["L1"]
+
+
+def test_codes_round_trip_case_insensitively():
+    compiler = PromptCompiler(LABELS, codes=True)
+    assert compiler.allowed_labels() == \
+        "L3: Sponges\nL2: Sand\nL1: Crustose coralline algae\n" + CODE_NOTE
+    assert compiler.encode(['Sand', 'Kelp']) == ['L2']
+    assert compiler.decode(['l2', ' L3 ', 'L9', None]) == ['Sand', 'Sponges', 'L9', None]
+
+
+def test_example_falls_back_to_the_first_codes():
+    compiler = PromptCompiler(LABELS, codes=True)
+    assert compiler.render("$example $cot_example") == "['L1'] ['L1', 'L2']"
+
+
+def test_restrict_keeps_the_codes():
+    compiler = PromptCompiler(LABELS, codes=True).restrict(['Sand', 'Sponges'])
+    assert compiler.output_labels() == ['L3', 'L2']
+    assert compiler.decode(['L1']) == ['Crustose coralline algae']
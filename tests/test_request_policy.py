@@ -0,0 +1,90 @@
+"""
+test_request_policy.py
+
+Tests of the adaptive timeouts, backoff and circuit breaker.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import time
+
+import evaluation
+from request_policy import RequestPolicy
+
+
+def test_timeout_follows_the_p99_and_doubles_on_retries():
+    policy = RequestPolicy(max_timeout=600, min_timeout=1, factor=3.0, min_samples=20)
+    assert policy.timeout(0) == 600
+    for _ in range(20):
+        policy.record(0, 10.0, failed=False)
+    assert policy.timeout(0) == 30.0
+    assert policy.timeout(0, timeouts=2) == 120.0
+    assert policy.timeout(0, timeouts=10) == 600
+    # latencies are kept per prompt
+    assert policy.timeout(1) == 600
+
+
+def test_backoff_is_jittered_below_the_cap():
+    policy = RequestPolicy(backoff_base=1.0, backoff_cap=5, seed=0)
+    assert all(0 <= policy.backoff(attempt) <= min(5, 2 ** attempt) for attempt in range(1, 8) for _ in range(20))
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    policy = RequestPolicy(breaker_failures=3, breaker_reset_s=0.05)
+    for _ in range(3):
+        assert policy.wait() == 0
+        policy.record(0, 1.0, failed=True)
+    assert policy.breaker_opened == 1
+    assert policy.wait() > 0
+
+    time.sleep(0.06)
+    assert policy.wait() == 0
+    assert policy.wait() == 1.0
+    # a single failed trial opens it again
+    policy.record(0, 1.0, failed=True)
+    assert policy.wait() > 0
+    time.sleep(0.06)
+    assert policy.wait() == 0
+    policy.record(0, 1.0, failed=False)
+    assert policy.wait() == 0 and policy.wait() == 0
+
+
+def test_hedging_waits_for_the_quantile():
+    assert RequestPolicy(hedge=False).hedge_after(0) is None
+    policy = RequestPolicy(hedge=True, hedge_quantile=0.5, min_samples=3)
+    for latency in (1.0, 2.0, 3.0):
+        policy.record(0, latency, failed=False)
+    assert policy.hedge_after(0) == 2.0
+
+
+def test_attempts_share_one_max_timeout():
+    policy = RequestPolicy(max_timeout=600, min_timeout=30, backoff_base=1.0, backoff_cap=5, seed=0)
+    assert policy.timeout(0, elapsed=100) == 500
+    assert policy.retry_after(0, elapsed=100) is not None
+    # a request that timed out at the ceiling is not retried
+    assert policy.retry_after(0, elapsed=600) is None
+    assert policy.retry_after(policy.max_attempts - 1, elapsed=0) is None
+
+
+def test_timed_out_attempts_count_in_the_latencies():
+    policy = RequestPolicy(max_timeout=600, min_timeout=1, factor=1.0, min_samples=20)
+    for _ in range(19):
+        policy.record(0, 1.0, failed=False)
+    policy.record(0, 50.0, failed=True, timed_out=True)
+    assert policy.timeout(0) > 40
+
+
+def test_a_hung_request_stalls_a_worker_for_one_max_timeout(monkeypatch):
+    calls = []
+
+    def hung(messages, model, timeout, **kwargs):
+        calls.append(timeout)
+        time.sleep(timeout)
+        return {"message": None, "error": "Timeout"}
+
+    monkeypatch.setattr(evaluation, "call_ollama_api", hung)
+    policy = RequestPolicy(max_timeout=0.2, min_timeout=0.05, backoff_base=0.001, backoff_cap=0.001)
+    response, elapsed = evaluation._send({'prompt': 0, 'messages': []}, "Benthiq:3b", 0.2, {}, None, policy)
+    assert len(calls) == 1 and response['timeouts'] == 1
+    assert elapsed < 0.3
@@ -0,0 +1,51 @@
+"""
+test_response_cache.py
+
+Tests of the on-disk response cache, in particular that invalidating
+one model's responses leaves the other models sharing the directory alone.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+from PIL import Image
+
+from response_cache import ResponseCache
+
+RESPONSE = {"message": "['Sand']", "error": None, "timings": None}
+
+
+def messages(tmp_path, content="Which labels?"):
+    image = tmp_path / "1000.jpg"
+    if not image.exists():
+        Image.new("RGB", (8, 8)).save(image)
+    return [{"role": "user", "content": content, "images": [str(image)]}]
+
+
+def test_hit_after_put_and_options_in_key(tmp_path):
+    cache = ResponseCache(tmp_path / "cache", "Benthiq:3b@abc")
+    assert cache.get(messages(tmp_path)) is None
+    cache.put(messages(tmp_path), RESPONSE, 1.5)
+    response = cache.get(messages(tmp_path))
+    assert response == {**RESPONSE, "time": 1.5, "cached": True}
+    assert cache.get(messages(tmp_path), {"image_tokens": 256}) is None
+    # keep_alive does not change the answer
+    assert cache.get(messages(tmp_path), {"keep_alive": -1}) is not None
+
+
+def test_errors_are_not_cached(tmp_path):
+    cache = ResponseCache(tmp_path / "cache", "Benthiq:3b@abc")
+    cache.put(messages(tmp_path), {"message": None, "error": "Timeout"}, 600)
+    assert cache.get(messages(tmp_path)) is None
+
+
+def test_clear_only_invalidates_its_own_model(tmp_path):
+    small = ResponseCache(tmp_path / "cache", "Benthiq:3b@abc")
+    large = ResponseCache(tmp_path / "cache", "Benthiq:7b@def")
+    small.put(messages(tmp_path), RESPONSE, 1.0)
+    large.put(messages(tmp_path), RESPONSE, 2.0)
+
+    # the cascade opens the second model's cache after the first stage ran
+    ResponseCache(tmp_path / "cache", "Benthiq:7b@def").clear()
+    assert small.get(messages(tmp_path))['time'] == 1.0
+    assert large.get(messages(tmp_path)) is None
@@ -0,0 +1,77 @@
+"""
+test_shards.py
+
+Tests that the shards of a run partition its images exactly and merge
+back into one journal.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import json
+import random
+
+import numpy as np
+import pytest
+
+from shards import find_shards, merge_journals, parse_shard, read_run_stats, shard_dir, shard_items
+
+
+def shuffled(paths, seed=42):
+    "The image order of prompts.py: sorted, then shuffled with the run's seed"
+
+    paths = sorted(paths)
+    np.random.seed(seed)
+    np.random.shuffle(paths)
+    return paths
+
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    for value in ("4/4", "-1/2", "1", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7])
+def test_shards_partition_the_images(count):
+    paths = [f"images/{1000 + i}.jpg" for i in range(50)]
+    shards = [shard_items(shuffled(paths), i, count) for i in range(count)]
+    assert sorted(path for shard in shards for path in shard) == sorted(paths)
+    assert sum(map(len, shards)) == len(paths)
+
+
+def test_listing_order_does_not_change_the_shards():
+    paths = [f"images/{1000 + i}.jpg" for i in range(50)]
+    other_host = random.Random(1).sample(paths, len(paths))
+    assert shard_items(shuffled(paths), 0, 3) == shard_items(shuffled(other_host), 0, 3)
+
+
+def test_find_and_merge_shards(tmp_path):
+    for i in range(3):
+        shard = shard_dir(tmp_path, i, 3)
+        shard.mkdir()
+        (shard / "prompt_journal.jsonl").write_text(json.dumps({"config": {"model": "Benthiq:3b"}}) + "\n"
+                                                    + json.dumps({"image_id": i, "prompt": 0}))
+        (shard / "prompt_run_stats.txt").write_text(f"model: Benthiq:3b\nseconds: {i}\n")
+    shards = find_shards(tmp_path)
+    merge_journals(shards, tmp_path / "prompt_journal.jsonl")
+    lines = [json.loads(line) for line in (tmp_path / "prompt_journal.jsonl").read_text().splitlines()]
+    assert lines[0] == {"config": {"model": "Benthiq:3b"}}
+    assert [line['image_id'] for line in lines[1:]] == [0, 1, 2]
+    assert read_run_stats(shards[2]) == {"model": "Benthiq:3b", "seconds": "2"}
+
+
+def test_missing_shard(tmp_path):
+    shard_dir(tmp_path, 0, 2).mkdir()
+    with pytest.raises(ValueError, match="missing"):
+        find_shards(tmp_path)
+
+
+def test_shards_of_different_runs_are_not_merged(tmp_path):
+    for i, model in enumerate(["Benthiq:3b", "Benthiq:7b"]):
+        shard = shard_dir(tmp_path, i, 2)
+        shard.mkdir()
+        (shard / "prompt_journal.jsonl").write_text(json.dumps({"config": {"model": model}}) + "\n")
+    with pytest.raises(ValueError, match="different configs"):
+        merge_journals(find_shards(tmp_path), tmp_path / "prompt_journal.jsonl")
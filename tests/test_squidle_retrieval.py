@@ -0,0 +1,47 @@
+"""
+test_squidle_retrieval.py
+
+Exports annotation sets from fake_squidle.py, plain and gzip-encoded.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import asyncio
+import socket
+
+import pytest
+from aiohttp import web
+
+from fake_squidle import FakeSquidle, create_app, parse_args
+from squidle_retrieval import load_manifest, retrieve
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_export(folder, *fake_args):
+    config = parse_args(["--sets", "3", "--per-page", "2", "--rows", "500", "--ready-after", "0", *fake_args])
+    port = free_port()
+    runner = web.AppRunner(create_app(config))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        return await retrieve(f"http://127.0.0.1:{port}", folder=folder, rate=0, poll=(0.01, 0.01, 10))
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.parametrize("fake_args", [[], ["--gzip"]])
+def test_exports_are_downloaded_whole(tmp_path, fake_args):
+    exported, unchanged, skipped = asyncio.run(run_export(tmp_path, *fake_args))
+    assert (exported, unchanged, skipped) == (3, 0, {})
+    expected = FakeSquidle(parse_args(["--rows", "500"])).csv(2)
+    assert (tmp_path / "annotations_2.csv").read_bytes() == expected
+    assert load_manifest(tmp_path / "squidle_manifest.json")["2"]["bytes"] == len(expected)
+
+    # a rerun finds every set unchanged
+    assert asyncio.run(run_export(tmp_path, *fake_args)) == (0, 3, {})
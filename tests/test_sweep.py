@@ -0,0 +1,35 @@
+"""
+test_sweep.py
+
+Tests of the sweep helpers that decide which runs are scored.
+
+Author: Aidan Murray
+Date: 2026-10-18
+"""
+
+import pandas as pd
+
+from sweep import RUN_OUTPUTS, clear_outputs, pareto_front, read_modelfile
+
+
+def test_clear_outputs_removes_a_previous_run(tmp_path):
+    for name in RUN_OUTPUTS:
+        (tmp_path / name).write_text("stale")
+    (tmp_path / "Modelfile").write_text("FROM qwen2.5vl:3b")
+    clear_outputs(tmp_path)
+    assert not any((tmp_path / name).exists() for name in RUN_OUTPUTS)
+    assert (tmp_path / "Modelfile").exists()
+    # a fresh folder is fine too
+    clear_outputs(tmp_path / "missing")
+
+
+def test_pareto_front():
+    df = pd.DataFrame({"images_per_s": [1.0, 2.0, 2.0, 0.5], "f1": [0.9, 0.8, 0.7, 0.9]})
+    assert list(pareto_front(df)) == [True, True, False, False]
+
+
+def test_read_modelfile_without_one(tmp_path):
+    # inside the app container there is no ollama_container/Modelfile next to sweep.py
+    assert read_modelfile(None) == (None, {"temperature": 0})
+    (tmp_path / "Modelfile").write_text('FROM qwen2.5vl:3b\nPARAMETER temperature 0\nSYSTEM """Be brief."""\n')
+    assert read_modelfile(tmp_path / "Modelfile") == ("Be brief.", {"temperature": 0})